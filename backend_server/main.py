@@ -2,18 +2,23 @@ import sys
 
 sys.path.append("..")
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from typing import List
 from pydantic import BaseModel
 
+from database_connector.async_database_client import close_async_database_client
 from services.subscriber_service import (
     Subscriber,
-    SubscriberService,
+    AsyncSubscriberService,
     SubscriberExistsException,
+    get_subscriber_cache_stats,
 )
-from services.channel_service import Channel, ChannelService
+from services.channel_service import Channel, AsyncChannelService
+from services.metrics_service import METRICS_CONTENT_TYPE, get_metrics
 
 app = FastAPI()
+subscriber_service = AsyncSubscriberService()
+channel_service = AsyncChannelService()
 
 
 class SubscriberTheme(BaseModel):
@@ -25,17 +30,26 @@ class ChannelTheme(BaseModel):
     themes: List[str]
 
 
+@app.on_event("shutdown")
+async def close_database_clients():
+    await close_async_database_client()
+
+
 @app.get("/")
 async def root():
     return {"message": "connection to sift server successful!"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return Response(content=get_metrics(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+
 @app.get("/subscribers")
 async def get_subscribers():
-    subscriber_service = SubscriberService()
     try:
-        non_subscribers = subscriber_service.get_subscribers(is_subscribed=False)
-        subscribers = subscriber_service.get_subscribers(is_subscribed=True)
+        non_subscribers = await subscriber_service.get_subscribers(is_subscribed=False)
+        subscribers = await subscriber_service.get_subscribers(is_subscribed=True)
         return {"data": [*non_subscribers, *subscribers]}
     except SubscriberExistsException:
         raise HTTPException(
@@ -44,12 +58,16 @@ async def get_subscribers():
         )
 
 
+@app.get("/subscribers/cache")
+async def get_subscriber_cache():
+    return {"data": get_subscriber_cache_stats()}
+
+
 @app.post("/subscribers", status_code=201)
 async def add_new_subscriber(subscriber: Subscriber):
-    subscriber_service = SubscriberService()
     subscriber_id = subscriber.telegram_id
     try:
-        response = subscriber_service.add_subscriber(subscriber=subscriber)
+        response = await subscriber_service.add_subscriber(subscriber=subscriber)
         return {"message": f"New subscriber with id {response} created!"}
     except SubscriberExistsException:
         raise HTTPException(
@@ -60,38 +78,31 @@ async def add_new_subscriber(subscriber: Subscriber):
 
 @app.patch("/subscribers/{subscriber_id}/themes", status_code=204)
 async def update_subscriber_theme_keywords(subscriber_id: str, theme: SubscriberTheme):
-    subscriber_service = SubscriberService()
-
-    subscriber_service.update_subscriber_theme_keywords(
+    await subscriber_service.update_subscriber_theme_keywords(
         subscriber_id=subscriber_id, theme=theme.theme, new_keywords=theme.keywords
     )
 
 
 @app.post("/subscribers/{subscriber_id}/unsubscribe", status_code=204)
 async def unsubscribe(subscriber_id: str):
-    subscriber_service = SubscriberService()
-
-    if not subscriber_service.check_subscriber_exists(subscriber_id):
+    if not await subscriber_service.check_subscriber_exists(subscriber_id):
         raise HTTPException(status_code=404, detail=f"Subscriber not found")
 
-    subscriber_service.unsubscribe(subscriber_id=subscriber_id)
+    await subscriber_service.unsubscribe(subscriber_id=subscriber_id)
 
 
 @app.post("/subscribers/{subscriber_id}/subscribe", status_code=204)
 async def subscribe(subscriber_id: str):
-    subscriber_service = SubscriberService()
-
-    if not subscriber_service.check_subscriber_exists(subscriber_id):
+    if not await subscriber_service.check_subscriber_exists(subscriber_id):
         raise HTTPException(status_code=404, detail=f"Subscriber not found")
 
-    subscriber_service.subscribe(subscriber_id=subscriber_id)
+    await subscriber_service.subscribe(subscriber_id=subscriber_id)
 
 
 @app.get("/channels")
 async def get_channels():
-    channel_service = ChannelService()
     try:
-        response = channel_service.get_channels()
+        response = await channel_service.get_channels()
         return {"data": response}
     except SubscriberExistsException:
         raise HTTPException(
@@ -102,11 +113,10 @@ async def get_channels():
 
 @app.post("/channels", status_code=201)
 async def add_channel(channel: Channel):
-    channel_service = ChannelService()
     channel_id = channel.channel_id
 
     try:
-        response = channel_service.add_channel(channel=channel)
+        response = await channel_service.add_channel(channel=channel)
         return {"message": f"New channel with id {response} created!"}
     except SubscriberExistsException:
         raise HTTPException(
@@ -117,29 +127,23 @@ async def add_channel(channel: Channel):
 
 @app.post("/channels/{channel_id}/set-inactive", status_code=204)
 async def set_channel_inactive(channel_id: str):
-    channel_service = ChannelService()
-
-    if not channel_service.check_channel_exists(channel_id=channel_id):
+    if not await channel_service.check_channel_exists(channel_id=channel_id):
         raise HTTPException(status_code=404, detail=f"Channel not found")
 
-    channel_service.toggle_channel_activeness(channel_id=channel_id, is_active=False)
+    await channel_service.toggle_channel_activeness(channel_id=channel_id, is_active=False)
 
 
 @app.post("/channels/{channel_id}/set-active", status_code=204)
 async def set_channel_active(channel_id: str):
-    channel_service = ChannelService()
-
-    if not channel_service.check_channel_exists(channel_id=channel_id):
+    if not await channel_service.check_channel_exists(channel_id=channel_id):
         raise HTTPException(status_code=404, detail=f"Channel not found")
 
-    channel_service.toggle_channel_activeness(channel_id=channel_id, is_active=True)
+    await channel_service.toggle_channel_activeness(channel_id=channel_id, is_active=True)
 
 
 @app.patch("/channels/{channel_id}/themes", status_code=204)
 async def update_channel_themes(channel_id: str, themes: ChannelTheme):
-    channel_service = ChannelService()
-
-    if not channel_service.check_channel_exists(channel_id=channel_id):
+    if not await channel_service.check_channel_exists(channel_id=channel_id):
         raise HTTPException(status_code=404, detail=f"Channel not found")
 
-    channel_service.update_channel_themes(channel_id=channel_id, themes=themes.themes)
+    await channel_service.update_channel_themes(channel_id=channel_id, themes=themes.themes)
@@ -0,0 +1,91 @@
+"""
+Compares two benchmark results, e.g. of two commits.
+
+Usage, from the root folder:
+python -m benchmarks.compare baseline.json candidate.json --max-regression 0.1
+
+Exits with status 1 if the throughput of a stage dropped, or its p99 latency or round trips grew,
+by more than max-regression
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional, Tuple
+
+# (name, path in the stage results, True if higher is better)
+METRICS = [
+    ("throughput/s", ("throughput_per_second",), True),
+    ("duration s", ("duration_seconds",), False),
+    ("op p50 ms", ("operation_latency_ms", "p50"), False),
+    ("op p99 ms", ("operation_latency_ms", "p99"), False),
+    ("db round trips", ("database_round_trips", "total"), False),
+    ("db p99 ms", ("database_round_trips", "latency_ms", "p99"), False),
+    ("peak rss mb", ("peak_rss_mb",), False),
+]
+GATED_METRICS = {"throughput/s", "op p99 ms", "db round trips"}
+
+
+def get_metric(stage: dict, path: Tuple[str, ...]) -> Optional[float]:
+    value = stage
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+
+    return value
+
+
+def compare(baseline: dict, candidate: dict, max_regression: float) -> Tuple[List[str], List[str]]:
+    """returns the lines of the comparison table and the regressions beyond max_regression"""
+    lines = [f"{'stage':<12} {'metric':<15} {'baseline':>12} {'candidate':>12} {'change':>8}"]
+    regressions = []
+
+    for stage_name, candidate_stage in candidate["stages"].items():
+        baseline_stage = baseline["stages"].get(stage_name)
+        if baseline_stage is None:
+            continue
+
+        for metric_name, path, is_higher_better in METRICS:
+            baseline_value = get_metric(baseline_stage, path)
+            candidate_value = get_metric(candidate_stage, path)
+            if baseline_value is None or candidate_value is None:
+                continue
+
+            change = (candidate_value - baseline_value) / baseline_value if baseline_value != 0 else 0
+            lines.append(
+                f"{stage_name:<12} {metric_name:<15} {baseline_value:>12} {candidate_value:>12} {change:>+8.1%}"
+            )
+
+            regression = -change if is_higher_better else change
+            if metric_name in GATED_METRICS and regression > max_regression:
+                regressions.append(f"{stage_name} {metric_name}: {baseline_value} -> {candidate_value}")
+
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares two benchmark results")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--max-regression", type=float, default=0.1, help="allowed relative regression, 0.1 is 10%%")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    if baseline["parameters"] != candidate["parameters"] or baseline["env"] != candidate["env"]:
+        print("Warning: the results were produced with different parameters or environment", file=sys.stderr)
+
+    lines, regressions = compare(baseline, candidate, max_regression=args.max_regression)
+    print("\n".join(lines))
+
+    if len(regressions) > 0:
+        print("\nRegressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import random
+import string
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Iterator, List, Optional
+
+from pydantic import BaseModel
+
+THEMES = ["food", "travel", "deals", "tech", "events", "jobs", "fashion", "finance"]
+KEYWORD_RANKS = (50, 2_000)  # keywords are drawn from mid-frequency words, so that a fraction of messages match
+
+
+class SyntheticChannel(BaseModel):
+    channel_id: str
+    themes: List[str]
+    message_count: int
+
+
+class SyntheticSubscriber(BaseModel):
+    telegram_id: str
+    subscribed_themes: List[dict]
+
+
+class SyntheticMessage:
+    """the fields of a telethon message read by the download service"""
+
+    def __init__(self, id: int, text: str, date: datetime):
+        self.id = id
+        self.text = text
+        self.date = date
+
+
+class SyntheticCorpus:
+    """
+    Deterministic synthetic channels, messages and subscriber keywords.
+
+    Message words follow a Zipf distribution over a generated vocabulary, like natural language.
+    Messages are generated on demand from the seed, so corpora larger than the memory can be downloaded
+    """
+
+    def __init__(
+        self,
+        channels: int,
+        messages: int,
+        subscribers: int,
+        themes: int = 4,
+        vocabulary_size: int = 20_000,
+        seed: int = 0,
+        start_time: Optional[datetime] = None,
+    ):
+        self.seed = seed
+        self.themes = THEMES[: max(1, min(themes, len(THEMES)))]
+        self.start_time = start_time or datetime.now(timezone.utc) - timedelta(minutes=1)
+        self.subscriber_count = subscribers
+
+        random_generator = random.Random(seed)
+        self.vocabulary = sorted(
+            {
+                "".join(random_generator.choices(string.ascii_lowercase, k=random_generator.randint(3, 10)))
+                for _ in range(vocabulary_size)
+            }
+        )
+        random_generator.shuffle(self.vocabulary)  # the rank of a word is its position in the vocabulary
+        self.cumulative_weights = list(accumulate(1 / rank for rank in range(1, len(self.vocabulary) + 1)))
+
+        self.channels = []
+        for index in range(channels):
+            self.channels.append(
+                SyntheticChannel(
+                    channel_id=f"channel_{index}",
+                    themes=random_generator.sample(self.themes, k=random_generator.randint(1, 2)),
+                    message_count=messages // channels + (1 if index < messages % channels else 0),
+                )
+            )
+
+    def get_channel(self, channel_id: str) -> SyntheticChannel:
+        return self.channels[int(channel_id.rsplit("_", 1)[1])]
+
+    def get_message(self, channel_id: str, message_id: int) -> SyntheticMessage:
+        """messages of a channel have the ids 1 to message_count, later messages have larger ids"""
+        random_generator = random.Random(f"{self.seed}-{channel_id}-{message_id}")
+        words = random_generator.choices(
+            self.vocabulary, cum_weights=self.cumulative_weights, k=random_generator.randint(10, 40)
+        )
+        # spaced a millisecond apart, all messages are later than the start of the day
+        date = self.start_time + timedelta(milliseconds=message_id)
+        return SyntheticMessage(id=message_id, text=" ".join(words).capitalize() + ".", date=date)
+
+    def iter_messages(self, channel_id: str, first_id: int, last_id: int, reverse: bool) -> Iterator[SyntheticMessage]:
+        message_ids = range(first_id, last_id + 1)
+        for message_id in message_ids if reverse else reversed(message_ids):
+            yield self.get_message(channel_id, message_id)
+
+    def iter_subscribers(self) -> Iterator[SyntheticSubscriber]:
+        for index in range(self.subscriber_count):
+            random_generator = random.Random(f"{self.seed}-subscriber-{index}")
+            subscribed_themes = []
+            for theme in random_generator.sample(self.themes, k=random_generator.randint(1, min(3, len(self.themes)))):
+                keywords = []
+                for _ in range(random_generator.randint(1, 5)):
+                    words = random_generator.sample(self.vocabulary[KEYWORD_RANKS[0] : KEYWORD_RANKS[1]], k=2)
+                    keywords.append(" ".join(words[: random_generator.randint(1, 2)]))
+                subscribed_themes.append({"theme": theme, "keywords": keywords, "last_notified_timestamp": None})
+
+            yield SyntheticSubscriber(telegram_id=str(100_000_000 + index), subscribed_themes=subscribed_themes)
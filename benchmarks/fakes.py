@@ -0,0 +1,110 @@
+import asyncio
+import inspect
+import time
+from typing import Optional
+
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.metrics import StageRecorder
+
+
+class FakeTelegramClient:
+    """
+    Stands in for telethon.TelegramClient, serving the messages of a synthetic corpus.
+    Accepts the arguments of TelegramClient so that it can replace it before the download service is created
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.corpus: Optional[SyntheticCorpus] = None
+        self.recorder: Optional[StageRecorder] = None
+        self.latency_seconds = 0.0  # simulated latency of every request
+
+    def start(self):
+        # like telethon, start must be awaited when it is called inside a running event loop
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return self
+        return self.__start()
+
+    async def __start(self):
+        return self
+
+    def add_event_handler(self, callback, event=None):
+        pass
+
+    async def __request(self, method: str):
+        if self.recorder is not None:
+            self.recorder.count_request("telegram", method)
+        if self.latency_seconds > 0:
+            await asyncio.sleep(self.latency_seconds)
+
+    async def get_entity(self, channel_id: str):
+        await self.__request("get_entity")
+        return channel_id
+
+    async def iter_messages(self, channel: str, limit: Optional[int] = None, offset_id: int = 0, reverse: bool = False):
+        """
+        yields the messages of the channel later than offset_id when reverse, or the latest limit messages.
+        Like telethon, messages are requested in pages of 100
+        """
+        message_count = self.corpus.get_channel(channel).message_count
+        if reverse:
+            first_id, last_id = offset_id + 1, message_count
+        else:
+            first_id, last_id = max(1, message_count - (limit or message_count) + 1), message_count
+
+        for position, message in enumerate(self.corpus.iter_messages(channel, first_id, last_id, reverse=reverse)):
+            if position % 100 == 0:
+                await self.__request("get_history")
+            yield message
+
+
+class FakeBot:
+    """Stands in for telegram.Bot, accepting every message"""
+
+    def __init__(self, recorder: StageRecorder, latency_seconds: float = 0.0):
+        self.recorder = recorder
+        self.latency_seconds = latency_seconds
+
+    async def send_message(self, chat_id: str, text: str):
+        self.recorder.count_request("bot", "send_message")
+        if self.latency_seconds > 0:
+            await asyncio.sleep(self.latency_seconds)
+        # delivery latency, from the start of the stage
+        self.recorder.record_operation(time.perf_counter() - self.recorder.started_at)
+
+
+class CountingDatabaseClient:
+    """
+    Wraps a database client, counting and timing every call as one round trip of the current stage.
+    A read_stream is counted once, timed until it is consumed
+    """
+
+    def __init__(self, database_client, recorder: StageRecorder):
+        self.database_client = database_client
+        self.recorder = recorder
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.database_client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        if inspect.isgeneratorfunction(attribute):
+
+            def stream(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    yield from attribute(*args, **kwargs)
+                finally:
+                    self.recorder.record_round_trip(name, time.perf_counter() - start)
+
+            return stream
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                self.recorder.record_round_trip(name, time.perf_counter() - start)
+
+        return call
@@ -0,0 +1,97 @@
+import math
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource  # not available on windows
+except ImportError:
+    resource = None
+
+
+def get_percentile(values: List[float], percentile: float) -> Optional[float]:
+    """nearest-rank percentile, or None if there are no values"""
+    if len(values) == 0:
+        return None
+
+    sorted_values = sorted(values)
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def get_latency_summary(latencies_seconds: List[float]) -> dict:
+    def to_milliseconds(value: Optional[float]):
+        return None if value is None else round(value * 1_000, 3)
+
+    return {
+        "count": len(latencies_seconds),
+        "p50": to_milliseconds(get_percentile(latencies_seconds, 50)),
+        "p99": to_milliseconds(get_percentile(latencies_seconds, 99)),
+        "max": to_milliseconds(max(latencies_seconds, default=None)),
+    }
+
+
+def get_peak_rss_mb() -> Optional[float]:
+    """peak resident memory of the process so far. Linux reports kilobytes, macOS bytes"""
+    if resource is None:
+        return None
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak_rss / 1024, 1) if peak_rss < 1 << 32 else round(peak_rss / 1024 / 1024, 1)
+
+
+class StageRecorder:
+    """
+    Records the metrics of the current benchmark stage: database round trips with their latency,
+    requests to Telegram, and the latency of the stage's own operations
+    """
+
+    def __init__(self):
+        self.results: Dict[str, dict] = {}
+        self.__stage: Optional[str] = None
+        self.__reset()
+
+    def __reset(self):
+        self.started_at = time.perf_counter()
+        self.round_trips: Dict[str, int] = {}
+        self.round_trip_latencies: List[float] = []
+        self.requests: Dict[str, Dict[str, int]] = {}
+        self.operation_latencies: List[float] = []
+
+    def start(self, stage: str):
+        self.__stage = stage
+        self.__reset()
+
+    def record_round_trip(self, method: str, latency_seconds: float):
+        self.round_trips[method] = self.round_trips.get(method, 0) + 1
+        self.round_trip_latencies.append(latency_seconds)
+
+    def count_request(self, service: str, method: str):
+        service_requests = self.requests.setdefault(service, {})
+        service_requests[method] = service_requests.get(method, 0) + 1
+
+    def record_operation(self, latency_seconds: float):
+        self.operation_latencies.append(latency_seconds)
+
+    def finish(self, items: int, **extra) -> dict:
+        """
+        ends the current stage, items is the number of messages or notifications it processed.
+        Returns the results of the stage
+        """
+        duration_seconds = time.perf_counter() - self.started_at
+        result = {
+            "duration_seconds": round(duration_seconds, 3),
+            "items": items,
+            "throughput_per_second": round(items / duration_seconds, 1) if duration_seconds > 0 else None,
+            "operation_latency_ms": get_latency_summary(self.operation_latencies),
+            "database_round_trips": {
+                "total": sum(self.round_trips.values()),
+                "by_method": dict(sorted(self.round_trips.items())),
+                "latency_ms": get_latency_summary(self.round_trip_latencies),
+            },
+            "requests": self.requests,
+            "peak_rss_mb": get_peak_rss_mb(),
+            **extra,
+        }
+        self.results[self.__stage] = result
+        self.__stage = None
+        return result
@@ -0,0 +1,214 @@
+"""
+End-to-end benchmark of the ingest and notify pipeline on a synthetic corpus.
+
+Telegram is replaced by a fake telethon client and a fake bot, and the database by the SQLite backend
+in a temporary file, so the benchmark runs without any external service.
+
+Usage, from the root folder:
+python -m benchmarks.run --subscribers 1000 --messages 100000 --output results.json
+python -m benchmarks.run --env ENV_MATCH_MODE=percolator --env ENV_DEDUP_ENABLED=true
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from benchmarks.corpus import SyntheticCorpus
+from benchmarks.fakes import CountingDatabaseClient, FakeBot, FakeTelegramClient
+from benchmarks.metrics import StageRecorder
+
+SETUP_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "setup")
+# notification is not rate limited by default, the benchmark measures the pipeline and not Telegram's limits
+DEFAULT_ENV = {"ENV_DISPATCH_GLOBAL_RATE": "1000000", "ENV_DISPATCH_PER_CHAT_RATE": "1000000"}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks the ingest and notify pipeline on a synthetic corpus")
+    parser.add_argument("--subscribers", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--themes", type=int, default=4, help="number of themes of the corpus, at most 8")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=0, help="simulated latency of telethon requests")
+    parser.add_argument("--bot-latency-ms", type=float, default=0, help="simulated latency of bot requests")
+    parser.add_argument(
+        "--env", action="append", default=[], metavar="KEY=VALUE", help="environment variable of the services"
+    )
+    parser.add_argument("--database", help="SQLite database file. Defaults to a temporary file, deleted afterwards")
+    parser.add_argument("--output", help="file to write the JSON results to. Defaults to the standard output")
+    parser.add_argument("--verbose", action="store_true", help="shows the logs of the services")
+    return parser.parse_args(argv)
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def configure_environment(args: argparse.Namespace, database_path: str) -> dict:
+    """
+    sets the environment variables of the services, which are read when the services are imported.
+    Returns the variables that were set
+    """
+    env = {**DEFAULT_ENV, "ENV_DB_BACKEND": "sqlite", "ENV_SQLITE_PATH": database_path}
+    for variable in args.env:
+        key, _, value = variable.partition("=")
+        env[key] = value
+
+    os.environ.update(env)
+    return env
+
+
+async def run_benchmark(args: argparse.Namespace, recorder: StageRecorder):
+    # the services are imported once the environment is configured, with telethon replaced by the fake client
+    import telethon
+
+    telethon.TelegramClient = FakeTelegramClient
+
+    from database_connector import database_client
+    from database_connector.sqlite_database_client import SqliteDatabaseClient
+
+    database_client.shared_database_client = CountingDatabaseClient(SqliteDatabaseClient(), recorder)
+
+    import main as pipeline
+    from services import notification_service
+    from services.channel_service import ChannelService
+    from services.logging_service import LoggingService
+    from services.service_container import container
+    from services.subscription_service import MATCH_MODE_PERCOLATOR, SubscriptionService, env_match_mode
+
+    db = database_client.get_database_client()
+    with open(os.path.join(SETUP_FOLDER, "indices.json")) as file:
+        for index in json.load(file):
+            db.add_database_index(index)
+    with open(os.path.join(SETUP_FOLDER, "index_templates.json")) as file:
+        for index_template in json.load(file):
+            db.put_index_template(template_name=index_template["template_name"], template=index_template["template"])
+
+    corpus = SyntheticCorpus(
+        channels=args.channels, messages=args.messages, subscribers=args.subscribers, themes=args.themes, seed=args.seed
+    )
+    download_service = await container.get_download_service()
+    download_service.client.corpus = corpus
+    download_service.client.recorder = recorder
+    download_service.client.latency_seconds = args.telegram_latency_ms / 1_000
+
+    notification = notification_service.NotificationService(bot_boken="benchmark")
+    notification.bot = FakeBot(recorder=recorder, latency_seconds=args.bot_latency_ms / 1_000)
+    notification_service.shared_notification_service = notification
+
+    # seed: channels start at offset 0 so that all of their messages are downloaded
+    recorder.start("seed")
+    channel_documents = [
+        {
+            "id": channel.channel_id,
+            "name": channel.channel_id,
+            "is_active": True,
+            "offset_id": 0,
+            "themes": channel.themes,
+        }
+        for channel in corpus.channels
+    ]
+    db.bulk_create(index_name="channel", documents=channel_documents)
+    subscribers = []
+    for subscriber in corpus.iter_subscribers():
+        subscribers.append(
+            {
+                "id": subscriber.telegram_id,
+                "is_subscribed": True,
+                "subscribed_themes": subscriber.subscribed_themes,
+                "telegram_username": None,
+            }
+        )
+    db.bulk_create(index_name="subscriber", documents=subscribers)
+    if env_match_mode == MATCH_MODE_PERCOLATOR:
+        SubscriptionService().sync_subscribers(subscribers)
+    recorder.finish(items=len(subscribers))
+    del subscribers
+
+    recorder.start("ingest")
+    results = await download_service.download_messages_from_channels(channels=ChannelService().get_active_channels())
+    for result in results:
+        recorder.record_operation(result.duration_seconds)
+    recorder.finish(
+        items=sum(result.messages_downloaded for result in results),
+        failed_channels=sum(1 for result in results if result.status != "success"),
+    )
+
+    # operation latency of a notify cycle is the time from the start of the cycle to the delivery of each message
+    recorder.start("notify")
+    retry_themes = await pipeline.notify_subscribers()
+    recorder.finish(items=recorder.requests.get("bot", {}).get("send_message", 0), retry_themes=len(retry_themes))
+
+    # a second cycle without new messages, the cost of checking every subscriber
+    recorder.start("notify_idle")
+    await pipeline.notify_subscribers()
+    recorder.finish(items=recorder.requests.get("bot", {}).get("send_message", 0))
+
+    # the logs are written by a background thread, flushed while the standard output is still redirected
+    LoggingService().flush()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database_folder = None
+    database_path = args.database
+    if database_path is None:
+        database_folder = tempfile.mkdtemp(prefix="sift-benchmark-")
+        database_path = os.path.join(database_folder, "benchmark.db")
+
+    env = configure_environment(args, database_path)
+    recorder = StageRecorder()
+    started_at = time.perf_counter()
+
+    try:
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            asyncio.run(run_benchmark(args, recorder))
+    finally:
+        if database_folder is not None:
+            shutil.rmtree(database_folder, ignore_errors=True)
+
+    results = {
+        "commit": get_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "subscribers": args.subscribers,
+            "messages": args.messages,
+            "channels": args.channels,
+            "themes": args.themes,
+            "seed": args.seed,
+            "telegram_latency_ms": args.telegram_latency_ms,
+            "bot_latency_ms": args.bot_latency_ms,
+        },
+        "env": {key: value for key, value in env.items() if key != "ENV_SQLITE_PATH"},
+        "duration_seconds": round(time.perf_counter() - started_at, 3),
+        "stages": recorder.results,
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+        print(f"Benchmark results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+import time
+from typing import AsyncIterator, List, Optional, Union
+
+from opensearchpy import AsyncOpenSearch, AsyncTransport, NotFoundError
+
+from database_connector.database_backend import AsyncDatabaseBackend
+from database_connector.database_client import (
+    DB_BACKEND_SQLITE,
+    BulkResponse,
+    build_query_string,
+    clean_hits_response,
+    env_db_backend,
+    get_client_options,
+    get_database_client,
+    is_hits_response_truncated,
+    observe_request,
+)
+from services.logging_service import LoggingService
+
+LOGGING_MODULE = "ASYNC-DATABASE-CLIENT"
+
+
+class AsyncInstrumentedTransport(AsyncTransport):
+    """transport of the async opensearch client recording the duration and errors of every request"""
+
+    async def perform_request(self, method, url, headers=None, params=None, body=None):
+        start_time = time.perf_counter()
+        try:
+            response = await super().perform_request(method, url, headers=headers, params=params, body=body)
+        except Exception as error:
+            observe_request(method, url, time.perf_counter() - start_time, error)
+            raise
+
+        observe_request(method, url, time.perf_counter() - start_time)
+        return response
+
+
+class AsyncDatabaseClient(AsyncDatabaseBackend):
+    """
+    asyncio counterpart of DatabaseClient. Requests do not block the event loop,
+    so it is used by the api server and the telegram bot handlers
+    """
+
+    __MAX_QUERY_SIZE = 10_000  # OpenSearch max query size
+    __BULK_BATCH_SIZE = 500  # number of documents sent in a single bulk request
+    __MULTI_SEARCH_BATCH_SIZE = 50  # number of searches sent in a single multi search request
+    __STREAM_PAGE_SIZE = 1_000  # number of documents retrieved per page when streaming search results
+    __POINT_IN_TIME_KEEP_ALIVE = "1m"  # how long a point in time is kept between two pages
+
+    def __init__(self):
+        # the underlying aiohttp session is created on the first request, inside the running event loop
+        self.client = AsyncOpenSearch(**get_client_options(), transport_class=AsyncInstrumentedTransport)
+
+        self.logging_service = LoggingService()
+
+    async def close(self):
+        """closes the connections of the client"""
+        await self.client.close()
+
+    async def document_exist(self, index_name: str, document_id: str):
+        """
+        checks if a document with the document_id exist in the index.
+
+        Returns:
+        True if the document with the document_id exist, false otherwise
+        """
+        try:
+            return await self.client.exists(index=index_name, id=document_id)
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client document exists error: {error}", module=LOGGING_MODULE
+            )
+
+    async def get(self, index_name: str, document_id: str) -> Optional[dict]:
+        """
+        Retrieves a document by its document_id. Unlike a search, the latest version of the document is
+        returned even if the index has not been refreshed
+
+        Raises:
+        DatabaseException - when index name is invalid or an internal database error, so that an error
+        is not mistaken for a missing document
+
+        Returns:
+        the document with its id, or None if the document does not exist
+        """
+        try:
+            response = await self.client.get(index=index_name, id=document_id)
+            return {**response["_source"], "id": response["_id"]}
+        except NotFoundError:
+            return None
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client get error: {error}", module=LOGGING_MODULE)
+            raise
+
+    def build_query_string(self, query_string_list: List[str]):
+        """
+        Builds a simple query string for opensearch
+        """
+        return build_query_string(query_string_list)
+
+    async def read(self, index_name: str, query: dict):
+        """
+        Performs a search in the index based on the search query
+
+        Returns:
+        list of matching documents
+        """
+        try:
+            response = await self.client.search(
+                index=index_name,
+                body={"size": self.__MAX_QUERY_SIZE, "query": query},
+            )
+
+            return clean_hits_response(response)
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read error: {error}", module=LOGGING_MODULE)
+
+    async def read_stream(
+        self,
+        index_name: str,
+        query: dict,
+        page_size: Optional[int] = None,
+        source_fields: Optional[List[str]] = None,
+        sort: Optional[List[dict]] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Performs a search in the index and yields every matching document, page by page.
+        Same as DatabaseClient.read_stream, pages are retrieved with search_after on a point in time
+
+        Yields:
+        matching documents
+        """
+        page_size = page_size or self.__STREAM_PAGE_SIZE
+        sort = sort or [{"_id": "asc"}]
+        keep_alive = self.__POINT_IN_TIME_KEEP_ALIVE
+
+        try:
+            point_in_time = await self.client.create_point_in_time(index=index_name, keep_alive=keep_alive)
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read stream error: {error}", module=LOGGING_MODULE)
+            raise
+
+        point_in_time_id = point_in_time["pit_id"]
+        search_after = None
+
+        try:
+            while True:
+                body = {
+                    "size": page_size,
+                    "query": query,
+                    "pit": {"id": point_in_time_id, "keep_alive": keep_alive},
+                    "sort": sort,
+                }
+                if source_fields is not None:
+                    body["_source"] = source_fields
+                if search_after is not None:
+                    body["search_after"] = search_after
+
+                # the index is part of the point in time, it must not be given in the search
+                response = await self.client.search(body=body)
+                hits = response["hits"]["hits"]
+
+                for document in clean_hits_response(response):
+                    yield document
+
+                if len(hits) < page_size:
+                    return
+
+                search_after = hits[-1]["sort"]
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read stream error: {error}", module=LOGGING_MODULE)
+            raise
+        finally:
+            try:
+                await self.client.delete_point_in_time(body={"pit_id": [point_in_time_id]})
+            except Exception as error:
+                self.logging_service.log_error(
+                    message=f"Database client delete point in time error: {error}", module=LOGGING_MODULE
+                )
+
+    async def multi_read(
+        self, index_name: str, queries: List[dict], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """
+        Performs many searches in the index using multi search requests, batch_size searches per request
+
+        Returns:
+        for each query, in the same order, the list of matching documents. A failed search returns an empty list.
+        Searches matching more than the maximum query size are read again in full
+        """
+        result = []
+        batch_size = batch_size or self.__MULTI_SEARCH_BATCH_SIZE
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start : start + batch_size]
+            body = []
+            for query in batch:
+                body.append({"index": index_name})
+                body.append({"size": self.__MAX_QUERY_SIZE, "query": query})
+
+            try:
+                response = await self.client.msearch(body=body)
+            except Exception as error:
+                self.logging_service.log_error(
+                    message=f"Database client multi read error: {error}", module=LOGGING_MODULE
+                )
+                result.extend([] for _ in batch)
+                continue
+
+            for query, search_response in zip(batch, response["responses"]):
+                if "error" in search_response:
+                    self.logging_service.log_error(
+                        message=f"Database client multi read item error: {search_response['error']}",
+                        module=LOGGING_MODULE,
+                    )
+                    result.append([])
+                    continue
+
+                if is_hits_response_truncated(search_response):
+                    result.append(await self.__read_truncated_search(index_name=index_name, query=query))
+                    continue
+
+                result.append(clean_hits_response(search_response))
+
+        return result
+
+    async def __read_truncated_search(self, index_name: str, query: dict) -> List[dict]:
+        """
+        reads every result of a search of a multi search that matched more than the maximum query size,
+        in pages sorted by document id
+        """
+        self.logging_service.log_info(
+            message="Search of a multi search exceeded the maximum query size, reading all of its results",
+            module=LOGGING_MODULE,
+            fields={"index_name": index_name},
+        )
+        result = []
+        search_after = None
+        try:
+            while True:
+                body = {"size": self.__MAX_QUERY_SIZE, "query": query, "sort": [{"_id": "asc"}]}
+                if search_after is not None:
+                    body["search_after"] = search_after
+                response = await self.client.search(index=index_name, body=body)
+                hits = response["hits"]["hits"]
+                result.extend(clean_hits_response(response))
+
+                if len(hits) < self.__MAX_QUERY_SIZE:
+                    return result
+
+                search_after = hits[-1]["sort"]
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read error: {error}", module=LOGGING_MODULE)
+            return []
+
+    async def get_index_names(self, pattern: str) -> List[str]:
+        """
+        Returns the sorted names of the existing indices matching a wildcard pattern, e.g. "message-*"
+        """
+        try:
+            response = await self.client.indices.get(index=pattern, params={"allow_no_indices": "true"})
+            return sorted(response.keys())
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client get index names error: {error}", module=LOGGING_MODULE
+            )
+            raise
+
+    async def update(
+        self,
+        index_name: str,
+        document_id: str,
+        partial_doc: Optional[dict] = None,
+        script_doc: Optional[dict] = None,
+    ):
+        """Updates a existing document in the database
+
+        Returns:
+        False if the document does not exist
+        """
+        document_exists = await self.document_exist(index_name=index_name, document_id=document_id)
+
+        if not document_exists:
+            return False  # document does not exist, unable to perform update operation
+
+        try:
+            if partial_doc is not None:
+                await self.client.update(index=index_name, id=document_id, body={"doc": partial_doc})
+                return
+
+            if script_doc is not None:
+                await self.client.update(index=index_name, id=document_id, body={"script": script_doc})
+                return
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client update error: {error}", module=LOGGING_MODULE)
+
+    async def create(self, index_name: str, document: dict, document_id: Optional[str] = None):
+        """Creates a new document in an index in the database
+
+        Returns:
+        id of the newly created document, or None if the document is not created
+        """
+        try:
+            if document_id is None:
+                response = await self.client.index(
+                    index=index_name,
+                    body=document,
+                    refresh=True,  # force refresh of database shards for retrieval
+                )
+
+                return response["_id"]
+
+            # document_id is given, need to check if document with the document_id already exists
+            # if it exists, do not create the document
+            document_exists = await self.document_exist(index_name=index_name, document_id=document_id)
+            if document_exists:
+                return None
+
+            await self.client.create(index=index_name, body=document, refresh=True, id=document_id)
+
+            return document_id
+
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client create error: {error}", module=LOGGING_MODULE)
+
+    async def index_document(self, index_name: str, document: dict, document_id: str):
+        """Creates a document in an index, replacing the existing document with the same document_id
+
+        Returns:
+        id of the created or replaced document, or None if the operation failed
+        """
+        try:
+            await self.client.index(index=index_name, body=document, id=document_id, refresh=True)
+            return document_id
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client index error: {error}", module=LOGGING_MODULE)
+
+    async def delete_by_query(self, index_name: str, query: dict):
+        """Deletes all documents in an index matching the query
+
+        Returns:
+        number of deleted documents, or None if the operation failed
+        """
+        try:
+            response = await self.client.delete_by_query(index=index_name, body={"query": query}, refresh=True)
+            return response["deleted"]
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client delete by query error: {error}", module=LOGGING_MODULE
+            )
+
+    async def bulk_create(
+        self,
+        index_name: str,
+        documents: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> BulkResponse:
+        """Creates documents in an index in batches using the bulk API
+
+        Documents with an id that already exists in the index are not overwritten and are counted as conflicts.
+        Each document must have an "id" key, which is used as the document id and is not stored in the document
+
+        Returns:
+        BulkResponse with the number of created, conflicting and failed documents
+        """
+        result = BulkResponse()
+        batch_size = batch_size or self.__BULK_BATCH_SIZE
+
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start : start + batch_size]
+            actions = []
+            for document in batch:
+                source = {key: value for key, value in document.items() if key != "id"}
+                actions.append({"create": {"_index": index_name, "_id": document["id"]}})
+                actions.append(source)
+
+            try:
+                response = await self.client.bulk(body=actions, refresh=refresh)
+            except Exception as error:
+                result.errors += len(batch)
+                self.logging_service.log_error(
+                    message=f"Database client bulk create error: {error}", module=LOGGING_MODULE
+                )
+                continue
+
+            for item in response["items"]:
+                status = item["create"]["status"]
+                if status == 409:
+                    result.conflicts += 1
+                elif status >= 300:
+                    result.errors += 1
+                    self.logging_service.log_error(
+                        message=f"Database client bulk create item error: {item['create'].get('error')}",
+                        module=LOGGING_MODULE,
+                    )
+                else:
+                    result.created += 1
+
+        return result
+
+
+shared_async_database_client: Optional[AsyncDatabaseBackend] = None
+
+
+def get_async_database_client() -> AsyncDatabaseBackend:
+    """
+    returns the async database client shared by the whole process, created on first use.
+    Async services use this client by default so that its connection pool is reused across requests.
+
+    With ENV_DB_BACKEND=sqlite, the client is an AsyncSqliteDatabaseClient sharing the connection of
+    the sync client
+    """
+    global shared_async_database_client
+
+    if shared_async_database_client is None and env_db_backend == DB_BACKEND_SQLITE:
+        from database_connector.sqlite_database_client import AsyncSqliteDatabaseClient
+
+        shared_async_database_client = AsyncSqliteDatabaseClient(get_database_client())
+    elif shared_async_database_client is None:
+        shared_async_database_client = AsyncDatabaseClient()
+
+    return shared_async_database_client
+
+
+async def close_async_database_client():
+    """closes the shared async database client, if it was created"""
+    global shared_async_database_client
+
+    if shared_async_database_client is not None:
+        await shared_async_database_client.close()
+        shared_async_database_client = None
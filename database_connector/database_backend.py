@@ -0,0 +1,199 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, AsyncIterator, Iterator, List, Optional, Union
+
+if TYPE_CHECKING:
+    from database_connector.database_client import BulkResponse, BulkUpdateResponse, DatabaseIndex
+
+
+class DatabaseBackend(ABC):
+    """
+    operations of a database backend, implemented by DatabaseClient for OpenSearch and
+    SqliteDatabaseClient for ENV_DB_BACKEND=sqlite. Services only use these methods,
+    so that they run on either backend
+    """
+
+    @abstractmethod
+    def document_exist(self, index_name: str, document_id: str):
+        """checks if a document with the document_id exist in the index"""
+
+    @abstractmethod
+    def get(self, index_name: str, document_id: str) -> Optional[dict]:
+        """returns the document with the document_id, None if it does not exist"""
+
+    @abstractmethod
+    def build_query_string(self, query_string_list: List[str]):
+        """builds a query string query matching any of the query strings"""
+
+    @abstractmethod
+    def read(self, index_name: str, query: dict):
+        """returns the documents matching the query, up to the maximum query size"""
+
+    @abstractmethod
+    def read_stream(
+        self,
+        index_name: str,
+        query: dict,
+        page_size: Optional[int] = None,
+        source_fields: Optional[List[str]] = None,
+        sort: Optional[List[dict]] = None,
+    ) -> Iterator[dict]:
+        """yields every document matching the query, page by page"""
+
+    @abstractmethod
+    def multi_read(self, index_name: str, queries: List[dict], batch_size: Optional[int] = None) -> List[List[dict]]:
+        """returns the matching documents of each query, in the same order as the queries"""
+
+    @abstractmethod
+    def multi_read_template(
+        self, index_name: str, template_id: str, params_list: List[dict], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """returns the matching documents of the search template rendered with each params, in the same order"""
+
+    @abstractmethod
+    def percolate(self, index_name: str, documents: List[dict], field: str = "query") -> List[List[dict]]:
+        """returns the stored queries matching each document, in the same order as the documents"""
+
+    @abstractmethod
+    def update(
+        self,
+        index_name: str,
+        document_id: str,
+        partial_doc: Optional[dict] = None,
+        script_doc: Optional[dict] = None,
+    ) -> None:
+        """updates a document with a partial document or a script"""
+
+    @abstractmethod
+    def create(self, index_name: str, document: dict, document_id: Optional[str] = None):
+        """creates a document, returns its id"""
+
+    @abstractmethod
+    def index_document(self, index_name: str, document: dict, document_id: str):
+        """creates or replaces the document with the document_id"""
+
+    @abstractmethod
+    def delete_by_query(self, index_name: str, query: dict):
+        """deletes the documents matching the query"""
+
+    @abstractmethod
+    def bulk_create(
+        self,
+        index_name: str,
+        documents: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> "BulkResponse":
+        """creates many documents, documents with an existing id are skipped"""
+
+    @abstractmethod
+    def bulk_update(
+        self,
+        index_name: str,
+        updates: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> "BulkUpdateResponse":
+        """updates many existing documents, updates of documents that do not exist are reported as failures"""
+
+    @abstractmethod
+    def put_script(self, script_id: str, script: dict):
+        """stores a script or search template"""
+
+    @abstractmethod
+    def get_index_names(self, pattern: str) -> List[str]:
+        """returns the sorted names of the existing indices matching a wildcard pattern"""
+
+    @abstractmethod
+    def delete_index(self, index_name: str):
+        """deletes an index and its documents"""
+
+    @abstractmethod
+    def put_index_template(self, template_name: str, template: dict):
+        """creates or replaces an index template"""
+
+    @abstractmethod
+    def put_mapping(self, index_name: str, properties: dict):
+        """adds fields to the mapping of an index"""
+
+    @abstractmethod
+    def add_database_index(self, new_index: "DatabaseIndex"):
+        """creates an index if it does not exist"""
+
+
+class AsyncDatabaseBackend(ABC):
+    """
+    asyncio counterpart of DatabaseBackend, implemented by AsyncDatabaseClient and AsyncSqliteDatabaseClient
+    """
+
+    @abstractmethod
+    async def close(self):
+        """closes the connections of the client"""
+
+    @abstractmethod
+    async def document_exist(self, index_name: str, document_id: str):
+        """checks if a document with the document_id exist in the index"""
+
+    @abstractmethod
+    async def get(self, index_name: str, document_id: str) -> Optional[dict]:
+        """returns the document with the document_id, None if it does not exist"""
+
+    @abstractmethod
+    def build_query_string(self, query_string_list: List[str]):
+        """builds a query string query matching any of the query strings"""
+
+    @abstractmethod
+    async def read(self, index_name: str, query: dict):
+        """returns the documents matching the query, up to the maximum query size"""
+
+    @abstractmethod
+    def read_stream(
+        self,
+        index_name: str,
+        query: dict,
+        page_size: Optional[int] = None,
+        source_fields: Optional[List[str]] = None,
+        sort: Optional[List[dict]] = None,
+    ) -> AsyncIterator[dict]:
+        """yields every document matching the query, page by page"""
+
+    @abstractmethod
+    async def multi_read(
+        self, index_name: str, queries: List[dict], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """returns the matching documents of each query, in the same order as the queries"""
+
+    @abstractmethod
+    async def get_index_names(self, pattern: str) -> List[str]:
+        """returns the sorted names of the existing indices matching a wildcard pattern"""
+
+    @abstractmethod
+    async def update(
+        self,
+        index_name: str,
+        document_id: str,
+        partial_doc: Optional[dict] = None,
+        script_doc: Optional[dict] = None,
+    ):
+        """updates a document with a partial document or a script"""
+
+    @abstractmethod
+    async def create(self, index_name: str, document: dict, document_id: Optional[str] = None):
+        """creates a document, returns its id"""
+
+    @abstractmethod
+    async def index_document(self, index_name: str, document: dict, document_id: str):
+        """creates or replaces the document with the document_id"""
+
+    @abstractmethod
+    async def delete_by_query(self, index_name: str, query: dict):
+        """deletes the documents matching the query"""
+
+    @abstractmethod
+    async def bulk_create(
+        self,
+        index_name: str,
+        documents: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> "BulkResponse":
+        """creates many documents, documents with an existing id are skipped"""
@@ -1,18 +1,32 @@
 import os
-from typing import List, Optional
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
-import dotenv
-from opensearchpy import OpenSearch
+from opensearchpy import NotFoundError, OpenSearch, Transport
+from opensearchpy.exceptions import ConflictError
 from pydantic import BaseModel
 
+from database_connector.database_backend import DatabaseBackend
 from services.logging_service import LoggingService
+from services.metrics_service import database_request_duration_seconds, database_request_errors_total
+from utils.config import load_config
 
-dotenv.load_dotenv()
+load_config()
 env_host = os.getenv("ENV_OS_HOST") or ""
 env_port = os.getenv("ENV_OS_PORT") or 0
 env_username = os.getenv("ENV_OS_USERNAME") or ""
 env_password = os.getenv("ENV_OS_PASSWORD") or ""
+env_pool_maxsize = int(os.getenv("ENV_OS_POOL_MAXSIZE") or 10)  # connections kept open per host
+env_timeout_seconds = float(os.getenv("ENV_OS_TIMEOUT_SECONDS") or 30)
+env_max_retries = int(os.getenv("ENV_OS_MAX_RETRIES") or 3)
+env_keep_alive = (os.getenv("ENV_OS_KEEP_ALIVE") or "true").lower() == "true"
+DB_BACKEND_OPENSEARCH = "opensearch"
+DB_BACKEND_SQLITE = "sqlite"  # single file database for small installs, see sqlite_database_client
+env_db_backend = os.getenv("ENV_DB_BACKEND") or DB_BACKEND_OPENSEARCH
 LOGGING_MODULE = "DATABASE-CLIENT"
+PARTITION_DATE_PATTERN = re.compile(r"\d{4}\.\d{2}")
 
 
 class DatabaseIndex(BaseModel):
@@ -20,19 +34,129 @@ class DatabaseIndex(BaseModel):
     mapping: dict
 
 
-class DatabaseClient:
+class BulkResponse(BaseModel):
+    created: int = 0
+    conflicts: int = 0  # documents skipped because a document with the same id already exists
+    errors: int = 0
+
+
+class BulkUpdateResponse(BaseModel):
+    updated: int = 0
+    failures: Dict[str, str] = {}  # document id -> reason the update of the document failed
+
+
+def get_client_options() -> dict:
+    """connection options shared by the sync and async opensearch clients"""
+    return {
+        "hosts": [{"host": env_host, "port": env_port}],
+        "http_compress": True,  # enables gzip compression for request bodies
+        "http_auth": (env_username, env_password),
+        "use_ssl": True,
+        "verify_certs": False,
+        "ssl_assert_hostname": False,
+        "ssl_show_warn": False,
+        "maxsize": env_pool_maxsize,
+        "timeout": env_timeout_seconds,
+        "max_retries": env_max_retries,
+        "retry_on_timeout": True,
+        # reuse pooled connections across requests instead of a new TLS handshake per request
+        "headers": {"Connection": "keep-alive" if env_keep_alive else "close"},
+    }
+
+
+def get_request_labels(method: str, url: str) -> Tuple[str, str]:
+    """
+    Returns the operation and index metric labels of a request, e.g. ("POST _search", "message") for
+    POST /message/_search. Monthly partition names are reduced to their pattern to bound the number of labels
+    """
+    path_parts = [part for part in url.split("?", 1)[0].split("/") if part != ""]
+    endpoint = next((part for part in path_parts if part.startswith("_")), "index")
+    index_names = path_parts[0].split(",") if len(path_parts) > 0 and not path_parts[0].startswith("_") else []
+    index_names = sorted({PARTITION_DATE_PATTERN.sub("*", index_name) for index_name in index_names})
+
+    return f"{method} {endpoint}", ",".join(index_names)
+
+
+def observe_request(method: str, url: str, duration_seconds: float, error: Optional[Exception] = None):
+    """records the duration of a database request, and its error if it failed"""
+    operation, index = get_request_labels(method, url)
+    database_request_duration_seconds.labels(operation=operation, index=index).observe(duration_seconds)
+    # missing documents and create conflicts are expected outcomes, not failures
+    if error is not None and not isinstance(error, (NotFoundError, ConflictError)):
+        database_request_errors_total.labels(operation=operation, index=index, error=type(error).__name__).inc()
+
+
+class InstrumentedTransport(Transport):
+    """transport of the opensearch client recording the duration and errors of every request"""
+
+    def perform_request(self, method, url, headers=None, params=None, body=None):
+        start_time = time.perf_counter()
+        try:
+            response = super().perform_request(method, url, headers=headers, params=params, body=body)
+        except Exception as error:
+            observe_request(method, url, time.perf_counter() - start_time, error)
+            raise
+
+        observe_request(method, url, time.perf_counter() - start_time)
+        return response
+
+
+def clean_hits_response(opensearch_response):
+    """
+    The default opensearch response for search query wraps the result with hits.hits
+    and other verbose information such as _index and _score. This method takes in the
+    opensearch search response, removes the unnecessary keys and flattens the object
+    """
+    result = []
+    object_list = opensearch_response["hits"]["hits"]
+
+    for object in object_list:
+        temp = {**object["_source"], "id": object["_id"]}
+        result.append(temp)
+
+    return result
+
+
+def is_hits_response_truncated(opensearch_response) -> bool:
+    """
+    True if a search matched more documents than it returned, e.g. more than the maximum query size.
+    Above the default track_total_hits of 10,000, the total is a lower bound with the "gte" relation
+    """
+    hits = opensearch_response["hits"]
+    total = hits.get("total")
+    if total is None:
+        return False
+    if isinstance(total, int):
+        return total > len(hits["hits"])
+
+    return total["value"] > len(hits["hits"]) or total.get("relation") == "gte"
+
+
+def build_query_string(query_string_list: List[str]):
+    """
+    Builds a simple query string for opensearch.
+    Deprecated, keyword queries are compiled to structured queries by query_compiler.compile_keywords
+    """
+    temp = []
+    for query_string in query_string_list:
+        if query_string.find(" ") != -1:
+            transformed_query_string = query_string.replace(" ", " AND ")
+            temp.append(f"({transformed_query_string})")
+            continue
+        temp.append(query_string)
+
+    return (" OR ").join(temp)
+
+
+class DatabaseClient(DatabaseBackend):
     __MAX_QUERY_SIZE = 10_000  # OpenSearch max query size
+    __BULK_BATCH_SIZE = 500  # number of documents sent in a single bulk request
+    __MULTI_SEARCH_BATCH_SIZE = 50  # number of searches sent in a single multi search request
+    __STREAM_PAGE_SIZE = 1_000  # number of documents retrieved per page when streaming search results
+    __POINT_IN_TIME_KEEP_ALIVE = "1m"  # how long a point in time is kept between two pages
 
     def __init__(self):
-        self.client = OpenSearch(
-            hosts=[{"host": env_host, "port": env_port}],
-            http_compress=True,  # enables gzip compression for request bodies
-            http_auth=(env_username, env_password),
-            use_ssl=True,
-            verify_certs=False,
-            ssl_assert_hostname=False,
-            ssl_show_warn=False,
-        )
+        self.client = OpenSearch(**get_client_options(), transport_class=InstrumentedTransport)
 
         self.logging_service = LoggingService()
 
@@ -58,34 +182,32 @@ class DatabaseClient:
                 message=f"Database client document exists error: {error}", module=LOGGING_MODULE
             )
 
-    def __clean_hits_response(self, opensearch_response):
-        """
-        The default opensearch response for search query wraps the result with hits.hits
-        and other verbose information such as _index and _score. This method takes in the
-        opensearch search response, removes the unnecessary keys and flattens the object
+    def get(self, index_name: str, document_id: str) -> Optional[dict]:
         """
-        result = []
-        object_list = opensearch_response["hits"]["hits"]
+        Retrieves a document by its document_id. Unlike a search, the latest version of the document is
+        returned even if the index has not been refreshed
 
-        for object in object_list:
-            temp = {**object["_source"], "id": object["_id"]}
-            result.append(temp)
+        Raises:
+        DatabaseException - when index name is invalid or an internal database error, so that an error
+        is not mistaken for a missing document
 
-        return result
+        Returns:
+        the document with its id, or None if the document does not exist
+        """
+        try:
+            response = self.client.get(index=index_name, id=document_id)
+            return {**response["_source"], "id": response["_id"]}
+        except NotFoundError:
+            return None
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client get error: {error}", module=LOGGING_MODULE)
+            raise
 
     def build_query_string(self, query_string_list: List[str]):
         """
         Builds a simple query string for opensearch
         """
-        temp = []
-        for query_string in query_string_list:
-            if query_string.find(" ") != -1:
-                transformed_query_string = query_string.replace(" ", " AND ")
-                temp.append(f"({transformed_query_string})")
-                continue
-            temp.append(query_string)
-
-        return (" OR ").join(temp)
+        return build_query_string(query_string_list)
 
     def read(self, index_name: str, query: dict):
         """
@@ -108,10 +230,261 @@ class DatabaseClient:
                 body={"size": self.__MAX_QUERY_SIZE, "query": query},
             )
 
-            return self.__clean_hits_response(response)
+            return clean_hits_response(response)
         except Exception as error:
             self.logging_service.log_error(message=f"Database client read error: {error}", module=LOGGING_MODULE)
 
+    def read_stream(
+        self,
+        index_name: str,
+        query: dict,
+        page_size: Optional[int] = None,
+        source_fields: Optional[List[str]] = None,
+        sort: Optional[List[dict]] = None,
+    ) -> Iterator[dict]:
+        """
+        Performs a search in the index and yields every matching document, page by page.
+
+        Pages are retrieved with search_after on a point in time, so the results are not limited
+        to the maximum query size and do not change while they are being consumed
+
+        Parameters:
+        index_name - index of the database to perform the search on
+
+        query - internal database key value pairs to perform the search
+
+        page_size (optional) - number of documents retrieved per request
+
+        source_fields (optional) - fields of the documents to retrieve. Defaults to all fields
+
+        sort (optional) - sort order of the documents, must end with a unique field. Defaults to the document id
+
+        Raises:
+        DatabaseException - when index name is invalid, document is malformed or an internal database error
+
+        Yields:
+        matching documents
+        """
+        page_size = page_size or self.__STREAM_PAGE_SIZE
+        sort = sort or [{"_id": "asc"}]
+        keep_alive = self.__POINT_IN_TIME_KEEP_ALIVE
+
+        try:
+            point_in_time = self.client.create_point_in_time(index=index_name, keep_alive=keep_alive)
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read stream error: {error}", module=LOGGING_MODULE)
+            raise
+
+        point_in_time_id = point_in_time["pit_id"]
+        search_after = None
+
+        try:
+            while True:
+                body = {
+                    "size": page_size,
+                    "query": query,
+                    "pit": {"id": point_in_time_id, "keep_alive": keep_alive},
+                    "sort": sort,
+                }
+                if source_fields is not None:
+                    body["_source"] = source_fields
+                if search_after is not None:
+                    body["search_after"] = search_after
+
+                # the index is part of the point in time, it must not be given in the search
+                response = self.client.search(body=body)
+                hits = response["hits"]["hits"]
+
+                yield from clean_hits_response(response)
+
+                if len(hits) < page_size:
+                    return
+
+                search_after = hits[-1]["sort"]
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read stream error: {error}", module=LOGGING_MODULE)
+            raise
+        finally:
+            try:
+                self.client.delete_point_in_time(body={"pit_id": [point_in_time_id]})
+            except Exception as error:
+                self.logging_service.log_error(
+                    message=f"Database client delete point in time error: {error}", module=LOGGING_MODULE
+                )
+
+    def multi_read(self, index_name: str, queries: List[dict], batch_size: Optional[int] = None) -> List[List[dict]]:
+        """
+        Performs many searches in the index using multi search requests, batch_size searches per request
+
+        Parameters:
+        index_name - index of the database to perform the searches on
+
+        queries - internal database key value pairs of each search
+
+        batch_size (optional) - maximum number of searches per multi search request
+
+        Returns:
+        for each query, in the same order, the list of matching documents. A failed search returns an empty list.
+        Searches matching more than the maximum query size are read again in full with read_stream
+        """
+        result = []
+        batch_size = batch_size or self.__MULTI_SEARCH_BATCH_SIZE
+
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start : start + batch_size]
+            body = []
+            for query in batch:
+                body.append({"index": index_name})
+                body.append({"size": self.__MAX_QUERY_SIZE, "query": query})
+
+            for query, (documents, is_truncated) in zip(
+                batch, self.__send_multi_search(body=body, batch_size=len(batch))
+            ):
+                if is_truncated:
+                    documents = self.__read_truncated_search(index_name=index_name, query=query)
+                result.append(documents)
+
+        return result
+
+    def multi_read_template(
+        self, index_name: str, template_id: str, params_list: List[dict], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """
+        Performs many searches in the index from a stored search template, batch_size searches per request.
+        The template receives the maximum query size as the "size" param
+
+        Parameters:
+        index_name - index of the database to perform the searches on
+
+        template_id - id of the stored search template
+
+        params_list - template params of each search
+
+        batch_size (optional) - maximum number of searches per multi search request
+
+        Returns:
+        for each search, in the same order, the list of matching documents. A failed search returns an empty list.
+        Searches matching more than the maximum query size are rendered and read again in full with read_stream
+        """
+        result = []
+        batch_size = batch_size or self.__MULTI_SEARCH_BATCH_SIZE
+
+        for start in range(0, len(params_list), batch_size):
+            batch = params_list[start : start + batch_size]
+            body = []
+            for params in batch:
+                body.append({"index": index_name})
+                body.append({"id": template_id, "params": {**params, "size": self.__MAX_QUERY_SIZE}})
+
+            for params, (documents, is_truncated) in zip(
+                batch, self.__send_multi_search(body=body, batch_size=len(batch), is_template=True)
+            ):
+                if is_truncated:
+                    try:
+                        rendered_search = self.client.render_search_template(
+                            body={"id": template_id, "params": {**params, "size": self.__MAX_QUERY_SIZE}}
+                        )
+                        query = rendered_search["template_output"]["query"]
+                        documents = self.__read_truncated_search(index_name=index_name, query=query)
+                    except Exception as error:
+                        self.logging_service.log_error(
+                            message=f"Database client render search template error: {error}", module=LOGGING_MODULE
+                        )
+                        documents = []
+                result.append(documents)
+
+        return result
+
+    def __read_truncated_search(self, index_name: str, query: dict) -> List[dict]:
+        """reads every result of a search of a multi search that matched more than the maximum query size"""
+        self.logging_service.log_info(
+            message="Search of a multi search exceeded the maximum query size, streaming all of its results",
+            module=LOGGING_MODULE,
+            fields={"index_name": index_name},
+        )
+        try:
+            return list(self.read_stream(index_name=index_name, query=query))
+        except Exception:
+            return []
+
+    def __send_multi_search(
+        self, body: List[dict], batch_size: int, is_template: bool = False
+    ) -> List[Tuple[List[dict], bool]]:
+        """returns the documents of each search, and whether the search matched more documents than it returned"""
+        try:
+            if is_template:
+                response = self.client.msearch_template(body=body)
+            else:
+                response = self.client.msearch(body=body)
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client multi read error: {error}", module=LOGGING_MODULE)
+            return [([], False) for _ in range(batch_size)]
+
+        result = []
+        for search_response in response["responses"]:
+            if "error" in search_response:
+                self.logging_service.log_error(
+                    message=f"Database client multi read item error: {search_response['error']}",
+                    module=LOGGING_MODULE,
+                )
+                result.append(([], False))
+                continue
+
+            result.append((clean_hits_response(search_response), is_hits_response_truncated(search_response)))
+
+        return result
+
+    def percolate(self, index_name: str, documents: List[dict], field: str = "query") -> List[List[dict]]:
+        """
+        Finds the stored queries in a percolator index that match each of the documents
+
+        Parameters:
+        index_name - percolator index of the database storing the queries
+
+        documents - documents to match against the stored queries
+
+        field (optional) - percolator field of the index that stores the queries
+
+        Raises:
+        DatabaseException - when index name is invalid, document is malformed or an internal database error
+
+        Returns:
+        for each document, in the same order, the list of stored documents whose query matched it
+        """
+        result = [[] for _ in documents]
+        if len(documents) == 0:
+            return result
+
+        try:
+            # stored queries are read in pages, so that matches beyond the maximum query size are not cut off
+            search_after = None
+            while True:
+                body = {
+                    "size": self.__MAX_QUERY_SIZE,
+                    "_source": {"excludes": [field]},
+                    "query": {"percolate": {"field": field, "documents": documents}},
+                    "sort": [{"_id": "asc"}],
+                }
+                if search_after is not None:
+                    body["search_after"] = search_after
+                response = self.client.search(index=index_name, body=body)
+                hits = response["hits"]["hits"]
+
+                for hit in hits:
+                    stored_document = {**hit["_source"], "id": hit["_id"]}
+                    # slot is the position of the matched document in the documents list
+                    slots = hit.get("fields", {}).get("_percolator_document_slot", [0])
+                    for slot in slots:
+                        result[slot].append(stored_document)
+
+                if len(hits) < self.__MAX_QUERY_SIZE:
+                    return result
+
+                search_after = hits[-1]["sort"]
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client percolate error: {error}", module=LOGGING_MODULE)
+            raise
+
     def update(
         self,
         index_name: str,
@@ -197,6 +570,218 @@ class DatabaseClient:
         except Exception as error:
             self.logging_service.log_error(message=f"Database client create error: {error}", module=LOGGING_MODULE)
 
+    def index_document(self, index_name: str, document: dict, document_id: str):
+        """Creates a document in an index, replacing the existing document with the same document_id
+
+        Parameters:
+        index_name - index of the database to add the document
+
+        document - document to add in the index
+
+        document_id - id of the document to create or replace
+
+        Returns:
+        id of the created or replaced document, or None if the operation failed
+        """
+        try:
+            self.client.index(index=index_name, body=document, id=document_id, refresh=True)
+            return document_id
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client index error: {error}", module=LOGGING_MODULE)
+
+    def delete_by_query(self, index_name: str, query: dict):
+        """Deletes all documents in an index matching the query
+
+        Returns:
+        number of deleted documents, or None if the operation failed
+        """
+        try:
+            response = self.client.delete_by_query(index=index_name, body={"query": query}, refresh=True)
+            return response["deleted"]
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client delete by query error: {error}", module=LOGGING_MODULE
+            )
+
+    def bulk_create(
+        self,
+        index_name: str,
+        documents: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> BulkResponse:
+        """Creates documents in an index in batches using the bulk API
+
+        Documents with an id that already exists in the index are not overwritten and are counted as conflicts
+
+        Parameters:
+        index_name - index of the database to add the documents
+
+        documents - documents to add in the index. Each document must have an "id" key, which is used as
+        the document id and is not stored in the document
+
+        refresh (optional) - refresh policy applied once per batch. Defaults to False, which leaves it
+        to the index refresh interval
+
+        batch_size (optional) - maximum number of documents per bulk request
+
+        Returns:
+        BulkResponse with the number of created, conflicting and failed documents
+        """
+        result = BulkResponse()
+        batch_size = batch_size or self.__BULK_BATCH_SIZE
+
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start : start + batch_size]
+            actions = []
+            for document in batch:
+                source = {key: value for key, value in document.items() if key != "id"}
+                actions.append({"create": {"_index": index_name, "_id": document["id"]}})
+                actions.append(source)
+
+            try:
+                response = self.client.bulk(body=actions, refresh=refresh)
+            except Exception as error:
+                result.errors += len(batch)
+                self.logging_service.log_error(
+                    message=f"Database client bulk create error: {error}", module=LOGGING_MODULE
+                )
+                continue
+
+            for item in response["items"]:
+                status = item["create"]["status"]
+                if status == 409:
+                    result.conflicts += 1
+                elif status >= 300:
+                    result.errors += 1
+                    self.logging_service.log_error(
+                        message=f"Database client bulk create item error: {item['create'].get('error')}",
+                        module=LOGGING_MODULE,
+                    )
+                else:
+                    result.created += 1
+
+        return result
+
+    def bulk_update(
+        self,
+        index_name: str,
+        updates: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> BulkUpdateResponse:
+        """Updates existing documents of an index in batches using the bulk API
+
+        Unlike update, the existence of the documents is not checked beforehand.
+        Updates of documents that do not exist are reported as failures
+
+        Parameters:
+        index_name - index of the documents to update
+
+        updates - update of each document, with an "id" key for the document id and either a "doc" key
+        with the partial document or a "script" key with the script, e.g. a stored script {"id": ..., "params": ...}
+
+        refresh (optional) - refresh policy applied once per batch
+
+        batch_size (optional) - maximum number of updates per bulk request
+
+        Returns:
+        BulkUpdateResponse with the number of updated documents and the reason of every failed update
+        """
+        result = BulkUpdateResponse()
+        batch_size = batch_size or self.__BULK_BATCH_SIZE
+
+        for start in range(0, len(updates), batch_size):
+            batch = updates[start : start + batch_size]
+            actions = []
+            for update in batch:
+                actions.append({"update": {"_index": index_name, "_id": update["id"]}})
+                actions.append({key: value for key, value in update.items() if key != "id"})
+
+            try:
+                response = self.client.bulk(body=actions, refresh=refresh)
+            except Exception as error:
+                for update in batch:
+                    result.failures[update["id"]] = str(error)
+                self.logging_service.log_error(
+                    message=f"Database client bulk update error: {error}", module=LOGGING_MODULE
+                )
+                continue
+
+            for item in response["items"]:
+                if item["update"]["status"] >= 300:
+                    error = item["update"].get("error") or {}
+                    result.failures[item["update"]["_id"]] = error.get("reason") or str(error)
+                else:
+                    result.updated += 1
+
+        return result
+
+    def put_script(self, script_id: str, script: dict):
+        """
+        Stores a script in the cluster, compiled once and referenced by its script_id in updates
+
+        Parameters:
+        script_id - id of the stored script
+
+        script - the script, with its "lang" and "source"
+        """
+        try:
+            self.client.put_script(id=script_id, body={"script": script})
+            return True
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client put script error: {error}", module=LOGGING_MODULE)
+            return False
+
+    def get_index_names(self, pattern: str) -> List[str]:
+        """
+        Returns the sorted names of the existing indices matching a wildcard pattern, e.g. "message-*"
+        """
+        try:
+            response = self.client.indices.get(index=pattern, params={"allow_no_indices": "true"})
+            return sorted(response.keys())
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client get index names error: {error}", module=LOGGING_MODULE
+            )
+            raise
+
+    def delete_index(self, index_name: str):
+        """deletes an index with all of its documents"""
+        try:
+            self.client.indices.delete(index=index_name)
+            return True
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client delete index error: {error}", module=LOGGING_MODULE
+            )
+            return False
+
+    def put_index_template(self, template_name: str, template: dict):
+        """
+        Stores an index template, applied to new indices with a name matching its index patterns
+        """
+        try:
+            self.client.indices.put_index_template(name=template_name, body=template)
+            self.logging_service.log_info(message=f"Database index template stored: {template_name}")
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client put index template error: {error}", module=LOGGING_MODULE
+            )
+
+    def put_mapping(self, index_name: str, properties: dict):
+        """
+        Adds new fields to the mapping of an existing index, e.g. fields added to setup/indices.json
+        after the index was created. Existing fields cannot be changed
+        """
+        try:
+            self.client.indices.put_mapping(index=index_name, body={"properties": properties})
+            self.logging_service.log_info(message=f"Database index mapping updated: {index_name}")
+            return True
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client put mapping error: {error}", module=LOGGING_MODULE)
+            return False
+
     def add_database_index(self, new_index: DatabaseIndex):
         """adds a new index to the database"""
         try:
@@ -208,3 +793,27 @@ class DatabaseClient:
             self.logging_service.log_error(
                 message=f"Database client add database index error: {error}", module=LOGGING_MODULE
             )
+
+
+shared_database_client: Optional[DatabaseBackend] = None
+shared_database_client_lock = threading.Lock()
+
+
+def get_database_client() -> DatabaseBackend:
+    """
+    returns the database client shared by the whole process, created on first use.
+    Services use this client by default so that its connection pool is reused across requests.
+
+    With ENV_DB_BACKEND=sqlite, the client is a SqliteDatabaseClient implementing the same DatabaseBackend
+    """
+    global shared_database_client
+
+    with shared_database_client_lock:
+        if shared_database_client is None and env_db_backend == DB_BACKEND_SQLITE:
+            from database_connector.sqlite_database_client import SqliteDatabaseClient
+
+            shared_database_client = SqliteDatabaseClient()
+        elif shared_database_client is None:
+            shared_database_client = DatabaseClient()
+
+    return shared_database_client
@@ -0,0 +1,94 @@
+import os
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+from utils.config import load_config
+from utils.keyword_matcher import PHRASE_QUOTES
+
+load_config()
+env_use_search_template = (os.getenv("ENV_USE_SEARCH_TEMPLATE") or "false").lower() == "true"
+env_query_cache_size = int(os.getenv("ENV_QUERY_CACHE_SIZE") or 4096)
+MATCHED_MESSAGES_TEMPLATE_ID = "matched-messages"
+
+
+def normalize_keywords(keywords: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Normalises a keyword list so that lists with the same keywords share one compiled query:
+    whitespace is collapsed, keywords are lowercased, deduplicated and sorted
+    """
+    normalized_keywords = set()
+    for keyword in keywords:
+        keyword = " ".join(keyword.split()).lower()
+        if keyword.strip("".join(PHRASE_QUOTES)).strip() != "":
+            normalized_keywords.add(keyword)
+
+    return tuple(sorted(normalized_keywords))
+
+
+def compile_keyword(keyword: str, field: str) -> dict:
+    """
+    A keyword matches a message when all of its terms appear in the message, in any order.
+    A keyword in double quotes matches its terms as a phrase instead.
+
+    Keywords are given to match queries as plain text, so characters with a meaning in the
+    query string syntax, e.g. "-", "/" or ":", are analysed like any other text
+    """
+    if len(keyword) > 1 and keyword[0] in PHRASE_QUOTES and keyword[-1] in PHRASE_QUOTES:
+        return {"match_phrase": {field: keyword[1:-1].strip()}}
+
+    return {"match": {field: {"query": keyword.strip("".join(PHRASE_QUOTES)), "operator": "and"}}}
+
+
+@lru_cache(maxsize=env_query_cache_size)
+def compile_normalized_keywords(keywords: Tuple[str, ...], field: str) -> dict:
+    if len(keywords) == 0:
+        return {"match_none": {}}
+
+    return {
+        "bool": {
+            "should": [compile_keyword(keyword, field) for keyword in keywords],
+            "minimum_should_match": 1,
+        }
+    }
+
+
+def compile_keywords(keywords: Iterable[str], field: str = "text") -> dict:
+    """
+    Compiles a keyword list to a query matching messages with any of the keywords.
+    Compiled queries are cached by normalised keyword list and shared, they must not be modified
+
+    Parameters:
+    keywords - keywords of a theme, e.g. ["ice cream", "\\"1-for-1\\""]
+
+    field (optional) - text field the keywords are matched against. Defaults to the message text
+    """
+    return compile_normalized_keywords(normalize_keywords(keywords), field)
+
+
+def get_compiled_query_cache_stats() -> dict:
+    cache_info = compile_normalized_keywords.cache_info()
+    return {"hits": cache_info.hits, "misses": cache_info.misses, "size": cache_info.currsize}
+
+
+# stored search template of the matched messages search. Only the keyword clauses, theme, date clauses and size
+# are sent with each search, the rest of the query is stored in the cluster
+MATCHED_MESSAGES_TEMPLATE = {
+    "lang": "mustache",
+    "source": """{
+        "size": {{size}},
+        "query": {
+            "bool": {
+                "must": [
+                    {{#toJson}}keywords_query{{/toJson}},
+                    {"term": {"themes": {"value": "{{theme}}"}}}
+                ],
+                "filter": [{{#toJson}}date_query{{/toJson}}],
+                "must_not": [{"exists": {"field": "duplicate_of"}}]
+            }
+        }
+    }""",
+}
+
+
+def build_matched_messages_template_params(keywords: List[str], theme: str, date_query: dict) -> dict:
+    return {"keywords_query": compile_keywords(keywords), "theme": theme, "date_query": date_query}
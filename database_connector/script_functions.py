@@ -0,0 +1,16 @@
+from typing import Callable, Dict
+
+# painless source -> python function(document, params) updating the document in place
+script_functions: Dict[str, Callable[[dict, dict], None]] = {}
+
+
+def normalize_script_source(source: str) -> str:
+    return " ".join(source.split())
+
+
+def register_script_function(source: str, function: Callable[[dict, dict], None]):
+    """
+    Registers the python equivalent of a painless update script. SQLite cannot run painless,
+    so updates with this script source, inline or stored, run the function on the document instead
+    """
+    script_functions[normalize_script_source(source)] = function
@@ -0,0 +1,978 @@
+import asyncio
+import copy
+import itertools
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+from database_connector.database_backend import AsyncDatabaseBackend, DatabaseBackend
+from database_connector.database_client import BulkResponse, BulkUpdateResponse, DatabaseIndex, build_query_string
+from database_connector.script_functions import normalize_script_source, script_functions
+from services.logging_service import LoggingService
+from utils.config import load_config
+from utils.date_helper import parse_iso_datetime
+from utils.keyword_matcher import tokenize
+
+load_config()
+env_sqlite_path = os.getenv("ENV_SQLITE_PATH") or "sift.db"
+env_sqlite_busy_timeout_seconds = float(os.getenv("ENV_SQLITE_BUSY_TIMEOUT_SECONDS") or 10)
+LOGGING_MODULE = "SQLITE-DATABASE-CLIENT"
+FULL_TEXT_FIELD = "text"  # only this field is indexed for match and match_phrase queries
+PERCOLATE_INDEX = "_percolate"  # percolated documents are only stored inside a rolled back transaction
+TEMPLATE_VARIABLE_PATTERN = re.compile(r"{{#toJson}}\s*([\w.]+)\s*{{/toJson}}|{{\s*([\w.]+)\s*}}")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    seq INTEGER PRIMARY KEY,
+    index_name TEXT NOT NULL,
+    id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    UNIQUE (index_name, id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS document_text USING fts5(
+    text, tokenize = "unicode61 remove_diacritics 0 tokenchars '._'"
+);
+CREATE TABLE IF NOT EXISTS indices (name TEXT PRIMARY KEY, aliases TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS index_templates (name TEXT PRIMARY KEY, template TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS scripts (id TEXT PRIMARY KEY, script TEXT NOT NULL);
+"""
+
+
+class UnsupportedQueryException(Exception):
+    pass
+
+
+class UnsupportedScriptException(Exception):
+    pass
+
+
+def serialize_value(value: Any):
+    """serialises dates the same way as the opensearch client"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+
+    raise TypeError(f"Unable to serialize {value!r}")
+
+
+def to_json(document: Any) -> str:
+    return json.dumps(document, default=serialize_value, ensure_ascii=False)
+
+
+def get_full_text(document: dict) -> Optional[str]:
+    """
+    Returns the text of the document as its analysed terms, the same terms the standard analyzer of the
+    message index produces. The FTS5 tokenizer then only has to split the terms on spaces
+    """
+    text = document.get(FULL_TEXT_FIELD)
+    if not isinstance(text, str):
+        return None
+
+    return " ".join(tokenize(text))
+
+
+def get_json_path(field: str) -> str:
+    return "$." + ".".join(f'"{part}"' for part in field.split("."))
+
+
+def get_epoch(value: Optional[str]) -> Optional[float]:
+    """SQL function comparing dates by their instant, whatever their format or UTC offset"""
+    if not isinstance(value, str):
+        return None
+
+    try:
+        return parse_iso_datetime(value).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_single_field_clause(clause_type: str, clause: dict) -> Tuple[str, Any]:
+    if len(clause) != 1:
+        raise UnsupportedQueryException(f"{clause_type} query must have exactly one field: {clause}")
+
+    return next(iter(clause.items()))
+
+
+def build_text_match_expression(text: str, operator: str, is_phrase: bool) -> Optional[str]:
+    """builds the FTS5 MATCH expression of a match or match_phrase query, or None if the text has no terms"""
+    terms = tokenize(text)
+    if len(terms) == 0:
+        return None
+
+    if is_phrase:
+        return '"' + " ".join(terms) + '"'
+
+    return f" {operator.upper()} ".join(f'"{term}"' for term in terms)
+
+
+def translate_bool_query(clause: dict) -> Tuple[str, list]:
+    conditions = []
+    params = []
+
+    def to_list(clauses):
+        return clauses if isinstance(clauses, list) else [clauses]
+
+    for occurrence in ("must", "filter"):
+        for sub_query in to_list(clause.get(occurrence, [])):
+            sql, sub_params = translate_query(sub_query)
+            conditions.append(sql)
+            params.extend(sub_params)
+
+    should = to_list(clause.get("should", []))
+    if len(should) > 0:
+        minimum_should_match = clause.get("minimum_should_match", 0 if len(conditions) > 0 else 1)
+        minimum_should_match = int(minimum_should_match)
+        if minimum_should_match > 0:
+            should_conditions = []
+            for sub_query in should:
+                sql, sub_params = translate_query(sub_query)
+                should_conditions.append(f"({sql})")
+                params.extend(sub_params)
+            conditions.append(f"({' + '.join(should_conditions)}) >= {minimum_should_match}")
+
+    for sub_query in to_list(clause.get("must_not", [])):
+        sql, sub_params = translate_query(sub_query)
+        conditions.append(f"NOT ({sql})")
+        params.extend(sub_params)
+
+    if len(conditions) == 0:
+        return "1", []
+
+    return " AND ".join(f"({condition})" for condition in conditions), params
+
+
+def translate_query(query: dict) -> Tuple[str, list]:
+    """
+    Translates the subset of the OpenSearch query DSL used by the services to an SQL condition on the documents
+    table, with its parameters. Every condition evaluates to 0 or 1, never NULL, so that they can be negated
+
+    Supported queries: match_all, match_none, ids, term, terms, range, exists, match, match_phrase and bool
+
+    Raises:
+    UnsupportedQueryException - when the query uses other query types
+    """
+    if not isinstance(query, dict) or len(query) != 1:
+        raise UnsupportedQueryException(f"Query must have exactly one query type: {query}")
+
+    query_type, clause = next(iter(query.items()))
+
+    if query_type == "match_all":
+        return "1", []
+
+    if query_type == "match_none":
+        return "0", []
+
+    if query_type == "bool":
+        return translate_bool_query(clause)
+
+    if query_type == "ids":
+        values = [str(value) for value in clause["values"]]
+        if len(values) == 0:
+            return "0", []
+        return f"documents.id IN ({', '.join('?' for _ in values)})", values
+
+    if query_type == "exists":
+        path = get_json_path(clause["field"])
+        return (
+            "COALESCE(json_type(documents.source, ?), 'null') != 'null'"
+            " AND (json_type(documents.source, ?) != 'array' OR json_array_length(documents.source, ?) > 0)",
+            [path, path, path],
+        )
+
+    if query_type in ("term", "terms"):
+        field, value = parse_single_field_clause(query_type, clause)
+        values = value if query_type == "terms" else [value["value"] if isinstance(value, dict) else value]
+        if len(values) == 0:
+            return "0", []
+        if field == "_id":
+            return f"documents.id IN ({', '.join('?' for _ in values)})", [str(value) for value in values]
+        # json_each yields the items of an array field, or the value itself for a single value field
+        return (
+            f"EXISTS (SELECT 1 FROM json_each(documents.source, ?) WHERE value IN ({', '.join('?' for _ in values)}))",
+            [get_json_path(field), *values],
+        )
+
+    if query_type == "range":
+        field, bounds = parse_single_field_clause(query_type, clause)
+        operators = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+        conditions = []
+        params = []
+        for bound, value in bounds.items():
+            if bound not in operators:
+                raise UnsupportedQueryException(f"Unsupported range parameter: {bound}")
+            epoch = get_epoch(value)
+            if epoch is not None:
+                conditions.append(f"COALESCE(get_epoch(json_extract(documents.source, ?)) {operators[bound]} ?, 0)")
+                params.extend([get_json_path(field), epoch])
+            else:
+                conditions.append(f"COALESCE(json_extract(documents.source, ?) {operators[bound]} ?, 0)")
+                params.extend([get_json_path(field), value])
+        return " AND ".join(conditions) or "1", params
+
+    if query_type in ("match", "match_phrase"):
+        field, value = parse_single_field_clause(query_type, clause)
+        text = value["query"] if isinstance(value, dict) else value
+        if field == "_id":
+            return "documents.id = ?", [str(text)]
+        if field != FULL_TEXT_FIELD:
+            # the other fields of the indices are keywords, a match on a keyword is an exact match
+            return translate_query({"term": {field: text}})
+
+        operator = value.get("operator", "or") if isinstance(value, dict) else "or"
+        expression = build_text_match_expression(text, operator=operator, is_phrase=query_type == "match_phrase")
+        if expression is None:
+            return "0", []
+        return "documents.seq IN (SELECT rowid FROM document_text WHERE document_text MATCH ?)", [expression]
+
+    raise UnsupportedQueryException(f"Unsupported query type: {query_type}")
+
+
+@lru_cache(maxsize=4096)
+def translate_stored_query(query_json: str) -> Tuple[str, Tuple]:
+    """translates a stored percolator query, cached since the same queries are percolated on every ingest"""
+    sql, params = translate_query(json.loads(query_json))
+    return sql, tuple(params)
+
+
+def render_search_template(source: str, params: dict) -> dict:
+    """
+    Renders the subset of mustache used by the stored search templates:
+    {{name}} variables and {{#toJson}}name{{/toJson}} sections
+    """
+
+    def render_variable(match: re.Match) -> str:
+        if match.group(1) is not None:
+            return to_json(params[match.group(1)])
+
+        value = params[match.group(2)]
+        # variables are written inside JSON strings, or as JSON numbers
+        return to_json(value)[1:-1] if isinstance(value, str) else to_json(value)
+
+    return json.loads(TEMPLATE_VARIABLE_PATTERN.sub(render_variable, source))
+
+
+def merge_partial_document(document: dict, partial_doc: dict):
+    """merges a partial document into the document, objects are merged recursively like an OpenSearch update"""
+    for key, value in partial_doc.items():
+        if isinstance(value, dict) and isinstance(document.get(key), dict):
+            merge_partial_document(document[key], value)
+        else:
+            document[key] = copy.deepcopy(value)
+
+
+class SqliteDatabaseClient(DatabaseBackend):
+    """
+    Drop-in replacement of DatabaseClient storing the indices in a single SQLite file, for small installs
+    that do not need an OpenSearch cluster. Selected with ENV_DB_BACKEND=sqlite.
+
+    Documents are stored as JSON, with the text field of every document indexed in an FTS5 table.
+    Queries are translated to SQL with translate_query, painless scripts are replaced by the python functions
+    registered with register_script_function.
+
+    The database runs in WAL mode, so that the api server, bot and background service processes
+    can read while one of them writes. Writes of many documents are batched in one transaction
+    """
+
+    __MAX_QUERY_SIZE = 10_000  # same maximum query size as OpenSearch
+    __BULK_BATCH_SIZE = 500  # number of documents written in a single transaction
+    __STREAM_PAGE_SIZE = 1_000  # number of documents retrieved per page when streaming search results
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or env_sqlite_path
+        # autocommit mode, transactions are explicit. Statements are prepared once and cached by the connection
+        self.connection = sqlite3.connect(
+            self.path,
+            timeout=env_sqlite_busy_timeout_seconds,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.create_function("get_epoch", 1, get_epoch, deterministic=True)
+        self.connection.executescript(SCHEMA)
+        # the connection is shared by the threads of the process, one statement at a time
+        self.__lock = threading.RLock()
+
+        self.logging_service = LoggingService()
+
+    def close(self):
+        with self.__lock:
+            self.connection.close()
+
+    @contextmanager
+    def __transaction(self):
+        with self.__lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def __get_indices(self) -> Dict[str, List[str]]:
+        """returns the aliases of every index"""
+        rows = self.connection.execute("SELECT name, aliases FROM indices").fetchall()
+        return {name: json.loads(aliases) for name, aliases in rows}
+
+    def __resolve_index_names(self, index_name: str) -> List[str]:
+        """resolves comma separated index names, aliases and wildcard patterns to the names of the indices"""
+        indices = self.__get_indices()
+        result = []
+        for expression in index_name.split(","):
+            expression = expression.strip()
+            if "*" in expression or "?" in expression:
+                result.extend(name for name in indices if fnmatchcase(name, expression))
+                continue
+
+            aliased_names = [name for name, aliases in indices.items() if expression in aliases]
+            result.extend(aliased_names if len(aliased_names) > 0 else [expression])
+
+        return list(dict.fromkeys(result))
+
+    def __resolve_write_index(self, index_name: str) -> str:
+        """
+        Resolves the index documents are written to, creating the index if it does not exist.
+        Like OpenSearch, a new index gets the aliases of the index templates matching its name
+        """
+        indices = self.__get_indices()
+        if index_name in indices:
+            return index_name
+
+        aliased_names = [name for name, aliases in indices.items() if index_name in aliases]
+        if len(aliased_names) == 1:
+            return aliased_names[0]
+        if len(aliased_names) > 1:
+            raise ValueError(f"Alias {index_name} has more than one index, unable to write to it")
+
+        aliases = []
+        for (template,) in self.connection.execute("SELECT template FROM index_templates"):
+            template = json.loads(template)
+            if any(fnmatchcase(index_name, pattern) for pattern in template.get("index_patterns", [])):
+                aliases.extend(template.get("template", {}).get("aliases", {}).keys())
+        self.connection.execute(
+            "INSERT OR IGNORE INTO indices (name, aliases) VALUES (?, ?)", (index_name, json.dumps(aliases))
+        )
+        return index_name
+
+    def __write_full_text(self, seq: int, document: dict):
+        self.connection.execute("DELETE FROM document_text WHERE rowid = ?", (seq,))
+        full_text = get_full_text(document)
+        if full_text is not None:
+            self.connection.execute("INSERT INTO document_text (rowid, text) VALUES (?, ?)", (seq, full_text))
+
+    def __insert_document(self, index_name: str, document_id: str, document: dict, is_replaced: bool) -> bool:
+        """inserts a document, replacing the document with the same id if is_replaced. Returns False on conflicts"""
+        conflict_clause = "DO UPDATE SET source = excluded.source" if is_replaced else "DO NOTHING"
+        row = self.connection.execute(
+            "INSERT INTO documents (index_name, id, source) VALUES (?, ?, ?) "
+            f"ON CONFLICT (index_name, id) {conflict_clause} RETURNING seq",
+            (index_name, document_id, to_json(document)),
+        ).fetchone()
+        if row is None:
+            return False
+
+        self.__write_full_text(row[0], document)
+        return True
+
+    def __get_document(self, index_names: List[str], document_id: str) -> Optional[Tuple[int, str, dict]]:
+        row = self.connection.execute(
+            f"SELECT seq, index_name, source FROM documents WHERE id = ? "
+            f"AND index_name IN ({', '.join('?' for _ in index_names)}) LIMIT 1",
+            (document_id, *index_names),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return row[0], row[1], json.loads(row[2])
+
+    def __search(
+        self,
+        index_name: str,
+        query: dict,
+        size: Optional[int] = None,
+        offset: int = 0,
+        sort: Optional[List[dict]] = None,
+    ) -> List[dict]:
+        index_names = self.__resolve_index_names(index_name)
+        if len(index_names) == 0:
+            return []
+
+        condition, params = translate_query(query)
+        order_by, order_params = self.__translate_sort(sort)
+        rows = self.connection.execute(
+            f"SELECT id, source FROM documents WHERE index_name IN ({', '.join('?' for _ in index_names)}) "
+            f"AND ({condition}) ORDER BY {order_by} LIMIT ? OFFSET ?",
+            (*index_names, *params, *order_params, size or self.__MAX_QUERY_SIZE, offset),
+        ).fetchall()
+
+        return [{**json.loads(source), "id": document_id} for document_id, source in rows]
+
+    def __translate_sort(self, sort: Optional[List[dict]]) -> Tuple[str, list]:
+        if sort is None:
+            return "documents.seq", []
+
+        terms = []
+        params = []
+        for sort_field in sort:
+            field, order = next(iter(sort_field.items()))
+            order = order.get("order", "asc") if isinstance(order, dict) else order
+            direction = "DESC" if order == "desc" else "ASC"
+            if field == "_id":
+                terms.append(f"documents.id {direction}")
+            else:
+                terms.append(f"json_extract(documents.source, ?) {direction}")
+                params.append(get_json_path(field))
+
+        return ", ".join(terms), params
+
+    def __run_script(self, document: dict, script: dict):
+        if "id" in script:
+            row = self.connection.execute("SELECT script FROM scripts WHERE id = ?", (script["id"],)).fetchone()
+            if row is None:
+                raise UnsupportedScriptException(f"Stored script does not exist: {script['id']}")
+            source = json.loads(row[0])["source"]
+        else:
+            source = script["source"]
+
+        function = script_functions.get(normalize_script_source(source))
+        if function is None:
+            raise UnsupportedScriptException(f"No python function is registered for the script: {source}")
+
+        function(document, script.get("params", {}))
+
+    def __update_document(self, index_names: List[str], document_id: str, update: dict) -> Optional[str]:
+        """
+        applies an update with a "doc" or "script" key to a document, returns the reason if the update failed
+        """
+        stored_document = self.__get_document(index_names, document_id)
+        if stored_document is None:
+            return f"[{document_id}]: document missing"
+
+        seq, _, document = stored_document
+        if update.get("doc") is not None:
+            merge_partial_document(document, update["doc"])
+        elif update.get("script") is not None:
+            self.__run_script(document, update["script"])
+
+        self.connection.execute("UPDATE documents SET source = ? WHERE seq = ?", (to_json(document), seq))
+        self.__write_full_text(seq, document)
+        return None
+
+    def document_exist(self, index_name: str, document_id: str):
+        """
+        checks if a document with the document_id exist in the index.
+
+        Returns:
+        True if the document with the document_id exist, false otherwise
+        """
+        try:
+            with self.__lock:
+                return self.__get_document(self.__resolve_index_names(index_name), str(document_id)) is not None
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client document exists error: {error}", module=LOGGING_MODULE
+            )
+
+    def get(self, index_name: str, document_id: str) -> Optional[dict]:
+        """
+        Retrieves a document by its document_id
+
+        Raises:
+        DatabaseException - when index name is invalid or an internal database error, so that an error
+        is not mistaken for a missing document
+
+        Returns:
+        the document with its id, or None if the document does not exist
+        """
+        try:
+            with self.__lock:
+                stored_document = self.__get_document(self.__resolve_index_names(index_name), str(document_id))
+            if stored_document is None:
+                return None
+            return {**stored_document[2], "id": str(document_id)}
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client get error: {error}", module=LOGGING_MODULE)
+            raise
+
+    def build_query_string(self, query_string_list: List[str]):
+        return build_query_string(query_string_list)
+
+    def read(self, index_name: str, query: dict):
+        """
+        Performs a search in the index based on the search query
+
+        Returns:
+        list of matching documents
+        """
+        try:
+            with self.__lock:
+                return self.__search(index_name=index_name, query=query)
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read error: {error}", module=LOGGING_MODULE)
+
+    def read_stream(
+        self,
+        index_name: str,
+        query: dict,
+        page_size: Optional[int] = None,
+        source_fields: Optional[List[str]] = None,
+        sort: Optional[List[dict]] = None,
+    ) -> Iterator[dict]:
+        """
+        Performs a search in the index and yields every matching document, page by page.
+        Unlike DatabaseClient, pages are not read from a point in time, documents written while the
+        results are consumed may be skipped or repeated
+
+        Yields:
+        matching documents
+        """
+        page_size = page_size or self.__STREAM_PAGE_SIZE
+        sort = sort or [{"_id": "asc"}]
+        offset = 0
+
+        try:
+            while True:
+                with self.__lock:
+                    page = self.__search(index_name=index_name, query=query, size=page_size, offset=offset, sort=sort)
+
+                for document in page:
+                    if source_fields is not None:
+                        document = {
+                            key: value for key, value in document.items() if key in source_fields or key == "id"
+                        }
+                    yield document
+
+                if len(page) < page_size:
+                    return
+
+                offset += page_size
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client read stream error: {error}", module=LOGGING_MODULE)
+            raise
+
+    def multi_read(self, index_name: str, queries: List[dict], batch_size: Optional[int] = None) -> List[List[dict]]:
+        """
+        Performs many searches in the index. There are no requests to batch, batch_size is ignored
+
+        Returns:
+        for each query, in the same order, the list of matching documents. A failed search returns an empty list
+        """
+        result = []
+        for query in queries:
+            try:
+                with self.__lock:
+                    # searches are not limited to the maximum query size, like the paged searches of opensearch
+                    result.append(self.__search(index_name=index_name, query=query, size=-1))
+            except Exception as error:
+                self.logging_service.log_error(
+                    message=f"Database client multi read item error: {error}", module=LOGGING_MODULE
+                )
+                result.append([])
+
+        return result
+
+    def multi_read_template(
+        self, index_name: str, template_id: str, params_list: List[dict], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """
+        Performs many searches in the index from a stored search template
+
+        Returns:
+        for each search, in the same order, the list of matching documents. A failed search returns an empty list
+        """
+        result = []
+        for params in params_list:
+            try:
+                with self.__lock:
+                    row = self.connection.execute("SELECT script FROM scripts WHERE id = ?", (template_id,)).fetchone()
+                    if row is None:
+                        raise UnsupportedScriptException(f"Stored search template does not exist: {template_id}")
+                    body = render_search_template(
+                        json.loads(row[0])["source"], {**params, "size": self.__MAX_QUERY_SIZE}
+                    )
+                    result.append(self.__search(index_name=index_name, query=body["query"], size=-1))
+            except Exception as error:
+                self.logging_service.log_error(
+                    message=f"Database client multi read item error: {error}", module=LOGGING_MODULE
+                )
+                result.append([])
+
+        return result
+
+    def percolate(self, index_name: str, documents: List[dict], field: str = "query") -> List[List[dict]]:
+        """
+        Finds the stored queries in a percolator index that match each of the documents.
+
+        The documents are written to a temporary index and every stored query is run against them,
+        in a transaction that is rolled back
+
+        Returns:
+        for each document, in the same order, the list of stored documents whose query matched it
+        """
+        result = [[] for _ in documents]
+        if len(documents) == 0:
+            return result
+
+        try:
+            with self.__lock:
+                index_names = self.__resolve_index_names(index_name)
+                stored_documents = self.connection.execute(
+                    f"SELECT id, source FROM documents WHERE index_name IN ({', '.join('?' for _ in index_names)})",
+                    index_names,
+                ).fetchall()
+
+                self.connection.execute("BEGIN IMMEDIATE")
+                try:
+                    for slot, document in enumerate(documents):
+                        self.__insert_document(PERCOLATE_INDEX, str(slot), document, is_replaced=True)
+
+                    for stored_document_id, source in stored_documents:
+                        stored_document = json.loads(source)
+                        condition, params = translate_stored_query(json.dumps(stored_document.pop(field)))
+                        rows = self.connection.execute(
+                            f"SELECT id FROM documents WHERE index_name = ? AND ({condition})",
+                            (PERCOLATE_INDEX, *params),
+                        ).fetchall()
+                        for (slot,) in rows:
+                            result[int(slot)].append({**stored_document, "id": stored_document_id})
+                finally:
+                    self.connection.execute("ROLLBACK")
+
+            return result
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client percolate error: {error}", module=LOGGING_MODULE)
+            raise
+
+    def update(
+        self,
+        index_name: str,
+        document_id: str,
+        partial_doc: Optional[dict] = None,
+        script_doc: Optional[dict] = None,
+    ) -> None:
+        """Updates a existing document in the database
+
+        Returns:
+        False if the document does not exist
+        """
+        try:
+            with self.__transaction():
+                index_names = self.__resolve_index_names(index_name)
+                if self.__get_document(index_names, str(document_id)) is None:
+                    return False  # document does not exist, unable to perform update operation
+
+                self.__update_document(index_names, str(document_id), {"doc": partial_doc, "script": script_doc})
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client update error: {error}", module=LOGGING_MODULE)
+
+    def create(self, index_name: str, document: dict, document_id: Optional[str] = None):
+        """Creates a new document in an index in the database
+
+        Returns:
+        id of the newly created document, or None if the document is not created
+        """
+        try:
+            with self.__transaction():
+                write_index = self.__resolve_write_index(index_name)
+                if document_id is None:
+                    document_id = uuid.uuid4().hex
+                elif self.__get_document(self.__resolve_index_names(index_name), str(document_id)) is not None:
+                    return None
+
+                is_created = self.__insert_document(write_index, str(document_id), document, is_replaced=False)
+                return document_id if is_created else None
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client create error: {error}", module=LOGGING_MODULE)
+
+    def index_document(self, index_name: str, document: dict, document_id: str):
+        """Creates a document in an index, replacing the existing document with the same document_id
+
+        Returns:
+        id of the created or replaced document, or None if the operation failed
+        """
+        try:
+            with self.__transaction():
+                write_index = self.__resolve_write_index(index_name)
+                self.__insert_document(write_index, str(document_id), document, is_replaced=True)
+                return document_id
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client index error: {error}", module=LOGGING_MODULE)
+
+    def delete_by_query(self, index_name: str, query: dict):
+        """Deletes all documents in an index matching the query
+
+        Returns:
+        number of deleted documents, or None if the operation failed
+        """
+        try:
+            with self.__transaction():
+                index_names = self.__resolve_index_names(index_name)
+                if len(index_names) == 0:
+                    return 0
+
+                condition, params = translate_query(query)
+                seqs = self.connection.execute(
+                    f"SELECT seq FROM documents WHERE index_name IN ({', '.join('?' for _ in index_names)}) "
+                    f"AND ({condition})",
+                    (*index_names, *params),
+                ).fetchall()
+                self.connection.executemany("DELETE FROM document_text WHERE rowid = ?", seqs)
+                self.connection.executemany("DELETE FROM documents WHERE seq = ?", seqs)
+                return len(seqs)
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client delete by query error: {error}", module=LOGGING_MODULE
+            )
+
+    def bulk_create(
+        self,
+        index_name: str,
+        documents: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> BulkResponse:
+        """Creates documents in an index, batch_size documents per transaction
+
+        Documents with an id that already exists in the index are not overwritten and are counted as conflicts.
+        Each document must have an "id" key, which is used as the document id and is not stored in the document.
+        Written documents are immediately searchable, refresh is ignored
+
+        Returns:
+        BulkResponse with the number of created, conflicting and failed documents
+        """
+        result = BulkResponse()
+        batch_size = batch_size or self.__BULK_BATCH_SIZE
+
+        for start in range(0, len(documents), batch_size):
+            batch = documents[start : start + batch_size]
+            try:
+                with self.__transaction():
+                    write_index = self.__resolve_write_index(index_name)
+                    for document in batch:
+                        source = {key: value for key, value in document.items() if key != "id"}
+                        if self.__insert_document(write_index, str(document["id"]), source, is_replaced=False):
+                            result.created += 1
+                        else:
+                            result.conflicts += 1
+            except Exception as error:
+                result.errors += len(batch)
+                self.logging_service.log_error(
+                    message=f"Database client bulk create error: {error}", module=LOGGING_MODULE
+                )
+
+        return result
+
+    def bulk_update(
+        self,
+        index_name: str,
+        updates: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> BulkUpdateResponse:
+        """Updates existing documents of an index, batch_size updates per transaction
+
+        Each update has an "id" key for the document id and either a "doc" key with the partial document
+        or a "script" key with the script. Updates of documents that do not exist are reported as failures
+
+        Returns:
+        BulkUpdateResponse with the number of updated documents and the reason of every failed update
+        """
+        result = BulkUpdateResponse()
+        batch_size = batch_size or self.__BULK_BATCH_SIZE
+
+        for start in range(0, len(updates), batch_size):
+            batch = updates[start : start + batch_size]
+            try:
+                with self.__transaction():
+                    index_names = self.__resolve_index_names(index_name)
+                    for update in batch:
+                        try:
+                            reason = self.__update_document(index_names, str(update["id"]), update)
+                        except Exception as error:
+                            reason = str(error)
+
+                        if reason is None:
+                            result.updated += 1
+                        else:
+                            result.failures[str(update["id"])] = reason
+            except Exception as error:
+                for update in batch:
+                    result.failures[str(update["id"])] = str(error)
+                self.logging_service.log_error(
+                    message=f"Database client bulk update error: {error}", module=LOGGING_MODULE
+                )
+
+        return result
+
+    def put_script(self, script_id: str, script: dict):
+        """
+        Stores a script, referenced by its script_id in updates and multi_read_template.
+        Painless scripts must have a python function registered with register_script_function
+        """
+        try:
+            with self.__transaction():
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO scripts (id, script) VALUES (?, ?)", (script_id, json.dumps(script))
+                )
+            return True
+        except Exception as error:
+            self.logging_service.log_error(message=f"Database client put script error: {error}", module=LOGGING_MODULE)
+            return False
+
+    def get_index_names(self, pattern: str) -> List[str]:
+        """
+        Returns the sorted names of the existing indices matching a wildcard pattern, e.g. "message-*"
+        """
+        try:
+            with self.__lock:
+                return sorted(name for name in self.__get_indices() if fnmatchcase(name, pattern))
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client get index names error: {error}", module=LOGGING_MODULE
+            )
+            raise
+
+    def delete_index(self, index_name: str):
+        """deletes an index with all of its documents"""
+        try:
+            with self.__transaction():
+                self.connection.execute(
+                    "DELETE FROM document_text WHERE rowid IN (SELECT seq FROM documents WHERE index_name = ?)",
+                    (index_name,),
+                )
+                self.connection.execute("DELETE FROM documents WHERE index_name = ?", (index_name,))
+                self.connection.execute("DELETE FROM indices WHERE name = ?", (index_name,))
+            return True
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client delete index error: {error}", module=LOGGING_MODULE
+            )
+            return False
+
+    def put_index_template(self, template_name: str, template: dict):
+        """
+        Stores an index template. Only the aliases of the template are applied to new indices,
+        settings and mappings have no SQLite equivalent
+        """
+        try:
+            with self.__transaction():
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO index_templates (name, template) VALUES (?, ?)",
+                    (template_name, json.dumps(template)),
+                )
+            self.logging_service.log_info(message=f"Database index template stored: {template_name}")
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client put index template error: {error}", module=LOGGING_MODULE
+            )
+
+    def put_mapping(self, index_name: str, properties: dict):
+        """documents are stored as JSON without a mapping, there is nothing to update"""
+        return True
+
+    def add_database_index(self, new_index: DatabaseIndex):
+        """adds a new index to the database. Only the aliases of the mapping are used"""
+        try:
+            index_name = new_index["index_name"]
+            aliases = list(new_index["mapping"].get("aliases", {}).keys())
+            with self.__transaction():
+                self.connection.execute(
+                    "INSERT INTO indices (name, aliases) VALUES (?, ?)", (index_name, json.dumps(aliases))
+                )
+            self.logging_service.log_info(message=f"New database index added: {index_name}")
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Database client add database index error: {error}", module=LOGGING_MODULE
+            )
+
+
+class AsyncSqliteDatabaseClient(AsyncDatabaseBackend):
+    """
+    asyncio counterpart of SqliteDatabaseClient. Statements run in a worker thread,
+    so that a write waiting on another process does not block the event loop
+    """
+
+    __STREAM_PAGE_SIZE = 1_000  # number of documents read per worker thread call when streaming search results
+
+    def __init__(self, database_client: SqliteDatabaseClient):
+        self.database_client = database_client
+
+    async def close(self):
+        """the connection is shared with the sync client of the process, it is not closed"""
+
+    async def document_exist(self, index_name: str, document_id: str):
+        return await asyncio.to_thread(self.database_client.document_exist, index_name, document_id)
+
+    async def get(self, index_name: str, document_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.database_client.get, index_name, document_id)
+
+    def build_query_string(self, query_string_list: List[str]):
+        return build_query_string(query_string_list)
+
+    async def read(self, index_name: str, query: dict):
+        return await asyncio.to_thread(self.database_client.read, index_name, query)
+
+    async def read_stream(
+        self,
+        index_name: str,
+        query: dict,
+        page_size: Optional[int] = None,
+        source_fields: Optional[List[str]] = None,
+        sort: Optional[List[dict]] = None,
+    ) -> AsyncIterator[dict]:
+        """yields every matching document, each page is read in a worker thread"""
+        page_size = page_size or self.__STREAM_PAGE_SIZE
+        documents = self.database_client.read_stream(
+            index_name, query, page_size=page_size, source_fields=source_fields, sort=sort
+        )
+        while True:
+            page = await asyncio.to_thread(lambda: list(itertools.islice(documents, page_size)))
+            for document in page:
+                yield document
+
+            if len(page) < page_size:
+                return
+
+    async def multi_read(
+        self, index_name: str, queries: List[dict], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        return await asyncio.to_thread(self.database_client.multi_read, index_name, queries, batch_size)
+
+    async def get_index_names(self, pattern: str) -> List[str]:
+        return await asyncio.to_thread(self.database_client.get_index_names, pattern)
+
+    async def update(
+        self,
+        index_name: str,
+        document_id: str,
+        partial_doc: Optional[dict] = None,
+        script_doc: Optional[dict] = None,
+    ):
+        return await asyncio.to_thread(self.database_client.update, index_name, document_id, partial_doc, script_doc)
+
+    async def create(self, index_name: str, document: dict, document_id: Optional[str] = None):
+        return await asyncio.to_thread(self.database_client.create, index_name, document, document_id)
+
+    async def index_document(self, index_name: str, document: dict, document_id: str):
+        return await asyncio.to_thread(self.database_client.index_document, index_name, document, document_id)
+
+    async def delete_by_query(self, index_name: str, query: dict):
+        return await asyncio.to_thread(self.database_client.delete_by_query, index_name, query)
+
+    async def bulk_create(
+        self,
+        index_name: str,
+        documents: List[dict],
+        refresh: Union[bool, str] = False,
+        batch_size: Optional[int] = None,
+    ) -> BulkResponse:
+        return await asyncio.to_thread(self.database_client.bulk_create, index_name, documents, refresh, batch_size)
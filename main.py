@@ -1,76 +1,296 @@
 import argparse
 import asyncio
-import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set, Tuple
 
 from services.channel_service import ChannelService
-from services.download_service import download_service
+from services.digest_service import DigestEntry, DigestService
+from services.dispatch_service import Notification
 from services.logging_service import LoggingService
-from services.message_service import MessageService
-from services.notification_service import NotificationService
+from services.message_service import (
+    MatchedMessagesQuery,
+    MessageService,
+    env_message_partitioning,
+    get_ingested_datetime,
+    shared_ingest_tracker,
+)
+from services.metrics_service import notify_cycle_duration_seconds, notify_matches_total, start_metrics_exporter
+from services.notify_trigger_service import NotifyTriggerService
+from services.profiling_service import shared_profiling_service
+from services.schedule_service import ScheduleService, env_schedule_min_interval_seconds
+from services.service_container import container
 from services.subscriber_service import SubscriberService
-from utils.date_helper import get_latest_iso_datetime
+from services.subscription_service import INGEST_MATCH_MODES, SubscriptionService, env_match_mode
+from utils.config import load_config
+from utils.date_helper import get_latest_iso_datetime, parse_iso_datetime, to_iso_datetime
 
-logging_service = LoggingService()
+if TYPE_CHECKING:
+    # telethon is only imported by the commands that download messages
+    from services.download_service import ChannelDownloadResult
 
+load_config()
+env_msearch_batch_size = int(os.getenv("ENV_MSEARCH_BATCH_SIZE") or 50)
+env_notify_digest = (os.getenv("ENV_NOTIFY_DIGEST") or "false").lower() == "true"
+DOWNLOAD_MODE_POLL = "poll"  # every active channel is polled on a fixed interval
+DOWNLOAD_MODE_STREAM = "stream"  # new messages are received as they are posted, with a polling sweep as backstop
+env_download_mode = os.getenv("ENV_DOWNLOAD_MODE") or DOWNLOAD_MODE_POLL
+env_stream_sweep_seconds = float(os.getenv("ENV_STREAM_SWEEP_SECONDS") or 60 * 60)
+DOWNLOAD_SCHEDULE_FIXED = "fixed"  # in poll mode, every active channel is polled every 15 minutes
+DOWNLOAD_SCHEDULE_ADAPTIVE = "adaptive"  # in poll mode, each channel is polled on an interval from its posting history
+env_download_schedule = os.getenv("ENV_DOWNLOAD_SCHEDULE") or DOWNLOAD_SCHEDULE_FIXED
+NOTIFY_MODE_INTERVAL = "interval"  # subscribers are notified on a fixed interval
+NOTIFY_MODE_EVENT = "event"  # subscribers are notified as soon as matching messages are stored
+env_notify_mode = os.getenv("ENV_NOTIFY_MODE") or NOTIFY_MODE_INTERVAL
+logging_service = LoggingService()
 
-async def send_message_from_bot(message: str, receiver_chat_id: str):
-    """send messages from bot. A user must first interact with this bot first"""
-    notification_service = NotificationService()
-    await notification_service.send_message(message, receiver_chat_id)
 
+def get_theme_matches_by_search(
+    subscribers: List[dict], iso_date_to: Optional[str] = None
+) -> List[Tuple[str, str, List[dict]]]:
+    """
+    for each subscribed theme, searches messages based on keywords and last notified timestamp,
+    stored up to iso_date_to. The searches of all themes are sent together in multi search requests
 
-async def notify_subscribers():
-    subscriber_service = SubscriberService()
+    Returns a list of (subscriber id, theme, matched messages)
+    """
     message_service = MessageService()
+    subscriber_themes = []
+    queries = []
+
+    for subscriber in subscribers:
+        for subscribed_theme in subscriber["subscribed_themes"]:
+            subscriber_themes.append((subscriber["id"], subscribed_theme["theme"]))
+            queries.append(
+                MatchedMessagesQuery(
+                    keywords_list=subscribed_theme["keywords"],
+                    theme=subscribed_theme["theme"],
+                    iso_date_from=subscribed_theme["last_notified_timestamp"],
+                    iso_date_to=iso_date_to,
+                )
+            )
 
-    subscribers = subscriber_service.get_subscribers(True)
+    matched_messages = message_service.get_matched_messages_many(queries=queries, batch_size=env_msearch_batch_size)
+
+    return [
+        (subscriber_id, theme, messages)
+        for (subscriber_id, theme), messages in zip(subscriber_themes, matched_messages)
+    ]
+
+
+def get_theme_matches_by_subscription(
+    subscribers: List[dict], iso_date_to: Optional[str] = None
+) -> List[Tuple[str, str, List[dict]]]:
+    """
+    retrieves the messages matched to each subscribed theme at ingest time, stored after its last notified
+    timestamp and up to iso_date_to
+
+    Returns a list of (subscriber id, theme, matched messages)
+    """
+    message_service = MessageService()
+    subscription_dates = {}
+    subscription_themes = {}
 
     for subscriber in subscribers:
-        subscriber_id = subscriber["id"]
-        subscribed_themes = subscriber["subscribed_themes"]
-
-        # for each subscribed theme, retrieve messages based on keywords and last notified timestamp
-        # messages found are considered matches, sent back to the subscriber via telegram
-        # last notified timestamp is updated with the latest message timestamp
-        for subscribed_theme in subscribed_themes:
-            theme = subscribed_theme["theme"]
-            keywords = subscribed_theme["keywords"]
-            timestamp = subscribed_theme["last_notified_timestamp"]
-            message_iso_dates = []  # datetime for comparison later
-
-            messages = message_service.get_matched_messages(
-                keywords_list=keywords, theme=theme, iso_date_from=timestamp
+        for subscribed_theme in subscriber["subscribed_themes"]:
+            subscription_id = SubscriptionService.get_subscription_id(subscriber["id"], subscribed_theme["theme"])
+            subscription_dates[subscription_id] = subscribed_theme["last_notified_timestamp"]
+            subscription_themes[subscription_id] = (subscriber["id"], subscribed_theme["theme"])
+
+    matched_messages = message_service.get_subscription_matched_messages(
+        subscription_dates=subscription_dates, iso_date_to=iso_date_to
+    )
+
+    return [(*subscription_themes[subscription_id], messages) for subscription_id, messages in matched_messages.items()]
+
+
+def build_message_notifications(
+    theme_matches: List[Tuple[str, str, List[dict]]],
+) -> Tuple[List[Notification], List[List[Tuple[str, str, str]]]]:
+    """
+    builds one notification for every matched message
+
+    Returns the notifications, and for each notification the (subscriber id, theme, message ingest time) it covers
+    """
+    notifications = []
+    notification_matches = []
+
+    for subscriber_id, theme, messages in theme_matches:
+        for message in messages:
+            notifications.append(
+                Notification(message=message["text"], receiver_chat_id=str(subscriber_id), reference=message["id"])
             )
+            notification_matches.append([(subscriber_id, theme, to_iso_datetime(get_ingested_datetime(message)))])
+
+    return notifications, notification_matches
+
 
-            for message in messages:
-                message_iso_dates.append(message["timestamp"])
-                log_content = {"message_id": message["id"], "subscriber_id": subscriber_id}
-                logging_service.log_info(f"Sending message to user from telegram bot: {json.dumps(log_content)}")
-                await send_message_from_bot(message["text"], subscriber_id)
-
-            latest_message_iso_datetime = get_latest_iso_datetime(message_iso_dates)
-
-            # update subscriber last notified timestamp to the latest message datetime
-            # subsequent retrievals will be after this date for this theme
-            if latest_message_iso_datetime is not None:
-                subscriber_service.update_subscriber_theme_timestamp(
-                    subscriber_id=subscriber_id,
-                    theme=theme,
-                    iso_timestamp=latest_message_iso_datetime,
+def build_digest_notifications(
+    theme_matches: List[Tuple[str, str, List[dict]]],
+) -> Tuple[List[Notification], List[List[Tuple[str, str, str]]]]:
+    """
+    groups the matched messages of each subscriber, across themes, into digest notifications
+
+    Returns the notifications, and for each notification the (subscriber id, theme, message ingest time) it covers
+    """
+    digest_service = DigestService()
+    subscriber_entries = {}  # subscriber id -> message id -> digest entry
+    message_ingest_times = {}  # message id -> ingest time, for the last notified timestamps
+    for subscriber_id, theme, messages in theme_matches:
+        entries = subscriber_entries.setdefault(subscriber_id, {})
+        for message in messages:
+            message_ingest_times[message["id"]] = to_iso_datetime(get_ingested_datetime(message))
+            if message["id"] in entries:
+                entries[message["id"]].themes.append(theme)  # message matched many themes of the subscriber
+                continue
+
+            entries[message["id"]] = DigestEntry(
+                message_id=message["id"],
+                channel_id=message["channel_id"],
+                themes=[theme],
+                text=message["text"],
+                timestamp=message["timestamp"],
+            )
+
+    notifications = []
+    notification_matches = []
+    for subscriber_id, entries in subscriber_entries.items():
+        for digest in digest_service.build_digests(list(entries.values())):
+            # the reference of a digest lists the ids of its messages, for the delivery log
+            notifications.append(
+                Notification(
+                    message=digest.message,
+                    receiver_chat_id=str(subscriber_id),
+                    reference=",".join(entry.message_id for entry in digest.entries),
                 )
+            )
+            notification_matches.append(
+                [
+                    (subscriber_id, theme, message_ingest_times[entry.message_id])
+                    for entry in digest.entries
+                    for theme in entry.themes
+                ]
+            )
 
+    return notifications, notification_matches
 
-async def download_telegram_messages():
+
+@shared_profiling_service.profiled("notify")
+async def notify_subscribers(themes: Optional[Iterable[str]] = None) -> Set[str]:
     """
-    loops through all active telegram channels and download messages from it
+    sends the new matched messages of every subscribed theme to its subscriber
+
+    themes (optional) - only notify these themes. Defaults to all themes
+
+    Returns the themes with messages that failed to send temporarily, or that were still being stored,
+    to be retried later
     """
-    channel_service = ChannelService()
+    cycle_start_time = time.perf_counter()
+    subscriber_service = SubscriberService()
+    # the last notified timestamps are ingest times. Messages still being stored are left to a later cycle,
+    # so that the timestamps never move past them
+    searchable_until, is_store_pending = shared_ingest_tracker.get_searchable_until()
+    iso_date_to = to_iso_datetime(searchable_until)
+
+    # the services use the blocking database client, their requests run in worker threads
+    subscribers = await asyncio.to_thread(subscriber_service.get_subscribers, True)
+    if themes is not None:
+        themes = set(themes)
+        subscribers = [
+            {
+                **subscriber,
+                "subscribed_themes": [
+                    subscribed_theme
+                    for subscribed_theme in subscriber["subscribed_themes"]
+                    if subscribed_theme["theme"] in themes
+                ],
+            }
+            for subscriber in subscribers
+        ]
+
+    # messages found for each subscribed theme are considered matches, sent back to the subscriber via telegram
+    if env_match_mode in INGEST_MATCH_MODES:
+        theme_matches = await asyncio.to_thread(get_theme_matches_by_subscription, subscribers, iso_date_to)
+    else:
+        theme_matches = await asyncio.to_thread(get_theme_matches_by_search, subscribers, iso_date_to)
+    notify_matches_total.inc(sum(len(messages) for _, _, messages in theme_matches))
+
+    if env_notify_digest:
+        notifications, notification_matches = build_digest_notifications(theme_matches)
+    else:
+        notifications, notification_matches = build_message_notifications(theme_matches)
+
+    # notifications are sent through the shared bot at the rate allowed by Telegram
+    results = await container.dispatch_service.dispatch(notifications)
+    for result in results:
+        # failed deliveries are logged by the dispatch service
+        if result.status == "sent":
+            log_content = {"subscriber_id": result.receiver_chat_id, "reference": result.reference}
+            logging_service.log_info("Sent notification to user from telegram bot", fields=log_content)
+
+    delivered_iso_dates = {}  # (subscriber id, theme) -> timestamps of messages that will not be sent again
+    retry_iso_dates = {}  # (subscriber id, theme) -> timestamps of messages that failed temporarily
+    for matches, result in zip(notification_matches, results):
+        for subscriber_id, theme, iso_date in matches:
+            delivered_iso_dates.setdefault((subscriber_id, theme), [])
+            if result.status != "sent" and result.retryable:
+                retry_iso_dates.setdefault((subscriber_id, theme), []).append(iso_date)
+                continue
+            delivered_iso_dates[(subscriber_id, theme)].append(iso_date)
+
+    # last notified timestamp is updated with the latest message ingest time.
+    # If a message failed temporarily, it stops before that message so it is sent in the next cycle
+    subscriber_theme_timestamps = {}  # subscriber id -> theme -> new last notified timestamp
+    for (subscriber_id, theme), message_iso_dates in delivered_iso_dates.items():
+        if (subscriber_id, theme) in retry_iso_dates:
+            earliest_retry_datetime = min(parse_iso_datetime(date) for date in retry_iso_dates[(subscriber_id, theme)])
+            message_iso_dates = [
+                date for date in message_iso_dates if parse_iso_datetime(date) < earliest_retry_datetime
+            ]
+
+        latest_message_iso_datetime = get_latest_iso_datetime(message_iso_dates)
+
+        # subsequent retrievals will be after this date for this theme
+        if latest_message_iso_datetime is not None:
+            subscriber_theme_timestamps.setdefault(subscriber_id, {})[theme] = latest_message_iso_datetime
+
+    # the timestamps of the whole cycle are written together, one scripted update per subscriber
+    update_response = await asyncio.to_thread(
+        subscriber_service.update_subscriber_theme_timestamps, subscriber_theme_timestamps
+    )
+    for subscriber_id, reason in update_response.failures.items():
+        log_content = {"subscriber_id": subscriber_id, "reason": reason}
+        logging_service.log_error("Failed to update last notified timestamps", fields=log_content)
+
+    notify_cycle_duration_seconds.observe(time.perf_counter() - cycle_start_time)
+    retry_themes = {theme for _, theme in retry_iso_dates.keys()}
+    if is_store_pending and themes is not None:
+        retry_themes.update(themes)
+    return retry_themes
+
+
+@shared_profiling_service.profiled("download")
+async def download_telegram_messages(channels: Optional[List[dict]] = None) -> List["ChannelDownloadResult"]:
+    """
+    downloads the messages of the channels, all active telegram channels by default
+
+    Returns the download result of each channel
+    """
+    if channels is None:
+        channels = await asyncio.to_thread(ChannelService().get_active_channels)
 
-    channels = channel_service.get_active_channels()
     for channel in channels:
         log_content = {"channel_id": channel["id"], "channel_offset_id": channel["offset_id"]}
-        logging_service.log_info(f"Downloading message from channel: {json.dumps(log_content)}")
-        await download_service.download_messages_from_channel(channel=channel)
+        logging_service.log_info("Downloading message from channel", fields=log_content)
+
+    download_service = await container.get_download_service()
+    results = await download_service.download_messages_from_channels(channels=channels)
+
+    for result in results:
+        logging_service.log_info("Channel download result", fields=result.model_dump())
+
+    return results
 
 
 async def start_background_download_service():
@@ -85,6 +305,86 @@ async def start_background_download_service():
         await asyncio.sleep(SLEEP_DURATION_SECONDS)
 
 
+async def download_scheduled_channels(schedule_service: Optional[ScheduleService] = None) -> float:
+    """
+    downloads the messages of the active channels due for a poll, and schedules their next poll
+    from their posting history
+
+    schedule_service (optional) - service keeping the schedules of the polled channels between calls.
+    Defaults to a new service, reading the schedules stored with the channels
+
+    Returns the seconds until the next channel is due
+    """
+    channel_service = ChannelService()
+    schedule_service = schedule_service or ScheduleService(channel_service=channel_service)
+
+    channels = await asyncio.to_thread(channel_service.get_active_channels)
+    due_channels = schedule_service.get_due_channels(channels)
+    if len(due_channels) > 0:
+        polled_at = datetime.now(timezone.utc)
+        results = await download_telegram_messages(channels=due_channels)
+        # failed channels without new messages keep their history, and are retried after the minimum interval
+        message_dates = {
+            result.channel_id: result.message_dates
+            for result in results
+            if result.status == "success" or len(result.message_dates) > 0
+        }
+        await asyncio.to_thread(
+            schedule_service.update_schedules, due_channels, message_dates=message_dates, polled_at=polled_at
+        )
+
+    return schedule_service.get_seconds_until_next_poll(channels)
+
+
+async def start_background_scheduled_download_service():
+    """
+    polls each channel on its own interval, adapted to its posting history.
+    Channels are checked at least every ENV_SCHEDULE_MIN_INTERVAL_SECONDS, to pick up new channels.
+    The schedules are kept in memory across polls, a failure to store them does not poll the channels again
+    """
+    schedule_service = ScheduleService()
+    while True:
+        sleep_seconds = await download_scheduled_channels(schedule_service=schedule_service)
+        sleep_seconds = max(1, min(sleep_seconds, env_schedule_min_interval_seconds))
+        logging_service.log_info(f"Downloaded scheduled channels, sleeping for {sleep_seconds:.0f} seconds")
+        await asyncio.sleep(sleep_seconds)
+
+
+async def start_background_stream_service():
+    """
+    stores new messages of the active channels as they are posted.
+    All channels are still polled on a long interval, to fill gaps left by disconnects and to pick up new channels
+    """
+    download_service = await container.get_download_service()
+    stream_task = asyncio.create_task(download_service.stream_messages())
+    try:
+        while True:
+            logging_service.log_info("Sweeping messages from Telegram")
+            await download_telegram_messages()
+            channels = await asyncio.to_thread(ChannelService().get_active_channels)
+            await download_service.watch_channels(channels)
+            logging_service.log_info(f"Swept messages from Telegram, sleeping for {env_stream_sweep_seconds} seconds")
+            await asyncio.sleep(env_stream_sweep_seconds)
+    finally:
+        stream_task.cancel()
+
+
+def delete_expired_messages():
+    """deletes the monthly message indices past the retention period"""
+    deleted_partitions = MessageService().delete_expired_partitions()
+    logging_service.log_info("Deleted expired message indices", fields={"indices": deleted_partitions})
+
+
+async def start_background_retention_service():
+    """
+    deletes expired message indices on a set interval
+    """
+    SLEEP_DURATION_SECONDS = 60 * 60 * 24  # check for expired message indices every day
+    while True:
+        await asyncio.to_thread(delete_expired_messages)
+        await asyncio.sleep(SLEEP_DURATION_SECONDS)
+
+
 async def start_background_notify_service():
     """
     runs notification service of subscribers on a set interval
@@ -97,14 +397,32 @@ async def start_background_notify_service():
         await asyncio.sleep(SLEEP_DURATION_SECONDS)  # notify subscriber every 60 minutes
 
 
+async def start_event_driven_notify_service():
+    """
+    notifies the subscribers of a theme a few seconds after new messages of the theme are stored.
+    Bursts of messages are coalesced within ENV_NOTIFY_DEBOUNCE_SECONDS
+    """
+    notify_trigger_service = NotifyTriggerService()
+    download_service = await container.get_download_service()
+    download_service.messages_stored_listener = notify_trigger_service.notify_themes
+    await notify_trigger_service.run(notify=notify_subscribers)
+
+
 async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--download", action="store_true")
     parser.add_argument("--notify", action="store_true")
     parser.add_argument("--start", action="store_true")
+    parser.add_argument("--retention", action="store_true")
+    parser.add_argument(
+        "--profile", action="store_true", help="profiles every download and notify cycle, same as ENV_PROFILE_ENABLED"
+    )
 
     args = parser.parse_args()
 
+    if args.profile:
+        shared_profiling_service.enabled = True
+
     if args.download:
         logging_service.log_info("Starting telegram message download service")
         await download_telegram_messages()
@@ -113,11 +431,27 @@ async def main():
         logging_service.log_info("Starting notification service")
         await notify_subscribers()
 
+    if args.retention:
+        logging_service.log_info("Deleting expired messages")
+        delete_expired_messages()
+
     if args.start:
         logging_service.log_info("Starting download and notification background service")
-        task_1 = asyncio.create_task(start_background_download_service())
-        task_2 = asyncio.create_task(start_background_notify_service())
-        await asyncio.wait([task_1, task_2])
+        start_metrics_exporter()
+        if env_download_mode == DOWNLOAD_MODE_STREAM:
+            task_1 = asyncio.create_task(start_background_stream_service())
+        elif env_download_schedule == DOWNLOAD_SCHEDULE_ADAPTIVE:
+            task_1 = asyncio.create_task(start_background_scheduled_download_service())
+        else:
+            task_1 = asyncio.create_task(start_background_download_service())
+        if env_notify_mode == NOTIFY_MODE_EVENT:
+            task_2 = asyncio.create_task(start_event_driven_notify_service())
+        else:
+            task_2 = asyncio.create_task(start_background_notify_service())
+        tasks = [task_1, task_2]
+        if env_message_partitioning:
+            tasks.append(asyncio.create_task(start_background_retention_service()))
+        await asyncio.wait(tasks)
 
     logging_service.log_error("Invalid script command to run main script")
 
@@ -1,8 +1,10 @@
-from typing import List, Optional, Union
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
 
 from pydantic import BaseModel
 
-from database_connector.database_client import DatabaseClient
+from database_connector.async_database_client import get_async_database_client
+from database_connector.database_backend import AsyncDatabaseBackend, DatabaseBackend
+from database_connector.database_client import BulkUpdateResponse, get_database_client
 
 
 class Channel(BaseModel):
@@ -16,8 +18,8 @@ class Channel(BaseModel):
 class ChannelService:
     __INDEX_NAME = "channel"
 
-    def __init__(self):
-        self.database_client = DatabaseClient()
+    def __init__(self, database_client: Optional[DatabaseBackend] = None):
+        self.database_client = database_client or get_database_client()
 
     def check_channel_exists(self, channel_id: str):
         return self.database_client.document_exist(index_name=self.__INDEX_NAME, document_id=channel_id)
@@ -39,13 +41,22 @@ class ChannelService:
 
         return None
 
+    def iter_active_channels(self, source_fields: Optional[List[str]] = None) -> Iterator[dict]:
+        """
+        yields all active channels, without loading them all in memory.
+
+        source_fields (optional) - fields of the channels to retrieve. Defaults to all fields
+        """
+        yield from self.database_client.read_stream(
+            index_name=self.__INDEX_NAME, query={"term": {"is_active": True}}, source_fields=source_fields
+        )
+
     def get_active_channels(self):
         """
         returns all active channels. Active channels refer to channels
         that are being retrieved by the system periodically
         """
-        result = self.database_client.read(index_name=self.__INDEX_NAME, query={"term": {"is_active": True}})
-        return result
+        return list(self.iter_active_channels())
 
     def update_channel_offset(self, channel_id: str, new_offset_id: Union[str, None]):
         """
@@ -58,6 +69,18 @@ class ChannelService:
         )
         return result
 
+    def update_channel_schedules(self, schedules: Dict[str, dict]) -> BulkUpdateResponse:
+        """
+        Updates the poll schedule of many channels in bulk
+
+        Parameters:
+        schedules - channel id -> schedule of the channel
+        """
+        return self.database_client.bulk_update(
+            index_name=self.__INDEX_NAME,
+            updates=[{"id": channel_id, "doc": {"schedule": schedule}} for channel_id, schedule in schedules.items()],
+        )
+
     def add_channel(self, channel: Channel):
         """
         Adds a new channel to the database. A channel's is_active flag is set to True by default
@@ -114,3 +137,108 @@ class ChannelService:
             document_id=channel_id,
             partial_doc={"themes": themes},
         )
+
+
+class AsyncChannelService:
+    """asyncio counterpart of ChannelService"""
+
+    __INDEX_NAME = "channel"
+
+    def __init__(self, database_client: Optional[AsyncDatabaseBackend] = None):
+        self.database_client = database_client or get_async_database_client()
+
+    async def check_channel_exists(self, channel_id: str):
+        return await self.database_client.document_exist(index_name=self.__INDEX_NAME, document_id=channel_id)
+
+    async def get_channels(self):
+        """
+        Retrieves all channels in the database, including inactive channels
+        """
+        result = await self.database_client.read(index_name=self.__INDEX_NAME, query={"match_all": {}})
+        return result
+
+    async def get_channel(self, channel_id: str) -> Channel:
+        """
+        Retrieve a channel by its channel id
+        """
+        response = await self.database_client.read(index_name=self.__INDEX_NAME, query={"match": {"_id": channel_id}})
+        if len(response) == 1:
+            return response[0]
+
+        return None
+
+    async def iter_active_channels(self, source_fields: Optional[List[str]] = None) -> AsyncIterator[dict]:
+        """
+        yields all active channels, without loading them all in memory.
+
+        source_fields (optional) - fields of the channels to retrieve. Defaults to all fields
+        """
+        async for channel in self.database_client.read_stream(
+            index_name=self.__INDEX_NAME, query={"term": {"is_active": True}}, source_fields=source_fields
+        ):
+            yield channel
+
+    async def get_active_channels(self):
+        """
+        returns all active channels. Active channels refer to channels
+        that are being retrieved by the system periodically
+        """
+        return [channel async for channel in self.iter_active_channels()]
+
+    async def update_channel_offset(self, channel_id: str, new_offset_id: Union[str, None]):
+        """
+        Updates a channel's offset id
+        """
+        result = await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=channel_id,
+            partial_doc={"offset_id": new_offset_id},
+        )
+        return result
+
+    async def add_channel(self, channel: Channel):
+        """
+        Adds a new channel to the database. A channel's is_active flag is set to True by default
+        unless specified.
+
+        If a channel exists already, add the theme to existing channel instead
+        """
+        existing_channel = await self.get_channel(channel_id=channel.channel_id)
+        # channel exists, add theme to channel
+        if existing_channel is not None:
+            # ensure no duplicates of themes
+            combined_themes = list(set().union([*existing_channel["themes"], *channel.themes]))
+            await self.update_channel_themes(channel_id=channel.channel_id, themes=combined_themes)
+            return channel.channel_id
+
+        result = await self.database_client.create(
+            index_name=self.__INDEX_NAME,
+            document={
+                "name": channel.channel_name,
+                "is_active": channel.is_active,
+                "offset_id": channel.offset_id,
+                "themes": channel.themes,
+            },
+            document_id=channel.channel_id.lower(),  # force lowercase on channel id
+        )
+        return result
+
+    async def toggle_channel_activeness(self, channel_id: str, is_active: bool):
+        """
+        Sets a channel is_active flag to the given is_active flag
+        """
+        await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=channel_id,
+            partial_doc={"is_active": is_active},
+        )
+
+    async def update_channel_themes(self, channel_id: str, themes: List[str]):
+        """
+        Updates a channel's themes list
+        """
+        await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=channel_id,
+            partial_doc={"themes": themes},
+        )
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from utils.config import load_config
+
+load_config()
+env_digest_max_entries = int(os.getenv("ENV_DIGEST_MAX_ENTRIES") or 30)
+
+
+class DigestEntry(BaseModel):
+    message_id: str  # id of the message document, "<channel id>-<telegram message id>"
+    channel_id: str
+    themes: List[str]  # subscribed themes the message matched
+    text: Optional[str] = None
+    timestamp: datetime
+
+
+class Digest(BaseModel):
+    message: str
+    entries: List[DigestEntry]  # entries summarised in the message, including the overflow entries
+
+
+def get_message_link(entry: DigestEntry) -> str:
+    telegram_message_id = entry.message_id.rsplit("-", 1)[-1]
+    return f"https://t.me/{entry.channel_id}/{telegram_message_id}"
+
+
+class DigestService:
+    """
+    Groups the matched messages of a subscriber into as few Telegram messages as possible.
+
+    Every entry shows its theme, source channel, text and a link to the original message.
+    Only the latest max_entries entries are shown, the rest are summarised with a "+N more" line
+    """
+
+    MAX_MESSAGE_LENGTH = 4096  # Telegram limit on the text of a message
+    __MAX_ENTRY_TEXT_LENGTH = 500  # longer message texts are truncated, the link leads to the full message
+    __ENTRY_SEPARATOR = "\n\n"
+
+    def __init__(self, max_entries: Optional[int] = None, max_message_length: Optional[int] = None):
+        self.max_entries = max_entries or env_digest_max_entries
+        self.max_message_length = max_message_length or self.MAX_MESSAGE_LENGTH
+
+    def __truncate(self, text: str, length: int) -> str:
+        if len(text) <= length:
+            return text
+
+        return text[: max(length - 1, 0)].rstrip() + "…"
+
+    def __format_entry(self, entry: DigestEntry) -> str:
+        header = f"[{', '.join(entry.themes)}] {entry.channel_id}"
+        link = get_message_link(entry)
+        # every entry must fit in a single message, with room left for the overflow line
+        text_length = min(self.__MAX_ENTRY_TEXT_LENGTH, self.max_message_length // 2 - len(header) - len(link))
+        text = self.__truncate((entry.text or "").strip(), text_length)
+
+        return "\n".join([header, text, link]) if text else "\n".join([header, link])
+
+    def build_digests(self, entries: List[DigestEntry]) -> List[Digest]:
+        """
+        Builds the digest messages of one subscriber, latest entries first
+
+        Returns:
+        the digests to send, each within the Telegram message length limit
+        """
+        entries = sorted(entries, key=lambda entry: entry.timestamp, reverse=True)
+        shown_entries = entries[: self.max_entries]
+        overflow_entries = entries[self.max_entries :]
+
+        digests: List[Digest] = []
+        for entry in shown_entries:
+            formatted_entry = self.__format_entry(entry)
+            if len(digests) > 0:
+                message = digests[-1].message + self.__ENTRY_SEPARATOR + formatted_entry
+                if len(message) <= self.max_message_length:
+                    digests[-1].message = message
+                    digests[-1].entries.append(entry)
+                    continue
+
+            digests.append(Digest(message=formatted_entry, entries=[entry]))
+
+        if len(overflow_entries) > 0:
+            overflow_line = f"+{len(overflow_entries)} more"
+            message = digests[-1].message + self.__ENTRY_SEPARATOR + overflow_line
+            if len(message) <= self.max_message_length:
+                digests[-1].message = message
+                digests[-1].entries.extend(overflow_entries)
+            else:
+                digests.append(Digest(message=overflow_line, entries=overflow_entries))
+
+        return digests
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from services.logging_service import LoggingService
+from services.metrics_service import notify_send_duration_seconds, notify_sends_total
+from services.notification_service import NotificationService, get_notification_service
+from utils.config import load_config
+
+load_config()
+env_dispatch_workers = int(os.getenv("ENV_DISPATCH_WORKERS") or 8)
+# Telegram allows a bot about 30 messages per second overall, and 1 message per second to the same chat
+env_dispatch_global_rate = float(os.getenv("ENV_DISPATCH_GLOBAL_RATE") or 30)
+env_dispatch_per_chat_rate = float(os.getenv("ENV_DISPATCH_PER_CHAT_RATE") or 1)
+env_dispatch_max_retries = int(os.getenv("ENV_DISPATCH_MAX_RETRIES") or 5)
+LOGGING_MODULE = "DISPATCH-SERVICE"
+
+
+class Notification(BaseModel):
+    message: str
+    receiver_chat_id: str
+    reference: Optional[str] = None  # e.g. id of the matched message, returned with the delivery result
+
+
+class DeliveryResult(BaseModel):
+    receiver_chat_id: str
+    reference: Optional[str] = None
+    status: str  # one of "sent" or "failed"
+    attempts: int = 0
+    rate_limited_attempts: int = 0  # attempts rejected by RetryAfter, they do not count toward the retry limit
+    retryable: bool = False  # failed on a temporary error, sending it again later may succeed
+    error: Optional[str] = None
+
+
+class TokenBucket:
+    """
+    Limits the rate of an operation to rate per second, allowing bursts of up to capacity.
+    Waiters acquire tokens in the order they arrived
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def get_wait_seconds(self) -> float:
+        """seconds until a token is available, 0 if one is available now"""
+        now = time.monotonic()
+        tokens = min(self.capacity, self.tokens + max(now - self.updated_at, 0) * self.rate)
+        if tokens >= 1:
+            return max(0.0, self.paused_until - now)
+
+        # tokens refill from the last update, which is the end of a pause
+        return max(self.updated_at - now, 0) + (1 - tokens) / self.rate
+
+    def pause(self, seconds: float):
+        """stops handing out tokens for the given number of seconds, tokens refill from the end of the pause"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.updated_at = self.paused_until
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + max(now - self.updated_at, 0) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DispatchService:
+    """
+    Sends notifications through a single shared bot with a pool of workers. Notifications are queued per chat,
+    workers take the next notification of a chat that is ready to receive one.
+
+    Sending is limited by a global token bucket and a token bucket per chat, matching Telegram's limits.
+    RetryAfter pauses all sending for the requested duration and the notification waits for it, however often it
+    is asked to. Network errors are retried with exponential backoff, up to max_retries times
+    """
+
+    __BACKOFF_BASE_SECONDS = 1
+
+    def __init__(
+        self,
+        notification_service: Optional[NotificationService] = None,
+        workers: Optional[int] = None,
+        global_rate: Optional[float] = None,
+        per_chat_rate: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ):
+        self.notification_service = notification_service or get_notification_service()
+        self.workers = workers or env_dispatch_workers
+        self.per_chat_rate = per_chat_rate or env_dispatch_per_chat_rate
+        self.max_retries = max_retries if max_retries is not None else env_dispatch_max_retries
+        self.global_bucket = TokenBucket(rate=global_rate or env_dispatch_global_rate)
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.logging_service = LoggingService()
+
+    def __get_chat_bucket(self, chat_id: str) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(rate=self.per_chat_rate, capacity=1)
+
+        return self.chat_buckets[chat_id]
+
+    async def __attempt(self, notification: Notification, result: DeliveryResult) -> Optional[float]:
+        """
+        Sends the notification once, updating its delivery result
+
+        Returns:
+        None when the notification is done, sent or failed for good, otherwise the seconds to wait before retrying
+        """
+        from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+        chat_bucket = self.__get_chat_bucket(notification.receiver_chat_id)
+        await chat_bucket.acquire()
+        await self.global_bucket.acquire()
+        # the global bucket may have been paused, the chat interval counts from the actual send
+        chat_bucket.pause(0)
+        result.attempts += 1
+
+        try:
+            with notify_send_duration_seconds.time():
+                await self.notification_service.deliver_message(notification.message, notification.receiver_chat_id)
+            result.status = "sent"
+            result.retryable = False
+            result.error = None
+            return None
+        except RetryAfter as error:
+            retry_after = error.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            # the limit applies to the bot, hold back every worker
+            self.global_bucket.pause(retry_after)
+            result.rate_limited_attempts += 1
+            result.retryable = True
+            result.error = str(error)
+            return 0
+        except (BadRequest, Forbidden) as error:
+            # e.g. the subscriber blocked the bot or the message is malformed, retrying will not help
+            result.retryable = False
+            result.error = str(error)
+            return None
+        except NetworkError as error:
+            result.retryable = True
+            result.error = str(error)
+            failed_attempts = result.attempts - result.rate_limited_attempts
+            if failed_attempts > self.max_retries:
+                return None
+            return self.__BACKOFF_BASE_SECONDS * 2 ** (failed_attempts - 1)
+        except Exception as error:
+            result.retryable = False
+            result.error = str(error)
+            return None
+
+    async def __work(
+        self,
+        ready_chats: asyncio.Queue,
+        chat_notifications: Dict[str, Deque[Tuple[int, Notification]]],
+        results: List[Optional[DeliveryResult]],
+    ):
+        """
+        Sends the next notification of the chats that are ready, until every notification is done.
+
+        A chat is in the ready queue at most once, so its notifications are sent one at a time and in order.
+        Once a notification is done, the chat is queued again when its bucket has a token, instead of a worker
+        waiting for it, so that the workers are spread over all chats with notifications
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            chat_id = await ready_chats.get()
+            if chat_id is None:
+                return
+
+            position, notification = chat_notifications[chat_id][0]
+            if results[position] is None:
+                results[position] = DeliveryResult(
+                    receiver_chat_id=notification.receiver_chat_id, reference=notification.reference, status="failed"
+                )
+            result = results[position]
+
+            retry_seconds = await self.__attempt(notification, result)
+            if retry_seconds is None:
+                notify_sends_total.labels(status=result.status).inc()
+                if result.status != "sent":
+                    self.logging_service.log_error(
+                        message=f"Failed to deliver notification: {result.model_dump()}", module=LOGGING_MODULE
+                    )
+
+                chat_notifications[chat_id].popleft()
+                if len(chat_notifications[chat_id]) == 0:
+                    del chat_notifications[chat_id]
+                    if len(chat_notifications) == 0:
+                        # the last notification is done, every worker stops
+                        for _ in range(self.workers):
+                            ready_chats.put_nowait(None)
+                    continue
+                retry_seconds = 0
+
+            delay_seconds = max(retry_seconds, self.__get_chat_bucket(chat_id).get_wait_seconds())
+            if delay_seconds > 0:
+                loop.call_later(delay_seconds, ready_chats.put_nowait, chat_id)
+            else:
+                ready_chats.put_nowait(chat_id)
+
+    async def dispatch(self, notifications: List[Notification]) -> List[DeliveryResult]:
+        """
+        Sends the notifications at the maximum rate allowed by Telegram.
+        Notifications to the same chat are sent in order, notifications to different chats are interleaved
+
+        Returns:
+        the delivery result of each notification, in the same order as the notifications
+        """
+        results: List[Optional[DeliveryResult]] = [None] * len(notifications)
+        if len(notifications) == 0:
+            return results
+
+        chat_notifications: Dict[str, Deque[Tuple[int, Notification]]] = {}
+        for position, notification in enumerate(notifications):
+            chat_notifications.setdefault(notification.receiver_chat_id, deque()).append((position, notification))
+
+        ready_chats = asyncio.Queue()
+        for chat_id in chat_notifications:
+            ready_chats.put_nowait(chat_id)
+
+        workers = [
+            asyncio.create_task(
+                self.__work(ready_chats=ready_chats, chat_notifications=chat_notifications, results=results)
+            )
+            for _ in range(self.workers)
+        ]
+        await asyncio.gather(*workers)
+
+        return results
+
+
+shared_dispatch_service: Optional[DispatchService] = None
+
+
+def get_dispatch_service() -> DispatchService:
+    """
+    returns the dispatch service shared by the whole process, created on first use.
+    Its token buckets and RetryAfter pauses carry over from one notify cycle to the next
+    """
+    global shared_dispatch_service
+
+    if shared_dispatch_service is None:
+        shared_dispatch_service = DispatchService()
+
+    return shared_dispatch_service
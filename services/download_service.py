@@ -1,37 +1,183 @@
+import asyncio
 import os
-from typing import Optional
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
 
-import dotenv
 import telethon
+from pydantic import BaseModel, Field
+from telethon import events
+from telethon.errors import FloodWaitError
 from telethon.sessions import StringSession
+from telethon.tl.functions.channels import JoinChannelRequest
 
+from database_connector.database_client import BulkResponse
 from services.channel_service import Channel, ChannelService
 from services.logging_service import LoggingService
 from services.message_service import Message, MessageService
+from services.metrics_service import (
+    download_channel_duration_seconds,
+    download_flood_wait_seconds_total,
+    download_messages_total,
+)
+from services.subscriber_service import SubscriberService
+from services.subscription_service import (
+    MATCH_MODE_MEMORY,
+    MATCH_MODE_PERCOLATOR,
+    SubscriptionService,
+    env_match_mode,
+)
+from utils.config import load_config
+from utils.date_helper import parse_iso_datetime
+from utils.fingerprint import NearDuplicateIndex, get_content_hash, get_simhash, normalize_text
+from utils.keyword_matcher import KeywordMatcher
 
-dotenv.load_dotenv()
+load_config()
 env_api_id = os.getenv("ENV_TG_API_ID") or ""
 env_api_hash = os.getenv("ENV_TG_API_HASH") or ""
 env_string_session = os.getenv("ENV_TG_STRING_SESSION") or ""
+env_download_concurrency = int(os.getenv("ENV_DOWNLOAD_CONCURRENCY") or 5)
+env_download_channel_timeout_seconds = float(os.getenv("ENV_DOWNLOAD_CHANNEL_TIMEOUT_SECONDS") or 300)
+env_download_chunk_size = int(os.getenv("ENV_DOWNLOAD_CHUNK_SIZE") or 100)
+env_keyword_matcher_sync_seconds = float(os.getenv("ENV_KEYWORD_MATCHER_SYNC_SECONDS") or 60)
+env_stream_flush_seconds = float(os.getenv("ENV_STREAM_FLUSH_SECONDS") or 1)
+env_dedup_enabled = (os.getenv("ENV_DEDUP_ENABLED") or "false").lower() == "true"
+env_dedup_window_hours = float(os.getenv("ENV_DEDUP_WINDOW_HOURS") or 48)
+env_dedup_max_distance = int(os.getenv("ENV_DEDUP_MAX_DISTANCE") or 6)  # max differing SimHash bits of duplicates
 LOGGING_MODULE = "DOWNLOAD-SERVICE"
+MAX_RESULT_MESSAGE_DATES = 1_000  # dates of the latest messages kept in a download result, for the poll schedule
+
+
+class ChannelDownloadResult(BaseModel):
+    channel_id: str
+    status: str  # one of "success", "timeout" or "error"
+    messages_downloaded: int = 0
+    flood_wait_seconds: int = 0
+    duration_seconds: float = 0
+    error: Optional[str] = None
+    # dates of the latest downloaded messages, left out of the logged result
+    message_dates: List[datetime] = Field(default_factory=list, exclude=True)
 
 
 class DownloadService:
+    __MAX_FLOOD_WAIT_RETRIES = 3
+
     def __init__(self, api_id=None, api_hash=None):
         self.logging_service = LoggingService()
         self.api_id = api_id if api_id is not None else env_api_id
         self.api_hash = api_hash if api_hash is not None else env_api_hash
-        # using string session to authenticate instead of anon, skip the login process
+        # using string session to authenticate instead of anon, skip the login process.
+        # The client is connected by connect, since starting it inside a running event loop must be awaited
         self.client = telethon.TelegramClient(
             StringSession(env_string_session), api_id=self.api_id, api_hash=self.api_hash
-        ).start()
+        )
+        self.__connect_task: Optional[asyncio.Future] = None
+        self.keyword_matcher = KeywordMatcher()
+        self.__keyword_matcher_synced_at = None
+        self.duplicate_index: Optional[NearDuplicateIndex] = None  # loaded from the database on first use
+        # streaming ingest state
+        self.__watched_channels: Dict[int, Channel] = {}  # telegram peer id -> watched channel
+        self.__channel_offsets: Dict[str, int] = {}  # channel id -> last stored offset id known to this process
+        self.__stream_buffer: Dict[str, list] = {}  # channel id -> new messages waiting to be stored
+        self.__stream_flush_event: Optional[asyncio.Event] = None
+        self.__is_handler_registered = False
+        # called with the themes of every batch of newly stored messages, e.g. to trigger notification
+        self.messages_stored_listener: Optional[Callable[[List[str]], None]] = None
+        # batches are stored in worker threads, the duplicate index and keyword matcher are updated one at a time
+        self.__match_lock = threading.Lock()
+        self.__offset_lock = threading.Lock()
+
+    async def connect(self):
+        """
+        Starts the telegram client, once. Callers that connect concurrently wait for the same start
+        """
+        if self.__connect_task is None:
+            self.__connect_task = asyncio.ensure_future(self.client.start())
+        await self.__connect_task
+
+    def __sync_keyword_matcher(self):
+        """
+        Updates the in-process keyword matcher with the keywords of the subscribed subscribers.
+        Subscribers are read at most once every ENV_KEYWORD_MATCHER_SYNC_SECONDS
+        """
+        now = time.monotonic()
+        if (
+            self.__keyword_matcher_synced_at is not None
+            and now - self.__keyword_matcher_synced_at < env_keyword_matcher_sync_seconds
+        ):
+            return
+
+        subscriptions = {}
+        for subscriber in SubscriberService().get_subscribers(is_subscribed=True):
+            for subscribed_theme in subscriber["subscribed_themes"]:
+                subscription_id = SubscriptionService.get_subscription_id(subscriber["id"], subscribed_theme["theme"])
+                subscriptions[subscription_id] = (subscribed_theme["theme"], subscribed_theme["keywords"])
+
+        self.keyword_matcher.sync(subscriptions)
+        self.__keyword_matcher_synced_at = now
+
+    def __load_duplicate_index(self) -> NearDuplicateIndex:
+        """
+        Creates the near duplicate index on first use, with the canonical messages stored within the window
+        """
+        if self.duplicate_index is not None:
+            return self.duplicate_index
+
+        window = timedelta(hours=env_dedup_window_hours)
+        duplicate_index = NearDuplicateIndex(window=window, max_distance=env_dedup_max_distance)
+        iso_date_from = (datetime.now(timezone.utc) - window).isoformat()
+        for message in MessageService().iter_recent_fingerprints(iso_date_from=iso_date_from):
+            duplicate_index.add(
+                message_id=message["id"],
+                content_hash=message["fingerprint"],
+                simhash=int(message["simhash"], 16) if message.get("simhash") else None,
+                timestamp=parse_iso_datetime(message["timestamp"]),
+                themes=message["themes"],
+            )
+
+        self.duplicate_index = duplicate_index
+        return duplicate_index
+
+    def __mark_duplicates(self, documents: List[Message]):
+        """
+        Fingerprints the messages and marks those with the same content and themes as an earlier message
+        of any channel within the window. Duplicates keep a reference to the canonical message instead of their text
+        """
+        duplicate_index = self.__load_duplicate_index()
 
-    async def __fetch_messages_from_channel(self, channel_id: str, offset_id: Optional[int] = None):
-        """Retrieves messages from a telegram channel later than an offset id.
+        for document in documents:
+            words = normalize_text(document.text)
+            content_hash = get_content_hash(words)
+            simhash = get_simhash(words)
+            document.fingerprint = content_hash
+            document.simhash = None if simhash is None else format(simhash, "016x")
+
+            canonical_message_id = duplicate_index.find_duplicate(
+                content_hash=content_hash, simhash=simhash, timestamp=document.timestamp, themes=document.themes
+            )
+            if canonical_message_id is not None and canonical_message_id != document.message_id:
+                document.duplicate_of = canonical_message_id
+                document.text = None
+                continue
+
+            duplicate_index.add(
+                message_id=document.message_id,
+                content_hash=content_hash,
+                simhash=simhash,
+                timestamp=document.timestamp,
+                themes=document.themes,
+            )
+
+    async def __iter_message_chunks(self, channel_id: str, offset_id: Optional[int] = None, chunk_size: int = 100):
+        """Streams messages from a telegram channel later than an offset id, in chunks of chunk_size messages.
 
         If the offset id is not provided, it will retrieve the latest 100 messages from the channel
 
-        Returns a list of messages
+        Raises:
+        FloodWaitError - when Telegram rate limits the client for longer than the client's flood sleep threshold
+
+        Yields lists of at most chunk_size messages
         """
         try:
             MESSAGE_SIZE_FOR_NEW_CHANNELS = 100
@@ -39,37 +185,42 @@ class DownloadService:
 
             if offset_id is None:
                 # retrieving back latest 100 messages for new channels.
-                return await self.client.get_messages(
-                    channel,
-                    limit=MESSAGE_SIZE_FOR_NEW_CHANNELS,
-                )
+                messages = self.client.iter_messages(channel, limit=MESSAGE_SIZE_FOR_NEW_CHANNELS)
+            else:
+                # retrieve messages later than a given offset_id, oldest first
+                messages = self.client.iter_messages(channel, limit=None, offset_id=offset_id, reverse=True)
+
+            chunk = []
+            async for message in messages:
+                chunk.append(message)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
 
-            # retrieve messages later than a given offset_id
-            return await self.client.get_messages(channel, limit=None, offset_id=offset_id, reverse=True)
+            if len(chunk) > 0:
+                yield chunk
+        except FloodWaitError:
+            raise  # handled by the caller, which only pauses the affected channel
         except Exception as error:
             error_content = {"channel_id": channel_id, "offset_id": offset_id, "error": str(error)}
             self.logging_service.log_error(
                 message=f"Failed to fetch message from channel: {error_content}", module=LOGGING_MODULE
             )
+            raise
 
-    async def download_messages_from_channel(self, channel: Channel):
-        """Downloads messages from a telegram channel and ingests to the database
+    def __store_messages(self, channel_id: str, themes: List[str], messages: list) -> Tuple[int, BulkResponse]:
+        """Matches and stores a batch of telegram messages of a channel. Blocking, it is run in a worker thread
 
-        If the offset id is not provided, it will download the latest 100 messages from the channel
+        Returns the largest message id of the batch and the bulk response of the store
         """
-        channel_service = ChannelService()
         message_service = MessageService()
-        channel_id = channel["id"]
-        offset_id = channel["offset_id"]
-        themes = channel["themes"]
-
-        max_message_id = -1  # to set as the new offset id
-        messages = await self.__fetch_messages_from_channel(channel_id=channel_id, offset_id=offset_id)
+        documents = []
+        max_message_id = -1
 
         for message in messages:
             # message id is unique to their own channels only. Need to combine with channel_id to create a unique ID
             message_id = int(message.id)
-            max_message_id = max(message_id, max_message_id)  # the latest message id in the channel will be the largest
+            max_message_id = max(message_id, max_message_id)  # the latest message id in the channel is the largest
             document_id = ("-").join([channel_id, str(message_id)])
             document = Message(
                 text=message.text,
@@ -78,14 +229,285 @@ class DownloadService:
                 channel_id=channel_id,
                 message_id=document_id,
             )
+            documents.append(document)
+
+        if env_dedup_enabled:
+            with self.__match_lock:
+                self.__mark_duplicates(documents)
+
+        # match the batch against all subscriptions once, before it is stored. Duplicates are not matched
+        canonical_documents = [document for document in documents if document.duplicate_of is None]
+        if env_match_mode == MATCH_MODE_PERCOLATOR and len(canonical_documents) > 0:
+            matched_subscriptions = SubscriptionService().match_messages(messages=canonical_documents)
+            for document, subscriptions in zip(canonical_documents, matched_subscriptions):
+                document.subscriptions = subscriptions
+
+        if env_match_mode == MATCH_MODE_MEMORY:
+            with self.__match_lock:
+                self.__sync_keyword_matcher()
+                for document in canonical_documents:
+                    document.subscriptions = self.keyword_matcher.match(text=document.text, themes=document.themes)
+
+        download_messages_total.labels(channel_id=channel_id).inc(len(messages))
+        bulk_response = message_service.create_messages(messages=documents)
+        log_content = {"channel_id": channel_id, **bulk_response.model_dump()}
+        self.logging_service.log_info(message=f"Ingested messages from channel: {log_content}", module=LOGGING_MODULE)
+
+        return max_message_id, bulk_response
+
+    async def __store_messages_in_thread(self, channel_id: str, themes: List[str], messages: list) -> int:
+        """Matches and stores a batch of telegram messages of a channel without blocking the event loop
+
+        Raises:
+        RuntimeError - when some messages could not be stored
+
+        Returns the largest message id of the batch
+        """
+        max_message_id, bulk_response = await asyncio.to_thread(
+            self.__store_messages, channel_id=channel_id, themes=themes, messages=messages
+        )
+
+        # the listener is called in the event loop, it may use asyncio objects
+        if bulk_response.created > 0 and self.messages_stored_listener is not None:
+            self.messages_stored_listener(themes)
+
+        if bulk_response.errors > 0:
+            raise RuntimeError(f"Failed to store {bulk_response.errors} messages from channel {channel_id}")
+
+        return max_message_id
+
+    def __write_channel_offset(self, channel_id: str, offset_id: int):
+        with self.__offset_lock:
+            # a later offset of the channel was set meanwhile, it is written instead
+            if offset_id < self.__channel_offsets.get(channel_id, -1):
+                return
+            ChannelService().update_channel_offset(channel_id=channel_id, new_offset_id=offset_id)
+
+    async def __update_channel_offset(self, channel_id: str, offset_id: int):
+        """stores the new offset id of a channel, offsets never move backwards"""
+        if offset_id <= self.__channel_offsets.get(channel_id, -1):
+            return
+
+        self.__channel_offsets[channel_id] = offset_id
+        await asyncio.to_thread(self.__write_channel_offset, channel_id=channel_id, offset_id=offset_id)
+
+    async def download_messages_from_channel(
+        self, channel: Channel, chunk_size: Optional[int] = None, result: Optional[ChannelDownloadResult] = None
+    ):
+        """Downloads messages from a telegram channel and ingests to the database
 
-            message_service.create_message(
-                message=document,
+        If the offset id is not provided, it will download the latest 100 messages from the channel
+
+        Messages are streamed and stored in chunks of chunk_size messages. The channel offset id is advanced
+        after each chunk is stored, so an interrupted download resumes from the last stored chunk
+
+        result (optional) - download result updated after each stored chunk with the number of downloaded messages
+        and the dates of the latest MAX_RESULT_MESSAGE_DATES messages, so that the progress of an interrupted
+        download is kept
+
+        Returns the number of messages downloaded from the channel
+        """
+        channel_id = channel["id"]
+        offset_id = channel["offset_id"]
+        themes = channel["themes"]
+        chunk_size = chunk_size or env_download_chunk_size
+
+        messages_downloaded = 0
+        if offset_id is not None:
+            self.__channel_offsets[channel_id] = max(int(offset_id), self.__channel_offsets.get(channel_id, -1))
+
+        async for messages in self.__iter_message_chunks(
+            channel_id=channel_id, offset_id=offset_id, chunk_size=chunk_size
+        ):
+            # raises without advancing the offset id, the next download retries from the last stored chunk
+            max_message_id = await self.__store_messages_in_thread(
+                channel_id=channel_id, themes=themes, messages=messages
             )
 
-        # for future crawl to use this offset_id for messages after this
-        if max_message_id != -1:
-            channel_service.update_channel_offset(channel_id=channel_id, new_offset_id=max_message_id)
+            messages_downloaded += len(messages)
+            if result is not None:
+                result.messages_downloaded += len(messages)
+                result.message_dates.extend(message.date for message in messages)
+                del result.message_dates[:-MAX_RESULT_MESSAGE_DATES]
+            # for future crawl to use this offset_id for messages after this
+            await self.__update_channel_offset(channel_id=channel_id, offset_id=max_message_id)
+
+        return messages_downloaded
+
+    async def __download_channel_with_limits(
+        self, channel: Channel, semaphore: asyncio.Semaphore, timeout_seconds: float
+    ) -> ChannelDownloadResult:
+        """Downloads a single channel while holding a slot of the semaphore.
+
+        On a FloodWaitError, the slot is released while waiting so that other channels can continue downloading
+        """
+        channel_id = channel["id"]
+        result = ChannelDownloadResult(channel_id=channel_id, status="success")
+        start_time = time.monotonic()
+
+        for _ in range(self.__MAX_FLOOD_WAIT_RETRIES + 1):
+            try:
+                # a retry resumes after the chunks already stored, instead of fetching them again
+                offset_id = self.__channel_offsets.get(channel_id, channel["offset_id"])
+                async with semaphore:
+                    await asyncio.wait_for(
+                        self.download_messages_from_channel(channel={**channel, "offset_id": offset_id}, result=result),
+                        timeout=timeout_seconds,
+                    )
+                break
+            except FloodWaitError as error:
+                result.flood_wait_seconds += error.seconds
+                download_flood_wait_seconds_total.labels(channel_id=channel_id).inc(error.seconds)
+                log_content = {"channel_id": channel_id, "wait_seconds": error.seconds}
+                self.logging_service.log_info(
+                    message=f"Flood wait on channel, pausing channel download: {log_content}", module=LOGGING_MODULE
+                )
+                await asyncio.sleep(error.seconds)
+            except asyncio.TimeoutError:
+                result.status = "timeout"
+                result.error = f"Channel download exceeded {timeout_seconds} seconds"
+                break
+            except Exception as error:
+                result.status = "error"
+                result.error = str(error)
+                break
+        else:
+            result.status = "error"
+            result.error = "Exceeded maximum flood wait retries"
+
+        result.duration_seconds = round(time.monotonic() - start_time, 3)
+        download_channel_duration_seconds.labels(status=result.status).observe(time.monotonic() - start_time)
+        return result
+
+    async def download_messages_from_channels(
+        self,
+        channels: List[Channel],
+        concurrency: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+    ) -> List[ChannelDownloadResult]:
+        """Downloads messages from multiple telegram channels concurrently
+
+        Parameters:
+        channels - channels to download messages from
+
+        concurrency (optional) - maximum number of channels downloading at the same time
+
+        timeout_seconds (optional) - maximum duration of a single channel download
+
+        Returns:
+        a download result for each channel, in the same order as the channels
+        """
+        concurrency = concurrency or env_download_concurrency
+        timeout_seconds = timeout_seconds or env_download_channel_timeout_seconds
+        semaphore = asyncio.Semaphore(concurrency)
+
+        tasks = [
+            self.__download_channel_with_limits(channel=channel, semaphore=semaphore, timeout_seconds=timeout_seconds)
+            for channel in channels
+        ]
+        return await asyncio.gather(*tasks)
+
+    async def watch_channels(self, channels: List[Channel]):
+        """Subscribes to the new messages of the channels, replacing the previously watched channels.
+
+        Telegram only sends new message updates of channels the account has joined,
+        so channels that were not joined yet are joined
+        """
+        watched_channels = {}
+
+        for channel in channels:
+            try:
+                entity = await self.client.get_entity(channel["id"])
+                if getattr(entity, "left", False):
+                    await self.client(JoinChannelRequest(entity))
+                watched_channels[telethon.utils.get_peer_id(entity)] = channel
+                if channel["offset_id"] is not None:
+                    self.__channel_offsets[channel["id"]] = max(
+                        int(channel["offset_id"]), self.__channel_offsets.get(channel["id"], -1)
+                    )
+            except Exception as error:
+                error_content = {"channel_id": channel["id"], "error": str(error)}
+                self.logging_service.log_error(
+                    message=f"Failed to watch channel: {error_content}", module=LOGGING_MODULE
+                )
+
+        self.__watched_channels = watched_channels
+        if not self.__is_handler_registered:
+            self.client.add_event_handler(self.__handle_new_message, events.NewMessage())
+            self.__is_handler_registered = True
+
+    async def __handle_new_message(self, event):
+        channel = self.__watched_channels.get(event.chat_id)
+        if channel is None:
+            return
+
+        buffer = self.__stream_buffer.setdefault(channel["id"], [])
+        buffer.append(event.message)
+        if len(buffer) >= env_download_chunk_size and self.__stream_flush_event is not None:
+            self.__stream_flush_event.set()
+
+    async def __flush_stream_buffer(self):
+        """
+        Stores the buffered new messages of every watched channel. Messages that failed to store are kept
+        in the buffer and retried on the next flush
+        """
+        channels = {channel["id"]: channel for channel in self.__watched_channels.values()}
+
+        for channel_id in list(self.__stream_buffer.keys()):
+            messages = self.__stream_buffer.pop(channel_id)
+            if len(messages) == 0 or channel_id not in channels:
+                continue
+
+            try:
+                max_message_id = await self.__store_messages_in_thread(
+                    channel_id=channel_id, themes=channels[channel_id]["themes"], messages=messages
+                )
+            except Exception as error:
+                self.__stream_buffer[channel_id] = messages + self.__stream_buffer.get(channel_id, [])
+                error_content = {"channel_id": channel_id, "error": str(error)}
+                self.logging_service.log_error(
+                    message=f"Failed to store streamed messages: {error_content}", module=LOGGING_MODULE
+                )
+                continue
+
+            # the offset is only advanced when no message was missed since the last stored message,
+            # otherwise the polling sweep downloads the gap and advances it
+            offset_id = self.__channel_offsets.get(channel_id)
+            if offset_id is not None and min(int(message.id) for message in messages) <= offset_id + 1:
+                await self.__update_channel_offset(channel_id=channel_id, offset_id=max_message_id)
+
+    async def stream_messages(self, flush_seconds: Optional[float] = None):
+        """Stores the new messages of the watched channels as they arrive, until cancelled
+
+        Parameters:
+        flush_seconds (optional) - maximum time new messages wait in the buffer before they are stored together.
+        The buffer is stored earlier when a channel has ENV_DOWNLOAD_CHUNK_SIZE messages waiting
+        """
+        flush_seconds = flush_seconds or env_stream_flush_seconds
+        self.__stream_flush_event = asyncio.Event()
+
+        while True:
+            try:
+                await asyncio.wait_for(self.__stream_flush_event.wait(), timeout=flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+            self.__stream_flush_event.clear()
+            await self.__flush_stream_buffer()
+
+
+shared_download_service: Optional[DownloadService] = None
+
+
+async def get_download_service() -> DownloadService:
+    """
+    returns the download service shared by the whole process, created and connected on first use,
+    so commands that do not download never connect
+    """
+    global shared_download_service
 
+    if shared_download_service is None:
+        shared_download_service = DownloadService()
+    await shared_download_service.connect()
 
-download_service = DownloadService()
+    return shared_download_service
@@ -1,35 +1,252 @@
-from utils import date_helper
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
 from abc import ABC
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import load_config
+
+load_config()
+
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LOG_FORMAT_TEXT = "text"
+LOG_FORMAT_JSON = "json"
+
+env_log_level = LOG_LEVELS.get((os.getenv("ENV_LOG_LEVEL") or "INFO").upper(), LOG_LEVELS["INFO"])
+env_log_format = (os.getenv("ENV_LOG_FORMAT") or LOG_FORMAT_TEXT).lower()
+env_log_queue_size = int(os.getenv("ENV_LOG_QUEUE_SIZE") or 10_000)
+# info and debug lines allowed per second and module, with bursts of twice the rate. 0 disables the limit
+env_log_info_rate_per_second = float(os.getenv("ENV_LOG_INFO_RATE_PER_SECOND") or 50)
+# seconds between the reports of the lines suppressed by the rate limit or dropped on a full queue
+SUPPRESSED_REPORT_INTERVAL_SECONDS = 10
+
+
+def format_record(record: Tuple[float, str, str, str, Optional[dict]], log_format: str) -> str:
+    """
+    Formats a record (created_at, level, module, message, fields) as a line of text,
+    "2023-01-01T00:00:00Z |INFO| app[MODULE]: message {fields}", or as a JSON object
+    """
+    created_at, level, module, message, fields = record
+    timestamp = datetime.fromtimestamp(created_at, tz=timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds")
+    timestamp = timestamp + "Z"
+
+    if log_format == LOG_FORMAT_JSON:
+        line = {"timestamp": timestamp, "level": level, "module": module, "message": message}
+        if fields:
+            line.update(fields)
+        return json.dumps(line, default=str)
+
+    line = f"{timestamp} |{level}| app[{module}]: {message}"
+    if fields:
+        line = f"{line} {json.dumps(fields, default=str)}"
+    return line
+
+
+class RateLimiter:
+    """
+    Token bucket per module, refilled at rate_per_second up to twice the rate.
+    Counts the lines it suppressed, which are reported by the log writer
+    """
+
+    def __init__(self, rate_per_second: float):
+        self.rate_per_second = rate_per_second
+        self.capacity = max(1.0, rate_per_second * 2)
+        self.__buckets: Dict[str, List[float]] = {}  # module: [tokens, updated_at]
+        self.__suppressed: Dict[str, int] = {}
+        self.__lock = threading.Lock()
+
+    def allow(self, module: str) -> bool:
+        if self.rate_per_second <= 0:
+            return True
+
+        now = time.monotonic()
+        with self.__lock:
+            bucket = self.__buckets.get(module)
+            if bucket is None:
+                bucket = self.__buckets[module] = [self.capacity, now]
+
+            bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate_per_second)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+
+            self.__suppressed[module] = self.__suppressed.get(module, 0) + 1
+            return False
+
+    def pop_suppressed(self) -> Dict[str, int]:
+        """returns the number of suppressed lines by module since the last call"""
+        with self.__lock:
+            suppressed, self.__suppressed = self.__suppressed, {}
+        return suppressed
+
+
+class LogWriter:
+    """
+    Writes the log records from a bounded queue to the standard output in a background thread,
+    so that a slow standard output never blocks the callers. Records are dropped, and counted,
+    when the queue is full
+    """
+
+    def __init__(self, queue_size: int, log_format: str, rate_limiter: RateLimiter):
+        self.log_format = log_format
+        self.rate_limiter = rate_limiter
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__dropped = 0
+        self.__lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+
+    def __start(self):
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__thread = threading.Thread(target=self.__work, name="log-writer", daemon=True)
+            self.__thread.start()
+            atexit.register(self.flush)
+
+    def put(self, record: Tuple[float, str, str, str, Optional[dict]]):
+        if self.__thread is None:
+            self.__start()
+
+        try:
+            self.__queue.put_nowait(record)
+        except queue.Full:
+            with self.__lock:
+                self.__dropped += 1
+
+    def flush(self):
+        """blocks until the records queued so far, and the report of the suppressed records, are written"""
+        if self.__thread is not None and self.__thread.is_alive():
+            self.__queue.join()
+
+        suppressed_records = self.__get_suppressed_records()
+        if len(suppressed_records) > 0:
+            self.__write(suppressed_records)
+
+    def __get_suppressed_records(self) -> list:
+        records = []
+        created_at = time.time()
+        for module, count in self.rate_limiter.pop_suppressed().items():
+            records.append((created_at, "WARNING", module, "Suppressed lines over the rate limit", {"count": count}))
+
+        with self.__lock:
+            dropped, self.__dropped = self.__dropped, 0
+        if dropped > 0:
+            records.append((created_at, "WARNING", "LOGGING", "Dropped log lines on a full queue", {"count": dropped}))
+
+        return records
+
+    def __write(self, records: list):
+        try:
+            sys.stdout.write("".join(format_record(record, self.log_format) + "\n" for record in records))
+            sys.stdout.flush()
+        except Exception:
+            pass
+
+    def __work(self):
+        reported_at = time.monotonic()
+        while True:
+            records = []
+            try:
+                records.append(self.__queue.get(timeout=1))
+                # writes the records that are already queued at once
+                while len(records) < 1_000:
+                    records.append(self.__queue.get_nowait())
+            except queue.Empty:
+                pass
+            queued_count = len(records)
+
+            if time.monotonic() - reported_at >= SUPPRESSED_REPORT_INTERVAL_SECONDS:
+                reported_at = time.monotonic()
+                records.extend(self.__get_suppressed_records())
+
+            if len(records) > 0:
+                self.__write(records)
+            for _ in range(queued_count):
+                self.__queue.task_done()
+
+
+shared_log_writer = LogWriter(
+    queue_size=env_log_queue_size,
+    log_format=env_log_format,
+    rate_limiter=RateLimiter(env_log_info_rate_per_second),
+)
 
 
 class Logger(ABC):
     """
-    abstract base class for logging methods
+    abstract base class for logging methods.
+    Records below ENV_LOG_LEVEL are discarded before any work is done
     """
 
-    def log(self, module: str, message: str):
-        pass
+    level = "INFO"
+    is_rate_limited = False
+
+    def __init__(self, log_writer: LogWriter = shared_log_writer) -> None:
+        self.log_writer = log_writer
+        self.is_enabled = LOG_LEVELS[self.level] >= env_log_level
+
+    def log(self, module: str, message: str, fields: Optional[dict] = None):
+        if not self.is_enabled:
+            return
+        if self.is_rate_limited and not self.log_writer.rate_limiter.allow(module):
+            return
+
+        self.log_writer.put((time.time(), self.level, module, message, fields))
+
+
+class DebugLogger(Logger):
+    level = "DEBUG"
+    is_rate_limited = True
 
 
 class InfoLogger(Logger):
-    def log(self, module: str, message: str):
-        current_date_time = date_helper.get_current_iso_datetime()
-        print(f"{current_date_time} |INFO| app[{module}]: {message}")
+    level = "INFO"
+    is_rate_limited = True
+
+
+class WarningLogger(Logger):
+    level = "WARNING"
 
 
 class ErrorLogger(Logger):
-    def log(self, module: str, message: str):
-        current_date_time = date_helper.get_current_iso_datetime()
-        print(f"{current_date_time} |ERROR| app[{module}]: {message}")
+    level = "ERROR"
 
 
 class LoggingService:
+    """
+    Logs to the standard output through a background writer thread, as text or as JSON (ENV_LOG_FORMAT).
+    Structured data is passed in fields rather than formatted into the message, so that it is serialized
+    by the writer thread. Info and debug lines are rate limited per module (ENV_LOG_INFO_RATE_PER_SECOND)
+    """
+
     def __init__(self) -> None:
+        self.debug_logger = DebugLogger()
         self.info_logger = InfoLogger()
+        self.warning_logger = WarningLogger()
         self.error_logger = ErrorLogger()
 
-    def log_info(self, message: str, module="SYSTEM") -> None:
-        self.info_logger.log(module=module, message=message)
+    def is_debug_enabled(self) -> bool:
+        """to skip building expensive debug messages"""
+        return self.debug_logger.is_enabled
+
+    def log_debug(self, message: str, module="SYSTEM", fields: Optional[dict] = None) -> None:
+        self.debug_logger.log(module=module, message=message, fields=fields)
+
+    def log_info(self, message: str, module="SYSTEM", fields: Optional[dict] = None) -> None:
+        self.info_logger.log(module=module, message=message, fields=fields)
+
+    def log_warning(self, message: str, module="SYSTEM", fields: Optional[dict] = None) -> None:
+        self.warning_logger.log(module=module, message=message, fields=fields)
+
+    def log_error(self, message: str, module="SYSTEM", fields: Optional[dict] = None) -> None:
+        self.error_logger.log(module=module, message=message, fields=fields)
 
-    def log_error(self, message: str, module="SYSTEM") -> None:
-        self.error_logger.log(module=module, message=message)
+    def flush(self) -> None:
+        """blocks until the lines logged so far are written, e.g. before exiting"""
+        shared_log_writer.flush()
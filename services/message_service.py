@@ -1,10 +1,41 @@
-from datetime import datetime
-from typing import List, Optional
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 
 from pydantic import BaseModel
 
-from database_connector.database_client import DatabaseClient
+from database_connector.async_database_client import get_async_database_client
+from database_connector.database_backend import AsyncDatabaseBackend, DatabaseBackend
+from database_connector.database_client import (
+    DB_BACKEND_SQLITE,
+    BulkResponse,
+    env_db_backend,
+    get_database_client,
+)
+from database_connector.query_compiler import (
+    MATCHED_MESSAGES_TEMPLATE,
+    MATCHED_MESSAGES_TEMPLATE_ID,
+    build_matched_messages_template_params,
+    compile_keywords,
+    env_use_search_template,
+)
 from utils import date_helper
+from utils.config import load_config
+
+load_config()
+# messages are written to monthly indices "message-YYYY.MM", created from the message index template
+env_message_partitioning = (os.getenv("ENV_MESSAGE_PARTITIONING") or "false").lower() == "true"
+env_message_retention_months = int(os.getenv("ENV_MESSAGE_RETENTION_MONTHS") or 6)
+# messages stored up to this many days after they were posted are notified, older ones are not searched
+env_late_message_days = float(os.getenv("ENV_LATE_MESSAGE_DAYS") or 7)
+# refresh interval of the indices, stored messages are searchable after it. SQLite writes are searchable at once
+INDEX_REFRESH_SECONDS = 0 if env_db_backend == DB_BACKEND_SQLITE else 1
+MESSAGE_INDEX_ALIAS = "message"  # alias of every message index
+MESSAGE_PARTITION_PREFIX = "message-"
+MESSAGE_PARTITION_PATTERN = re.compile(r"^message-\d{4}\.\d{2}$")
 
 
 class Message(BaseModel):
@@ -13,49 +44,523 @@ class Message(BaseModel):
     channel_id: str
     timestamp: datetime
     message_id: str
+    subscriptions: Optional[List[str]] = None  # subscription ids matched at ingest time
+    fingerprint: Optional[str] = None  # hash of the normalised text, identical for exact duplicates
+    simhash: Optional[str] = None  # hex SimHash of the normalised text, close for near duplicates
+    duplicate_of: Optional[str] = None  # id of the earlier message with the same content
+
+
+class MatchedMessagesQuery(BaseModel):
+    keywords_list: List[str]
+    theme: str
+    iso_date_from: Optional[str] = None  # messages stored after this ingest time are matched
+    iso_date_to: Optional[str] = None  # messages stored up to this ingest time are matched. Defaults to all
+
+
+class IngestTracker:
+    """
+    Assigns the ingest time of every stored batch of messages, and tracks the batches not yet searchable.
+
+    Ingest times are unique milliseconds increasing in the order the stores start, unlike message timestamps,
+    so that an older message stored late, by a concurrent download or a gap filling sweep, is still later than
+    the last notified timestamp. Notification only reads messages up to get_searchable_until,
+    so that it never advances past a batch that is still being stored
+    """
+
+    def __init__(self, refresh_seconds: float = INDEX_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.__last_ingested_at: Optional[datetime] = None
+        self.__searchable_at: Dict[datetime, Optional[float]] = {}  # ingest time: monotonic time, None while storing
+        self.__lock = threading.Lock()
+
+    def __next_ingested_at(self) -> datetime:
+        now = datetime.now(timezone.utc)
+        ingested_at = now.replace(microsecond=now.microsecond // 1_000 * 1_000)
+        if self.__last_ingested_at is not None and ingested_at <= self.__last_ingested_at:
+            ingested_at = self.__last_ingested_at + timedelta(milliseconds=1)
+        self.__last_ingested_at = ingested_at
+        return ingested_at
+
+    def start_store(self) -> datetime:
+        """returns the ingest time of a new batch of messages"""
+        with self.__lock:
+            ingested_at = self.__next_ingested_at()
+            self.__searchable_at[ingested_at] = None
+            return ingested_at
+
+    def end_store(self, ingested_at: datetime):
+        """the batch of the ingest time is stored, also on errors. It is searchable after the refresh interval"""
+        with self.__lock:
+            self.__searchable_at[ingested_at] = time.monotonic() + self.refresh_seconds
+
+    def get_searchable_until(self) -> Tuple[datetime, bool]:
+        """
+        Returns the latest ingest time up to which every stored message is searchable,
+        and whether batches still being stored or refreshed hold it back
+        """
+        with self.__lock:
+            now = time.monotonic()
+            for ingested_at, searchable_at in list(self.__searchable_at.items()):
+                if searchable_at is not None and searchable_at <= now:
+                    del self.__searchable_at[ingested_at]
+
+            if len(self.__searchable_at) > 0:
+                return min(self.__searchable_at) - timedelta(milliseconds=1), True
+
+            # later batches are given later ingest times
+            return self.__next_ingested_at(), False
+
+
+shared_ingest_tracker = IngestTracker()
+
+
+def to_utc_datetime(date: datetime) -> datetime:
+    return date.replace(tzinfo=timezone.utc) if date.tzinfo is None else date.astimezone(timezone.utc)
+
+
+def get_message_partition(timestamp: datetime) -> str:
+    """returns the name of the monthly index storing the messages of the timestamp"""
+    return f"{MESSAGE_PARTITION_PREFIX}{to_utc_datetime(timestamp):%Y.%m}"
+
+
+def get_partitions_from(partitions: List[str], date_from: datetime) -> List[str]:
+    """returns the monthly indices that may store messages later than date_from"""
+    earliest_partition = get_message_partition(date_from)
+    return [
+        partition
+        for partition in partitions
+        if MESSAGE_PARTITION_PATTERN.match(partition) is not None and partition >= earliest_partition
+    ]
+
+
+def get_from_datetime(iso_date_from: Optional[str]) -> datetime:
+    # if timestamp is not provided, messages after today 0000hrs are retrieved
+    return date_helper.parse_iso_datetime(date_helper.get_today_iso_date() if iso_date_from is None else iso_date_from)
+
+
+def get_posted_from_datetime(ingested_from: datetime) -> datetime:
+    """earliest timestamp of the messages stored after ingested_from that are searched"""
+    return ingested_from - timedelta(days=env_late_message_days)
+
+
+def to_message_document(message: Message, ingested_at: datetime) -> dict:
+    document = {
+        "text": message.text,
+        "themes": message.themes,
+        "channel_id": message.channel_id,
+        "timestamp": message.timestamp,
+        "ingested_at": ingested_at,
+        # the monthly index of the message is deleted once all of its messages are past the retention period
+        "deletion_timestamp": date_helper.add_months(
+            to_utc_datetime(message.timestamp), env_message_retention_months + 1
+        ),
+    }
+    for field in ("subscriptions", "fingerprint", "simhash", "duplicate_of"):
+        if getattr(message, field) is not None:
+            document[field] = getattr(message, field)
+
+    return document
+
+
+def build_ingested_range_query(iso_date_from: Optional[str], iso_date_to: Optional[str] = None) -> dict:
+    """
+    matches the messages stored after iso_date_from, up to iso_date_to, and posted at most ENV_LATE_MESSAGE_DAYS
+    before iso_date_from. Messages stored before ingest times were recorded are matched by their timestamp
+    """
+    # if timestamp is not provided, send messages after today 0000hrs
+    # This prevents new subscribers from getting spammed with messages from the dawn of time
+    from_datetime = get_from_datetime(iso_date_from)
+    iso_date_from = date_helper.to_iso_datetime(from_datetime)
+    ingested_range = {"gt": iso_date_from}
+    if iso_date_to is not None:
+        ingested_range["lte"] = iso_date_to
+
+    return {
+        "bool": {
+            "filter": [
+                {"range": {"timestamp": {"gt": date_helper.to_iso_datetime(get_posted_from_datetime(from_datetime))}}}
+            ],
+            "should": [
+                {"range": {"ingested_at": ingested_range}},
+                {
+                    "bool": {
+                        "filter": [{"range": {"timestamp": {"gt": iso_date_from}}}],
+                        "must_not": [{"exists": {"field": "ingested_at"}}],
+                    }
+                },
+            ],
+            "minimum_should_match": 1,
+        }
+    }
+
+
+def get_ingested_datetime(message: dict) -> datetime:
+    """ingest time of a stored message, its timestamp if it was stored before ingest times were recorded"""
+    return date_helper.parse_iso_datetime(message.get("ingested_at") or message["timestamp"])
+
+
+def build_matched_messages_query(
+    keywords_list: List[str], theme: str, iso_date_from: Optional[str], iso_date_to: Optional[str] = None
+) -> dict:
+    return {
+        "bool": {
+            "must": [
+                compile_keywords(keywords_list),
+                {"term": {"themes": {"value": theme}}},
+            ],
+            "filter": [build_ingested_range_query(iso_date_from, iso_date_to)],
+            # duplicates only reference their canonical message, which is notified instead
+            "must_not": [{"exists": {"field": "duplicate_of"}}],
+        }
+    }
 
 
 class MessageService:
-    __INDEX_NAME = "message"
+    __INDEX_NAME = MESSAGE_INDEX_ALIAS
+    __is_template_registered = False  # the search template is stored once per process
+
+    def __init__(self, database_client: Optional[DatabaseBackend] = None):
+        self.database_client = database_client or get_database_client()
+
+    def register_search_template(self) -> bool:
+        """stores the matched messages search template, used by get_matched_messages_many when enabled"""
+        is_registered = self.database_client.put_script(
+            script_id=MATCHED_MESSAGES_TEMPLATE_ID, script=MATCHED_MESSAGES_TEMPLATE
+        )
+        MessageService.__is_template_registered = is_registered
+        return is_registered
+
+    def __get_write_index(self, message: Message) -> str:
+        return get_message_partition(message.timestamp) if env_message_partitioning else self.__INDEX_NAME
+
+    def __get_search_index(self, date_from: datetime) -> Optional[str]:
+        """
+        returns the indices to search for messages later than date_from, or None if no index may have them.
+        Monthly indices older than date_from are not searched
+        """
+        if not env_message_partitioning:
+            return self.__INDEX_NAME
 
-    def __init__(self):
-        self.database_client = DatabaseClient()
+        partitions = self.database_client.get_index_names(f"{MESSAGE_PARTITION_PREFIX}*")
+        partitions = get_partitions_from(partitions=partitions, date_from=date_from)
+        return ",".join(partitions) if len(partitions) > 0 else None
 
     def create_message(self, message: Message):
         """
         ingest a message into the database
         """
-        result = self.database_client.create(
-            index_name=self.__INDEX_NAME,
-            document={
-                "text": message.text,
-                "themes": message.themes,
-                "channel_id": message.channel_id,
-                "timestamp": message.timestamp,
-            },
-            document_id=message.message_id,
-        )
+        ingested_at = shared_ingest_tracker.start_store()
+        try:
+            result = self.database_client.create(
+                index_name=self.__get_write_index(message),
+                document=to_message_document(message, ingested_at),
+                document_id=message.message_id,
+            )
+        finally:
+            shared_ingest_tracker.end_store(ingested_at)
         return result
 
+    def create_messages(self, messages: List[Message], refresh: bool = False) -> BulkResponse:
+        """
+        ingest a list of messages into the database using bulk requests.
+
+        Messages that were already ingested are skipped and counted as conflicts.
+        The messages share one ingest time
+        """
+        ingested_at = shared_ingest_tracker.start_store()
+        index_documents: Dict[str, List[dict]] = {}
+        for message in messages:
+            documents = index_documents.setdefault(self.__get_write_index(message), [])
+            documents.append({**to_message_document(message, ingested_at), "id": message.message_id})
+
+        result = BulkResponse()
+        try:
+            for index_name, documents in index_documents.items():
+                response = self.database_client.bulk_create(index_name=index_name, documents=documents, refresh=refresh)
+                result.created += response.created
+                result.conflicts += response.conflicts
+                result.errors += response.errors
+        finally:
+            shared_ingest_tracker.end_store(ingested_at)
+
+        return result
+
+    def delete_expired_partitions(self, now: Optional[datetime] = None) -> List[str]:
+        """
+        Deletes the monthly indices whose messages are all older than the retention period
+
+        Returns the names of the deleted indices
+        """
+        now = to_utc_datetime(now or datetime.now(timezone.utc))
+        deleted_partitions = []
+
+        for partition in self.database_client.get_index_names(f"{MESSAGE_PARTITION_PREFIX}*"):
+            if MESSAGE_PARTITION_PATTERN.match(partition) is None:
+                continue  # not a monthly message index
+
+            month_start = datetime.strptime(partition[len(MESSAGE_PARTITION_PREFIX) :], "%Y.%m")
+            deletion_datetime = date_helper.add_months(
+                month_start.replace(tzinfo=timezone.utc), env_message_retention_months + 1
+            )
+            if deletion_datetime <= now and self.database_client.delete_index(partition):
+                deleted_partitions.append(partition)
+
+        return deleted_partitions
+
+    def iter_recent_fingerprints(self, iso_date_from: str) -> Iterator[dict]:
+        """
+        yields the fingerprint, simhash, themes and timestamp of the canonical messages stored after a datetime
+        """
+        index_name = self.__get_search_index(date_helper.parse_iso_datetime(iso_date_from))
+        if index_name is None:
+            return
+
+        query = {
+            "bool": {
+                "filter": [
+                    {"exists": {"field": "fingerprint"}},
+                    {"range": {"timestamp": {"gt": iso_date_from}}},
+                ],
+                "must_not": [{"exists": {"field": "duplicate_of"}}],
+            }
+        }
+
+        yield from self.database_client.read_stream(
+            index_name=index_name,
+            query=query,
+            source_fields=["fingerprint", "simhash", "themes", "timestamp"],
+            sort=[{"timestamp": "asc"}, {"_id": "asc"}],
+        )
+
+    def iter_matched_messages(
+        self,
+        keywords_list: List[str],
+        theme: str,
+        iso_date_from: Optional[str] = None,
+        source_fields: Optional[List[str]] = None,
+    ) -> Iterator[dict]:
+        """
+        yields matched messages from the database filtered from the theme keywords and a datetime,
+        without loading them all in memory.
+
+        If the datetime is not provided, it will be set to today at 0000hrs.
+        """
+        index_name = self.__get_search_index(get_posted_from_datetime(get_from_datetime(iso_date_from)))
+        if index_name is None:
+            return
+
+        query = build_matched_messages_query(keywords_list=keywords_list, theme=theme, iso_date_from=iso_date_from)
+
+        yield from self.database_client.read_stream(index_name=index_name, query=query, source_fields=source_fields)
+
     def get_matched_messages(self, keywords_list: List[str], theme: str, iso_date_from: Optional[str] = None):
         """
         retrieves matched messages from the database filtered from the theme keywords and a datetime.
 
         If the datetime is not provided, it will be set to today at 0000hrs.
         """
-        # if timestamp is not provided, send messages after today 0000hrs
-        # This prevents new subscribers from getting spammed with messages from the dawn of time
-        from_datetime = date_helper.get_today_iso_date() if iso_date_from is None else iso_date_from
-        query_string = self.database_client.build_query_string(keywords_list)
+        return list(self.iter_matched_messages(keywords_list=keywords_list, theme=theme, iso_date_from=iso_date_from))
+
+    def get_matched_messages_many(
+        self, queries: List[MatchedMessagesQuery], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """
+        retrieves the matched messages of many theme keywords and datetimes, sending the searches together
+        in multi search requests of batch_size searches.
+
+        Returns the list of matched messages of each query, in the same order as the queries
+        """
+        if len(queries) == 0:
+            return []
+
+        index_name = self.__get_search_index(
+            get_posted_from_datetime(min(get_from_datetime(query.iso_date_from) for query in queries))
+        )
+        if index_name is None:
+            return [[] for _ in queries]
+
+        if env_use_search_template and (MessageService.__is_template_registered or self.register_search_template()):
+            params_list = [
+                build_matched_messages_template_params(
+                    keywords=query.keywords_list,
+                    theme=query.theme,
+                    date_query=build_ingested_range_query(query.iso_date_from, query.iso_date_to),
+                )
+                for query in queries
+            ]
+            return self.database_client.multi_read_template(
+                index_name=index_name,
+                template_id=MATCHED_MESSAGES_TEMPLATE_ID,
+                params_list=params_list,
+                batch_size=batch_size,
+            )
+
+        database_queries = [
+            build_matched_messages_query(
+                keywords_list=query.keywords_list,
+                theme=query.theme,
+                iso_date_from=query.iso_date_from,
+                iso_date_to=query.iso_date_to,
+            )
+            for query in queries
+        ]
+
+        result = self.database_client.multi_read(index_name=index_name, queries=database_queries, batch_size=batch_size)
+        return result
+
+    def get_subscription_matched_messages(
+        self, subscription_dates: Dict[str, Optional[str]], iso_date_to: Optional[str] = None
+    ) -> Dict[str, List[dict]]:
+        """
+        retrieves messages matched to subscriptions at ingest time, using a single search for all subscriptions.
+
+        Parameters:
+        subscription_dates - maps each subscription id to the ISO ingest time after which messages are retrieved.
+        If the datetime is not provided, it will be set to today at 0000hrs.
+
+        iso_date_to (optional) - ISO ingest time up to which messages are retrieved. Defaults to all messages
+
+        Returns:
+        a dict mapping each subscription id to its matched messages
+        """
+        result = {subscription_id: [] for subscription_id in subscription_dates}
+        if len(subscription_dates) == 0:
+            return result
+
+        from_datetimes = {
+            subscription_id: get_from_datetime(iso_date_from)
+            for subscription_id, iso_date_from in subscription_dates.items()
+        }
+        earliest_datetime = min(from_datetimes.values())
+        index_name = self.__get_search_index(get_posted_from_datetime(earliest_datetime))
+        if index_name is None:
+            return result
         query = {
             "bool": {
-                "must": [
-                    {"query_string": {"query": query_string}},
-                    {"term": {"themes": {"value": theme}}},
+                "filter": [
+                    {"terms": {"subscriptions": list(subscription_dates.keys())}},
+                    build_ingested_range_query(date_helper.to_iso_datetime(earliest_datetime), iso_date_to),
                 ],
-                "filter": [{"range": {"timestamp": {"gt": from_datetime}}}],
             }
         }
 
-        result = self.database_client.read(index_name=self.__INDEX_NAME, query=query)
+        messages = self.database_client.read_stream(index_name=index_name, query=query)
+        for message in messages:
+            message_datetime = get_ingested_datetime(message)
+            for subscription_id in message["subscriptions"]:
+                if subscription_id in result and message_datetime > from_datetimes[subscription_id]:
+                    result[subscription_id].append(message)
+
+        return result
+
+
+class AsyncMessageService:
+    """asyncio counterpart of MessageService"""
+
+    __INDEX_NAME = MESSAGE_INDEX_ALIAS
+
+    def __init__(self, database_client: Optional[AsyncDatabaseBackend] = None):
+        self.database_client = database_client or get_async_database_client()
+
+    def __get_write_index(self, message: Message) -> str:
+        return get_message_partition(message.timestamp) if env_message_partitioning else self.__INDEX_NAME
+
+    async def __get_search_index(self, date_from: datetime) -> Optional[str]:
+        """
+        returns the indices to search for messages later than date_from, or None if no index may have them
+        """
+        if not env_message_partitioning:
+            return self.__INDEX_NAME
+
+        partitions = await self.database_client.get_index_names(f"{MESSAGE_PARTITION_PREFIX}*")
+        partitions = get_partitions_from(partitions=partitions, date_from=date_from)
+        return ",".join(partitions) if len(partitions) > 0 else None
+
+    async def create_message(self, message: Message):
+        """
+        ingest a message into the database
+        """
+        ingested_at = shared_ingest_tracker.start_store()
+        try:
+            result = await self.database_client.create(
+                index_name=self.__get_write_index(message),
+                document=to_message_document(message, ingested_at),
+                document_id=message.message_id,
+            )
+        finally:
+            shared_ingest_tracker.end_store(ingested_at)
+        return result
+
+    async def create_messages(self, messages: List[Message], refresh: bool = False) -> BulkResponse:
+        """
+        ingest a list of messages into the database using bulk requests.
+
+        Messages that were already ingested are skipped and counted as conflicts.
+        The messages share one ingest time
+        """
+        ingested_at = shared_ingest_tracker.start_store()
+        index_documents: Dict[str, List[dict]] = {}
+        for message in messages:
+            documents = index_documents.setdefault(self.__get_write_index(message), [])
+            documents.append({**to_message_document(message, ingested_at), "id": message.message_id})
+
+        result = BulkResponse()
+        try:
+            for index_name, documents in index_documents.items():
+                response = await self.database_client.bulk_create(
+                    index_name=index_name, documents=documents, refresh=refresh
+                )
+                result.created += response.created
+                result.conflicts += response.conflicts
+                result.errors += response.errors
+        finally:
+            shared_ingest_tracker.end_store(ingested_at)
+
+        return result
+
+    async def get_matched_messages(self, keywords_list: List[str], theme: str, iso_date_from: Optional[str] = None):
+        """
+        retrieves matched messages from the database filtered from the theme keywords and a datetime.
+
+        If the datetime is not provided, it will be set to today at 0000hrs.
+        """
+        index_name = await self.__get_search_index(get_posted_from_datetime(get_from_datetime(iso_date_from)))
+        if index_name is None:
+            return []
+
+        query = build_matched_messages_query(keywords_list=keywords_list, theme=theme, iso_date_from=iso_date_from)
+
+        result = await self.database_client.read(index_name=index_name, query=query)
+        return result
+
+    async def get_matched_messages_many(
+        self, queries: List[MatchedMessagesQuery], batch_size: Optional[int] = None
+    ) -> List[List[dict]]:
+        """
+        retrieves the matched messages of many theme keywords and datetimes in multi search requests.
+
+        Returns the list of matched messages of each query, in the same order as the queries
+        """
+        if len(queries) == 0:
+            return []
+
+        index_name = await self.__get_search_index(
+            get_posted_from_datetime(min(get_from_datetime(query.iso_date_from) for query in queries))
+        )
+        if index_name is None:
+            return [[] for _ in queries]
+
+        database_queries = [
+            build_matched_messages_query(
+                keywords_list=query.keywords_list,
+                theme=query.theme,
+                iso_date_from=query.iso_date_from,
+                iso_date_to=query.iso_date_to,
+            )
+            for query in queries
+        ]
+
+        result = await self.database_client.multi_read(
+            index_name=index_name, queries=database_queries, batch_size=batch_size
+        )
         return result
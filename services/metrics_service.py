@@ -0,0 +1,74 @@
+import os
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, start_http_server
+
+from services.logging_service import LoggingService
+from utils.config import load_config
+
+load_config()
+env_metrics_port = int(os.getenv("ENV_METRICS_PORT") or 0)  # port of the metrics exporter, 0 disables it
+LOGGING_MODULE = "METRICS-SERVICE"
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# database
+database_request_duration_seconds = Histogram(
+    "sift_database_request_duration_seconds",
+    "Duration of the requests to the database, by operation and index",
+    ["operation", "index"],
+)
+database_request_errors_total = Counter(
+    "sift_database_request_errors_total",
+    "Failed requests to the database, by operation, index and error",
+    ["operation", "index", "error"],
+)
+
+# download
+download_messages_total = Counter(
+    "sift_download_messages_total", "Messages downloaded from Telegram, by channel", ["channel_id"]
+)
+download_channel_duration_seconds = Histogram(
+    "sift_download_channel_duration_seconds",
+    "Duration of the download of a channel, by status",
+    ["status"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+download_flood_wait_seconds_total = Counter(
+    "sift_download_flood_wait_seconds_total", "Seconds waited on Telegram flood waits, by channel", ["channel_id"]
+)
+
+# notify
+notify_cycle_duration_seconds = Histogram(
+    "sift_notify_cycle_duration_seconds",
+    "Duration of a notify cycle",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+notify_matches_total = Counter("sift_notify_matches_total", "Messages matched to a subscribed theme")
+notify_sends_total = Counter("sift_notify_sends_total", "Notifications sent through the bot, by status", ["status"])
+notify_send_duration_seconds = Histogram(
+    "sift_notify_send_duration_seconds", "Duration of a single request to send a notification through the bot"
+)
+
+# telegram bot
+bot_updates_total = Counter("sift_bot_updates_total", "Updates received by the telegram bot, by command", ["command"])
+
+
+def get_metrics() -> bytes:
+    """returns the metrics of the process in the Prometheus text format"""
+    return generate_latest()
+
+
+def start_metrics_exporter(port: Optional[int] = None) -> bool:
+    """
+    Serves the metrics of the process at http://0.0.0.0:<port>/metrics from a background thread,
+    for the processes without an api server. Defaults to ENV_METRICS_PORT
+
+    Returns True if the exporter was started, False if it is disabled
+    """
+    port = port if port is not None else env_metrics_port
+    if port <= 0:
+        return False
+
+    start_http_server(port)
+    LoggingService().log_info(message=f"Serving metrics on port {port}", module=LOGGING_MODULE)
+    return True
@@ -1,18 +1,20 @@
 import os
-
-import dotenv
-import telegram
+from typing import Optional
 
 from services.logging_service import LoggingService
+from utils.config import load_config
 
-dotenv.load_dotenv()
+load_config()
 env_tg_bot_token = os.getenv("ENV_TG_BOT_TOKEN") or ""
 
 
 class NotificationService:
     def __init__(self, bot_boken=None):
         self.bot_token = bot_boken if bot_boken is not None else env_tg_bot_token
-        self.bot = telegram.Bot(token=self.bot_token)
+        # imported here so that processes which never notify do not load the telegram bot library
+        from telegram import Bot
+
+        self.bot = Bot(token=self.bot_token)
         self.logging_service = LoggingService()
 
     def __format_telegram_string(self, string: str) -> str:
@@ -24,14 +26,36 @@ class NotificationService:
         string = string.replace("__", "_")  # italic
         return string
 
-    async def send_message(self, message: str, receiver_chat_id: str):
+    async def deliver_message(self, message: str, receiver_chat_id: str):
         """
         sends a message to the client through the Telegram bot
+
+        Raises:
+        TelegramError - when the message could not be sent, e.g. RetryAfter when the bot is rate limited
+        """
+        formatted_message = self.__format_telegram_string(message)
+        await self.bot.send_message(chat_id=receiver_chat_id, text=formatted_message)
+
+    async def send_message(self, message: str, receiver_chat_id: str):
+        """
+        sends a message to the client through the Telegram bot. Errors are logged and not raised
         """
         try:
-            formatted_message = self.__format_telegram_string(message)
-            await self.bot.send_message(chat_id=receiver_chat_id, text=formatted_message)
+            await self.deliver_message(message, receiver_chat_id)
         except Exception as error:
             self.logging_service.log_error(
                 message=f"Failed to send message through telegram bot: {error}", module="NOTIFICATION-SERVICE"
             )
+
+
+shared_notification_service: Optional[NotificationService] = None
+
+
+def get_notification_service() -> NotificationService:
+    """returns the notification service shared by the whole process, created on first use"""
+    global shared_notification_service
+
+    if shared_notification_service is None:
+        shared_notification_service = NotificationService()
+
+    return shared_notification_service
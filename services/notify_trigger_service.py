@@ -0,0 +1,74 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Iterable, Optional, Set
+
+from services.logging_service import LoggingService
+from utils.config import load_config
+
+load_config()
+env_notify_debounce_seconds = float(os.getenv("ENV_NOTIFY_DEBOUNCE_SECONDS") or 5)
+env_notify_retry_seconds = float(os.getenv("ENV_NOTIFY_RETRY_SECONDS") or 60)
+LOGGING_MODULE = "NOTIFY-TRIGGER-SERVICE"
+
+
+class NotifyTriggerService:
+    """
+    Triggers notification of subscribers when new messages are stored, instead of on a fixed interval.
+
+    The ingest pipeline reports the themes of every stored batch. Themes reported within the debounce window
+    are coalesced into a single notify run covering only those themes. While nothing is ingested,
+    the service waits on its queue without doing any work
+    """
+
+    def __init__(self, debounce_seconds: Optional[float] = None, retry_seconds: Optional[float] = None):
+        self.debounce_seconds = debounce_seconds if debounce_seconds is not None else env_notify_debounce_seconds
+        self.retry_seconds = retry_seconds if retry_seconds is not None else env_notify_retry_seconds
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.logging_service = LoggingService()
+
+    def notify_themes(self, themes: Iterable[str]):
+        """reports themes with new messages. Safe to call from synchronous code running in the event loop"""
+        self.queue.put_nowait(set(themes))
+
+    async def __collect_themes(self) -> Set[str]:
+        """waits for the first reported themes, then collects the themes reported during the debounce window"""
+        themes = set(await self.queue.get())
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.debounce_seconds
+
+        while True:
+            remaining_seconds = deadline - loop.time()
+            if remaining_seconds <= 0:
+                break
+
+            try:
+                themes.update(await asyncio.wait_for(self.queue.get(), timeout=remaining_seconds))
+            except asyncio.TimeoutError:
+                break
+
+        # themes reported while the window was closing belong to the same burst
+        while not self.queue.empty():
+            themes.update(self.queue.get_nowait())
+
+        return themes
+
+    async def run(self, notify: Callable[[Set[str]], Awaitable[Optional[Set[str]]]]):
+        """Runs notify for the reported themes, until cancelled
+
+        Parameters:
+        notify - notifies the subscribers of the given themes, returns the themes to retry later, if any
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            themes = await self.__collect_themes()
+            try:
+                retry_themes = await notify(themes)
+            except Exception as error:
+                self.logging_service.log_error(
+                    message=f"Failed to notify subscribers of themes {sorted(themes)}: {error}", module=LOGGING_MODULE
+                )
+                retry_themes = themes
+
+            if retry_themes:
+                loop.call_later(self.retry_seconds, self.notify_themes, retry_themes)
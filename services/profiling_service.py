@@ -0,0 +1,259 @@
+import asyncio.events
+import cProfile
+import functools
+import glob
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from services.logging_service import LoggingService
+from utils.config import load_config
+
+load_config()
+PROFILE_MODE_SAMPLING = "sampling"  # stacks of the cycle's thread sampled on an interval, written as collapsed stacks
+PROFILE_MODE_DETERMINISTIC = "deterministic"  # cProfile, written as pstats
+env_profile_enabled = (os.getenv("ENV_PROFILE_ENABLED") or "false").lower() == "true"
+env_profile_mode = os.getenv("ENV_PROFILE_MODE") or PROFILE_MODE_SAMPLING
+env_profile_folder = os.getenv("ENV_PROFILE_FOLDER") or "profiles"
+env_profile_sample_interval_ms = float(os.getenv("ENV_PROFILE_SAMPLE_INTERVAL_MS") or 5)
+env_profile_top_functions = int(os.getenv("ENV_PROFILE_TOP_FUNCTIONS") or 20)
+env_profile_keep_cycles = int(os.getenv("ENV_PROFILE_KEEP_CYCLES") or 50)  # profiles kept for each cycle name
+LOGGING_MODULE = "PROFILING-SERVICE"
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# frame of the event loop running a task's step, the root of the sampled stacks of tasks
+EVENT_LOOP_HANDLE_CODE = asyncio.events.Handle._run.__code__
+
+
+def get_frame_label(code) -> str:
+    """name of a function with its file relative to the project or to site-packages, e.g. main.py:156(notify)"""
+    filename = code.co_filename
+    if filename.startswith(ROOT_FOLDER):
+        filename = os.path.relpath(filename, ROOT_FOLDER)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[-1]
+
+    # semicolons separate the frames of collapsed stacks
+    return f"{filename}:{code.co_firstlineno}({code.co_name})".replace(";", ":")
+
+
+class StackSampler:
+    """
+    Samples the stack of a thread from a background thread. When the thread runs an event loop, stacks of tasks
+    start at the task's coroutine, time spent awaiting I/O shows as the event loop's select,
+    and samples include every task running on the loop
+    """
+
+    def __init__(self, thread_id: int, interval_seconds: float):
+        self.thread_id = thread_id
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()  # stacks of frame labels, root first: sample count
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__work, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.__thread.join()
+
+    def __work(self):
+        label_cache: Dict[object, str] = {}
+        while not self.__stopped.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if code is EVENT_LOOP_HANDLE_CODE:
+                    break
+                label = label_cache.get(code)
+                if label is None:
+                    label = label_cache[code] = get_frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+
+            if len(stack) > 0:
+                self.stacks[tuple(reversed(stack))] += 1
+
+
+def get_top_functions(stacks: Counter, top: int) -> List[Tuple[str, int, int]]:
+    """
+    returns the (function, inclusive samples, self samples) of the functions with the most inclusive samples.
+    Recursive functions are counted once per sample
+    """
+    inclusive_samples = Counter()
+    self_samples = Counter()
+    for stack, count in stacks.items():
+        for label in set(stack):
+            inclusive_samples[label] += count
+        self_samples[stack[-1]] += count
+
+    return [(label, count, self_samples[label]) for label, count in inclusive_samples.most_common(top)]
+
+
+class ProfilingService:
+    """
+    Profiles the background cycles, writing an artifact and a summary of the top functions by wall time
+    for each cycle to ENV_PROFILE_FOLDER. Does nothing unless enabled, by ENV_PROFILE_ENABLED or --profile
+    """
+
+    def __init__(
+        self,
+        enabled: bool = env_profile_enabled,
+        mode: str = env_profile_mode,
+        folder: str = env_profile_folder,
+    ):
+        self.enabled = enabled
+        self.mode = mode
+        self.folder = folder
+        self.logging_service = LoggingService()
+        self.__deterministic_lock = threading.Lock()
+
+    def __get_path(self, name: str, started_at: datetime, extension: str) -> str:
+        return os.path.join(self.folder, f"{name}-{started_at.strftime('%Y%m%dT%H%M%S%fZ')}.{extension}")
+
+    def __delete_old_profiles(self, name: str):
+        """keeps the files of the latest ENV_PROFILE_KEEP_CYCLES cycles of the name"""
+        if env_profile_keep_cycles <= 0:
+            return
+
+        paths = sorted(glob.glob(os.path.join(self.folder, f"{name}-*.txt")))
+        for summary_path in paths[:-env_profile_keep_cycles]:
+            for path in glob.glob(os.path.splitext(summary_path)[0] + ".*"):
+                os.remove(path)
+
+    def __write_sampling_profile(
+        self, name: str, started_at: datetime, duration_seconds: float, sampler: StackSampler
+    ) -> str:
+        with open(self.__get_path(name, started_at, "collapsed"), "w") as file:
+            for stack, count in sampler.stacks.items():
+                file.write(f"{';'.join(stack)} {count}\n")
+
+        # the sampling interval is a lower bound, the wall time of a sample is measured over the whole cycle
+        sample_count = sum(sampler.stacks.values())
+        seconds_per_sample = duration_seconds / sample_count if sample_count > 0 else sampler.interval_seconds
+        lines = [
+            f"{name} cycle started at {started_at.isoformat(timespec='seconds')}, took {duration_seconds:.3f}s, "
+            + f"{sample_count} samples every {seconds_per_sample * 1_000:.1f}ms",
+            f"{'wall s':>10} {'self s':>10}  function",
+        ]
+        for label, inclusive, self_count in get_top_functions(sampler.stacks, env_profile_top_functions):
+            lines.append(f"{inclusive * seconds_per_sample:>10.3f} {self_count * seconds_per_sample:>10.3f}  {label}")
+
+        return "\n".join(lines)
+
+    def __write_deterministic_profile(
+        self, name: str, started_at: datetime, duration_seconds: float, profiler: cProfile.Profile
+    ) -> str:
+        profiler.dump_stats(self.__get_path(name, started_at, "pstats"))
+
+        summary = io.StringIO()
+        summary.write(
+            f"{name} cycle started at {started_at.isoformat(timespec='seconds')}, took {duration_seconds:.3f}s\n"
+        )
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(env_profile_top_functions)
+        return summary.getvalue()
+
+    @contextmanager
+    def profile_cycle(self, name: str):
+        """
+        profiles the code run within the context as one cycle of the name, if profiling is enabled.
+        The profile is written when the context exits, also on errors
+
+        Parameters:
+            name: name of the cycle, the prefix of its files, e.g. "notify"
+        """
+        if not self.enabled:
+            yield
+            return
+
+        # cProfile cannot profile overlapping cycles of the same thread, only the first cycle is profiled
+        profiler = None
+        sampler = None
+        if self.mode == PROFILE_MODE_DETERMINISTIC:
+            if self.__deterministic_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+            else:
+                self.logging_service.log_info(
+                    "Skipped profiling of a cycle overlapping a profiled cycle",
+                    module=LOGGING_MODULE,
+                    fields={"name": name},
+                )
+        else:
+            sampler = StackSampler(threading.get_ident(), env_profile_sample_interval_ms / 1_000)
+
+        started_at = datetime.now(timezone.utc)
+        start_time = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        if sampler is not None:
+            sampler.start()
+        try:
+            yield
+        finally:
+            duration_seconds = time.perf_counter() - start_time
+            if profiler is not None:
+                profiler.disable()
+                self.__deterministic_lock.release()
+            if sampler is not None:
+                sampler.stop()
+
+            if profiler is not None or sampler is not None:
+                self.__write_profile(name, started_at, duration_seconds, profiler, sampler)
+
+    def __write_profile(
+        self,
+        name: str,
+        started_at: datetime,
+        duration_seconds: float,
+        profiler: Optional[cProfile.Profile],
+        sampler: Optional[StackSampler],
+    ):
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            if profiler is not None:
+                summary = self.__write_deterministic_profile(name, started_at, duration_seconds, profiler)
+            else:
+                summary = self.__write_sampling_profile(name, started_at, duration_seconds, sampler)
+
+            summary_path = self.__get_path(name, started_at, "txt")
+            with open(summary_path, "w") as file:
+                file.write(summary + "\n")
+            self.__delete_old_profiles(name)
+
+            self.logging_service.log_info(
+                f"Profiled {name} cycle",
+                module=LOGGING_MODULE,
+                fields={"duration_seconds": round(duration_seconds, 3), "summary": summary_path},
+            )
+        except Exception as error:
+            self.logging_service.log_error(
+                message=f"Failed to write the profile of the {name} cycle: {error}", module=LOGGING_MODULE
+            )
+
+    def profiled(self, name: str):
+        """decorator of an async function, profiling each call as one cycle of the name"""
+
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await function(*args, **kwargs)
+
+                with self.profile_cycle(name):
+                    return await function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+shared_profiling_service = ProfilingService()
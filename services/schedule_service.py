@@ -0,0 +1,210 @@
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from services.channel_service import ChannelService
+from services.logging_service import LoggingService
+from utils.config import load_config
+from utils.date_helper import parse_iso_datetime, to_iso_datetime
+
+load_config()
+# poll interval of channels without posting history, and of every channel with the fixed schedule
+env_schedule_default_interval_seconds = float(os.getenv("ENV_SCHEDULE_DEFAULT_INTERVAL_SECONDS") or 60 * 15)
+env_schedule_min_interval_seconds = float(os.getenv("ENV_SCHEDULE_MIN_INTERVAL_SECONDS") or 60 * 2)
+env_schedule_max_interval_seconds = float(os.getenv("ENV_SCHEDULE_MAX_INTERVAL_SECONDS") or 60 * 60 * 6)
+# a channel is polled when this many new messages are expected since its last poll
+env_schedule_messages_per_poll = float(os.getenv("ENV_SCHEDULE_MESSAGES_PER_POLL") or 2)
+env_schedule_ewma_alpha = float(os.getenv("ENV_SCHEDULE_EWMA_ALPHA") or 0.2)  # weight of the latest inter-arrival
+env_schedule_hourly_half_life_days = float(os.getenv("ENV_SCHEDULE_HOURLY_HALF_LIFE_DAYS") or 7)
+LOGGING_MODULE = "SCHEDULE-SERVICE"
+HOURS_PER_DAY = 24
+EMPTY_POLL_BACKOFF = 1.5  # interval multiplier of every consecutive poll without new messages
+MAX_EMPTY_POLL_BACKOFF_STEPS = 6
+
+
+class ChannelSchedule(BaseModel):
+    """posting history of a channel, stored in the "schedule" field of the channel document"""
+
+    ewma_interval_seconds: Optional[float] = None  # moving average of the seconds between two messages
+    hourly_message_counts: List[float] = Field(default_factory=lambda: [0.0] * HOURS_PER_DAY)  # by UTC hour, decayed
+    hourly_updated_timestamp: Optional[str] = None
+    last_message_timestamp: Optional[str] = None
+    empty_polls: int = 0  # consecutive polls without new messages
+    last_poll_timestamp: Optional[str] = None
+    next_poll_timestamp: Optional[str] = None
+
+
+def observe_messages(schedule: ChannelSchedule, message_dates: List[datetime]) -> ChannelSchedule:
+    """
+    Updates the moving average of the inter-arrival times and the hourly counts of a schedule
+    with the dates of new messages. Messages not later than the last observed message are ignored
+
+    Returns the updated schedule
+    """
+    last_message_date = (
+        parse_iso_datetime(schedule.last_message_timestamp) if schedule.last_message_timestamp is not None else None
+    )
+    message_dates = sorted(date for date in message_dates if last_message_date is None or date > last_message_date)
+    if len(message_dates) == 0:
+        return schedule
+
+    # older hourly counts lose half their weight every half life, so that a change of habits is picked up
+    hourly_counts = list(schedule.hourly_message_counts)
+    if schedule.hourly_updated_timestamp is not None:
+        elapsed_days = (message_dates[-1] - parse_iso_datetime(schedule.hourly_updated_timestamp)).total_seconds()
+        elapsed_days = max(0.0, elapsed_days / (60 * 60 * HOURS_PER_DAY))
+        decay = 0.5 ** (elapsed_days / env_schedule_hourly_half_life_days)
+        hourly_counts = [count * decay for count in hourly_counts]
+
+    ewma_interval_seconds = schedule.ewma_interval_seconds
+    for date in message_dates:
+        hourly_counts[date.astimezone(timezone.utc).hour] += 1
+        if last_message_date is not None:
+            interval_seconds = (date - last_message_date).total_seconds()
+            if ewma_interval_seconds is None:
+                ewma_interval_seconds = interval_seconds
+            else:
+                ewma_interval_seconds = (
+                    env_schedule_ewma_alpha * interval_seconds + (1 - env_schedule_ewma_alpha) * ewma_interval_seconds
+                )
+        last_message_date = date
+
+    return schedule.model_copy(
+        update={
+            "ewma_interval_seconds": ewma_interval_seconds,
+            "hourly_message_counts": [round(count, 4) for count in hourly_counts],
+            "hourly_updated_timestamp": to_iso_datetime(message_dates[-1]),
+            "last_message_timestamp": to_iso_datetime(last_message_date),
+        }
+    )
+
+
+def get_hourly_factor(schedule: ChannelSchedule, now: datetime, interval_seconds: float) -> float:
+    """
+    ratio of the posting rate during the hours from now to now + interval, to the average posting rate.
+    The busiest of these hours is used, so that a channel is polled more often ahead of its busy hours.
+    Counts are smoothed with one message per hour, a channel without history has a factor of 1
+    """
+    counts = schedule.hourly_message_counts
+    total = sum(counts) + HOURS_PER_DAY
+    hours = max(1, min(HOURS_PER_DAY, math.ceil(interval_seconds / 3600) + 1))
+    current_hour = now.astimezone(timezone.utc).hour
+    busiest_count = max(counts[(current_hour + offset) % HOURS_PER_DAY] for offset in range(hours))
+    return HOURS_PER_DAY * (busiest_count + 1) / total
+
+
+def get_poll_interval_seconds(schedule: ChannelSchedule, now: datetime) -> float:
+    """
+    Seconds until a channel is expected to have ENV_SCHEDULE_MESSAGES_PER_POLL new messages, from the average
+    interval between its messages scaled by its posting rate at this time of day.
+    The interval grows with every consecutive poll without new messages, within the min and max interval
+    """
+    if schedule.ewma_interval_seconds is None:
+        interval_seconds = env_schedule_default_interval_seconds
+    else:
+        interval_seconds = env_schedule_messages_per_poll * max(1.0, schedule.ewma_interval_seconds)
+        # two passes, the hours covered by the interval depend on the interval
+        for _ in range(2):
+            hourly_factor = get_hourly_factor(schedule, now, interval_seconds)
+            interval_seconds = env_schedule_messages_per_poll * max(1.0, schedule.ewma_interval_seconds) / hourly_factor
+            interval_seconds = min(env_schedule_max_interval_seconds, interval_seconds)
+
+    interval_seconds *= EMPTY_POLL_BACKOFF ** min(schedule.empty_polls, MAX_EMPTY_POLL_BACKOFF_STEPS)
+    return max(env_schedule_min_interval_seconds, min(env_schedule_max_interval_seconds, interval_seconds))
+
+
+class ScheduleService:
+    """
+    Decides when each channel is polled from its posting history: busy channels are polled more often,
+    quiet channels less, and channels with regular posting hours more often around those hours.
+
+    The schedules of the channels polled by this instance are kept in memory, and take precedence over the
+    schedules stored with the channels, so that a failed store never makes a polled channel due again
+    """
+
+    def __init__(self, channel_service: Optional[ChannelService] = None):
+        self.channel_service = channel_service or ChannelService()
+        self.logging_service = LoggingService()
+        self.schedules: Dict[str, ChannelSchedule] = {}  # channel id -> latest schedule
+
+    def get_schedule(self, channel: dict) -> ChannelSchedule:
+        """returns the schedule of a channel, the schedule stored with the channel if it was not polled yet"""
+        schedule = self.schedules.get(channel["id"])
+        if schedule is None:
+            schedule = ChannelSchedule(**(channel.get("schedule") or {}))
+
+        return schedule
+
+    def get_due_channels(self, channels: List[dict], now: Optional[datetime] = None) -> List[dict]:
+        """returns the channels never polled, or with a next poll time that has passed"""
+        now = now or datetime.now(timezone.utc)
+        due_channels = []
+        for channel in channels:
+            next_poll_timestamp = self.get_schedule(channel).next_poll_timestamp
+            if next_poll_timestamp is None or parse_iso_datetime(next_poll_timestamp) <= now:
+                due_channels.append(channel)
+
+        return due_channels
+
+    def get_seconds_until_next_poll(self, channels: List[dict], now: Optional[datetime] = None) -> float:
+        """seconds until the next poll of the channel polled soonest, the default interval without channels"""
+        now = now or datetime.now(timezone.utc)
+        seconds = env_schedule_default_interval_seconds
+        for channel in channels:
+            next_poll_timestamp = self.get_schedule(channel).next_poll_timestamp
+            if next_poll_timestamp is None:
+                return 0
+            seconds = min(seconds, (parse_iso_datetime(next_poll_timestamp) - now).total_seconds())
+
+        return max(0, seconds)
+
+    def update_schedules(
+        self, channels: List[dict], message_dates: Dict[str, List[datetime]], polled_at: Optional[datetime] = None
+    ) -> Dict[str, ChannelSchedule]:
+        """
+        Updates the schedules of polled channels with the dates of their new messages,
+        and stores them with the channels in one bulk update. Schedules that failed to store are still kept in memory
+
+        Parameters:
+        channels - polled channels
+
+        message_dates - channel id -> dates of the new messages of the poll. Channels missing from it failed to poll,
+        they are polled again after the minimum interval
+
+        polled_at (optional) - start of the poll. Defaults to now
+
+        Returns:
+        the new schedule of each channel
+        """
+        polled_at = polled_at or datetime.now(timezone.utc)
+        schedules = {}
+
+        for channel in channels:
+            schedule = self.get_schedule(channel).model_copy()
+            if channel["id"] not in message_dates:
+                interval_seconds = env_schedule_min_interval_seconds
+            else:
+                dates = message_dates[channel["id"]]
+                schedule = observe_messages(schedule, dates)
+                schedule.empty_polls = 0 if len(dates) > 0 else schedule.empty_polls + 1
+                interval_seconds = get_poll_interval_seconds(schedule, polled_at)
+
+            schedule.last_poll_timestamp = to_iso_datetime(polled_at)
+            schedule.next_poll_timestamp = to_iso_datetime(polled_at + timedelta(seconds=interval_seconds))
+            schedules[channel["id"]] = schedule
+
+        self.schedules.update(schedules)
+        response = self.channel_service.update_channel_schedules(
+            {channel_id: schedule.model_dump() for channel_id, schedule in schedules.items()}
+        )
+        for channel_id, reason in response.failures.items():
+            self.logging_service.log_error(
+                message="Failed to store channel schedule",
+                module=LOGGING_MODULE,
+                fields={"channel_id": channel_id, "reason": reason},
+            )
+
+        return schedules
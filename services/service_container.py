@@ -0,0 +1,40 @@
+class ServiceContainer:
+    """
+    Shared clients of the process, created on first use. Their modules are only imported when the client is used,
+    so that an entry point only loads the libraries and opens the connections of the commands it runs
+    """
+
+    @property
+    def database_client(self):
+        from database_connector.database_client import get_database_client
+
+        return get_database_client()
+
+    @property
+    def async_database_client(self):
+        from database_connector.async_database_client import get_async_database_client
+
+        return get_async_database_client()
+
+    @property
+    def notification_service(self):
+        """telegram bot used to notify subscribers"""
+        from services.notification_service import get_notification_service
+
+        return get_notification_service()
+
+    @property
+    def dispatch_service(self):
+        """sends notifications at the rate allowed by telegram, shared so its rate limits hold across cycles"""
+        from services.dispatch_service import get_dispatch_service
+
+        return get_dispatch_service()
+
+    async def get_download_service(self):
+        """telegram client used to download messages, connected on first use"""
+        from services.download_service import get_download_service
+
+        return await get_download_service()
+
+
+container = ServiceContainer()
@@ -1,8 +1,29 @@
-from typing import List, Optional, Union
+import os
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Union
 
 from pydantic import BaseModel
 
-from database_connector.database_client import DatabaseClient
+from database_connector.async_database_client import get_async_database_client
+from database_connector.database_backend import AsyncDatabaseBackend, DatabaseBackend
+from database_connector.database_client import BulkUpdateResponse, get_database_client
+from database_connector.script_functions import register_script_function
+from services.subscription_service import (
+    MATCH_MODE_PERCOLATOR,
+    AsyncSubscriptionService,
+    SubscriptionService,
+    env_match_mode,
+)
+from utils.config import load_config
+from utils.lru_cache import CACHE_MISS, TTLLRUCache
+
+load_config()
+env_subscriber_cache_size = int(os.getenv("ENV_SUBSCRIBER_CACHE_SIZE") or 10_000)
+env_subscriber_cache_ttl_seconds = float(os.getenv("ENV_SUBSCRIBER_CACHE_TTL_SECONDS") or 60)
+
+# subscribers by telegram id, shared by the sync and async services of the process.
+# A subscriber that does not exist is cached as None. Other processes may update subscribers,
+# so entries expire after ENV_SUBSCRIBER_CACHE_TTL_SECONDS
+subscriber_cache = TTLLRUCache(max_size=env_subscriber_cache_size, ttl_seconds=env_subscriber_cache_ttl_seconds)
 
 
 class SubscriberExistsException(Exception):
@@ -22,11 +43,185 @@ class Subscriber(BaseModel):
     subscribed_themes: list[SubscribedTheme] = []
 
 
+RESET_THEME_TIMESTAMPS_SCRIPT = {
+    "lang": "painless",
+    "source": """for(int i=0;i<ctx._source.subscribed_themes.length;i++){
+    ctx._source.subscribed_themes[i].last_notified_timestamp = null;
+    }""",
+}
+
+
+def reset_theme_timestamps(subscriber: dict, params: dict):
+    """python equivalent of RESET_THEME_TIMESTAMPS_SCRIPT, used by the sqlite backend"""
+    for subscribed_theme in subscriber["subscribed_themes"]:
+        subscribed_theme["last_notified_timestamp"] = None
+
+
+register_script_function(RESET_THEME_TIMESTAMPS_SCRIPT["source"], reset_theme_timestamps)
+
+THEME_TIMESTAMP_SCRIPT_SOURCE = """for(int i=0;i<ctx._source.subscribed_themes.length;i++){
+        if(ctx._source.subscribed_themes[i].theme == params.theme){ctx._source.subscribed_themes[i].last_notified_timestamp = params.new_value;}
+        }"""
+
+
+def build_theme_timestamp_script(theme: str, iso_timestamp: str) -> dict:
+    return {
+        "lang": "painless",
+        "source": THEME_TIMESTAMP_SCRIPT_SOURCE,
+        "params": {
+            "theme": theme,
+            "new_value": iso_timestamp,
+        },
+    }
+
+
+def update_theme_timestamp(subscriber: dict, params: dict):
+    for subscribed_theme in subscriber["subscribed_themes"]:
+        if subscribed_theme["theme"] == params["theme"]:
+            subscribed_theme["last_notified_timestamp"] = params["new_value"]
+
+
+register_script_function(THEME_TIMESTAMP_SCRIPT_SOURCE, update_theme_timestamp)
+
+
+THEME_TIMESTAMPS_SCRIPT_ID = "subscriber-theme-timestamps"
+# stored in the cluster and compiled once, updates the last_notified_timestamp of many themes of a subscriber
+THEME_TIMESTAMPS_SCRIPT = {
+    "lang": "painless",
+    "source": """for(int i=0;i<ctx._source.subscribed_themes.length;i++){
+    if(params.timestamps.containsKey(ctx._source.subscribed_themes[i].theme)){ctx._source.subscribed_themes[i].last_notified_timestamp = params.timestamps[ctx._source.subscribed_themes[i].theme];}
+    }""",
+}
+
+
+def build_theme_timestamps_stored_script(theme_timestamps: Dict[str, str]) -> dict:
+    return {"id": THEME_TIMESTAMPS_SCRIPT_ID, "params": {"timestamps": theme_timestamps}}
+
+
+def update_theme_timestamps(subscriber: dict, params: dict):
+    for subscribed_theme in subscriber["subscribed_themes"]:
+        if subscribed_theme["theme"] in params["timestamps"]:
+            subscribed_theme["last_notified_timestamp"] = params["timestamps"][subscribed_theme["theme"]]
+
+
+register_script_function(THEME_TIMESTAMPS_SCRIPT["source"], update_theme_timestamps)
+
+
+def get_subscriber_cache_stats() -> dict:
+    """returns the hit and miss counts of the subscriber cache"""
+    return subscriber_cache.get_stats()
+
+
+def set_cached_subscription(subscriber_id: Union[str, int], is_subscribed: bool):
+    """write-through of a subscription status change to the cached subscriber, if it is cached"""
+    subscriber = subscriber_cache.peek(str(subscriber_id))
+    if subscriber is CACHE_MISS or subscriber is None:
+        return
+
+    subscribed_themes = subscriber["subscribed_themes"]
+    if not is_subscribed:
+        # unsubscribing resets the last notified timestamps
+        subscribed_themes = [{**theme, "last_notified_timestamp": None} for theme in subscribed_themes]
+    subscriber_cache.set(
+        str(subscriber_id), {**subscriber, "is_subscribed": is_subscribed, "subscribed_themes": subscribed_themes}
+    )
+
+
+def find_subscribed_theme(subscriber: Optional[dict], theme: str) -> Optional[dict]:
+    if subscriber is None:
+        return None
+
+    for subscribed_theme in subscriber["subscribed_themes"]:
+        if subscribed_theme["theme"] == theme.lower():
+            return subscribed_theme
+
+    return None
+
+
+THEME_KEYWORDS_SCRIPT_SOURCE = """
+        boolean newTheme = true;
+        for(int i=0;i<ctx._source.subscribed_themes.length;i++){
+            if(ctx._source.subscribed_themes[i].theme == params.theme){
+                ctx._source.subscribed_themes[i].keywords = params.new_value;
+                newTheme = false;
+                break;
+            }
+        }
+        if(newTheme){
+            ctx._source.subscribed_themes.add(["theme": params.theme, "keywords": params.new_value, "last_notified_timestamp": null]);
+        }
+        """
+
+
+def build_theme_keywords_script(theme: str, new_keywords: List[str]) -> dict:
+    return {
+        "lang": "painless",
+        "source": THEME_KEYWORDS_SCRIPT_SOURCE,
+        "params": {
+            "theme": theme,
+            "new_value": new_keywords,
+        },
+    }
+
+
+def update_theme_keywords(subscriber: dict, params: dict):
+    for subscribed_theme in subscriber["subscribed_themes"]:
+        if subscribed_theme["theme"] == params["theme"]:
+            subscribed_theme["keywords"] = params["new_value"]
+            return
+
+    subscriber["subscribed_themes"].append(
+        {"theme": params["theme"], "keywords": params["new_value"], "last_notified_timestamp": None}
+    )
+
+
+register_script_function(THEME_KEYWORDS_SCRIPT_SOURCE, update_theme_keywords)
+
+
 class SubscriberService:
     __INDEX_NAME = "subscriber"
+    __are_scripts_registered = False  # stored scripts are registered once per process
+
+    def __init__(self, database_client: Optional[DatabaseBackend] = None):
+        self.database_client = database_client or get_database_client()
+        self.subscription_service = SubscriptionService(database_client=self.database_client)
 
-    def __init__(self):
-        self.database_client = DatabaseClient()
+    def __get_subscriber(self, subscriber_id: Union[str, int]) -> Optional[dict]:
+        """
+        retrieves the latest version of a subscriber from the database, and caches it.
+        Returns None without caching it when the read fails, so that an error is not cached as a missing subscriber
+        """
+        try:
+            subscriber = self.database_client.get(index_name=self.__INDEX_NAME, document_id=str(subscriber_id))
+        except Exception:
+            return None
+
+        subscriber_cache.set(str(subscriber_id), subscriber)
+        return subscriber
+
+    def get_subscriber(self, subscriber_id: Union[str, int]) -> Optional[dict]:
+        """
+        returns a subscriber by its telegram id, or None if it does not exist.
+        Subscribers are read from the subscriber cache first
+        """
+        subscriber = subscriber_cache.get(str(subscriber_id))
+        if subscriber is not CACHE_MISS:
+            return subscriber
+
+        return self.__get_subscriber(subscriber_id)
+
+    def __sync_subscriptions(self, subscriber_id: Union[str, int]):
+        """
+        Updates the ingest-time subscriptions of a subscriber to its current themes and subscription status.
+        Does nothing unless messages are matched with the percolator
+        """
+        if env_match_mode != MATCH_MODE_PERCOLATOR:
+            return
+
+        self.subscription_service.remove_subscriber(subscriber_id=subscriber_id)
+        subscriber = self.__get_subscriber(subscriber_id)
+        if subscriber is not None and subscriber["is_subscribed"]:
+            self.subscription_service.register_subscriber(subscriber)
 
     def __toggle_subscription(self, subscriber_id: Union[str, int], is_subscribed: bool):
         """changes a subscriber is_subscribed flag
@@ -45,33 +240,36 @@ class SubscriberService:
     def check_subscriber_exists(self, id: Union[str, int]):
         """Checks if a subscriber exist with a id.
         Returns true if exists, false otherwise"""
-        return self.database_client.document_exist(index_name=self.__INDEX_NAME, document_id=str(id))
+        return self.get_subscriber(id) is not None
 
-    def get_subscribers(self, is_subscribed: Optional[bool] = True):
-        """Returns a list of users filtered by is_subscribed status"""
-        result = self.database_client.read(
+    def iter_subscribers(
+        self, is_subscribed: Optional[bool] = True, source_fields: Optional[List[str]] = None
+    ) -> Iterator[dict]:
+        """Yields all users filtered by is_subscribed status, without loading them all in memory
+
+        Parameters:
+        is_subscribed - subscription status of the users to retrieve
+
+        source_fields (optional) - fields of the users to retrieve. Defaults to all fields
+        """
+        yield from self.database_client.read_stream(
             index_name=self.__INDEX_NAME,
             query={
                 "term": {"is_subscribed": is_subscribed},
             },
+            source_fields=source_fields,
         )
 
-        return result
+    def get_subscribers(self, is_subscribed: Optional[bool] = True):
+        """Returns a list of users filtered by is_subscribed status"""
+        return list(self.iter_subscribers(is_subscribed=is_subscribed))
 
     def get_subscriber_theme(self, subscriber_id: str, theme: str) -> Optional[SubscribedTheme]:
         """
         given a subscriber ID and theme, retrieve the subscribed theme object.
         If a subscriber has previously set keywords for this theme, the SubscribedTheme object is returned.
         """
-        response = self.database_client.read(index_name=self.__INDEX_NAME, query={"match": {"_id": subscriber_id}})
-        subscriber = response[0]
-        subscribed_themes = subscriber["subscribed_themes"]
-
-        for subscribed_theme in subscribed_themes:
-            if subscribed_theme["theme"] == theme.lower():
-                return subscribed_theme
-
-        return None
+        return find_subscribed_theme(self.get_subscriber(subscriber_id), theme)
 
     def add_subscriber(self, subscriber: Subscriber) -> str:
         """adds a subscriber with a telegram id to the database
@@ -89,15 +287,17 @@ class SubscriberService:
         if subscriber_exists:
             raise SubscriberExistsException(f"Subscriber with {telegram_id} already exists")
 
-        response = self.database_client.create(
-            index_name=self.__INDEX_NAME,
-            document={
-                "is_subscribed": subscriber.is_subscribed,
-                "subscribed_themes": subscribed_themes,
-                "telegram_username": subscriber.telegram_username,
-            },
-            document_id=telegram_id,
-        )
+        document = {
+            "is_subscribed": subscriber.is_subscribed,
+            "subscribed_themes": subscribed_themes,
+            "telegram_username": subscriber.telegram_username,
+        }
+        response = self.database_client.create(index_name=self.__INDEX_NAME, document=document, document_id=telegram_id)
+        if response is not None:
+            subscriber_cache.set(telegram_id, {**document, "id": telegram_id})
+        else:
+            subscriber_cache.invalidate(telegram_id)
+        self.__sync_subscriptions(subscriber_id=telegram_id)
 
         return response
 
@@ -108,17 +308,41 @@ class SubscriberService:
         self.database_client.update(
             index_name=self.__INDEX_NAME,
             document_id=str(subscriber_id),
-            script_doc={
-                "lang": "painless",
-                "source": """for(int i=0;i<ctx._source.subscribed_themes.length;i++){
-                if(ctx._source.subscribed_themes[i].theme == params.theme){ctx._source.subscribed_themes[i].last_notified_timestamp = params.new_value;}
-                }""",
-                "params": {
-                    "theme": theme,
-                    "new_value": iso_timestamp,
-                },
-            },
+            script_doc=build_theme_timestamp_script(theme=theme, iso_timestamp=iso_timestamp),
         )
+        subscriber_cache.invalidate(str(subscriber_id))
+
+    def register_scripts(self):
+        """stores the scripts used by bulk subscriber updates in the database"""
+        return self.database_client.put_script(script_id=THEME_TIMESTAMPS_SCRIPT_ID, script=THEME_TIMESTAMPS_SCRIPT)
+
+    def update_subscriber_theme_timestamps(
+        self, subscriber_theme_timestamps: Dict[Union[str, int], Dict[str, str]]
+    ) -> BulkUpdateResponse:
+        """Updates the last_notified_timestamp of many subscriber themes with bulk requests,
+        one scripted update per subscriber. Themes a subscriber does not have are ignored
+
+        Parameters:
+        subscriber_theme_timestamps - maps each subscriber id to its new timestamps, a dict of theme -> ISO timestamp
+
+        Returns:
+        BulkUpdateResponse with the reason of every failed subscriber update
+        """
+        if len(subscriber_theme_timestamps) == 0:
+            return BulkUpdateResponse()
+
+        if not SubscriberService.__are_scripts_registered:
+            # registered by the setup script, stored again once per process for existing deployments
+            SubscriberService.__are_scripts_registered = self.register_scripts()
+
+        updates = [
+            {"id": str(subscriber_id), "script": build_theme_timestamps_stored_script(theme_timestamps)}
+            for subscriber_id, theme_timestamps in subscriber_theme_timestamps.items()
+        ]
+        for subscriber_id in subscriber_theme_timestamps.keys():
+            subscriber_cache.invalidate(str(subscriber_id))
+
+        return self.database_client.bulk_update(index_name=self.__INDEX_NAME, updates=updates)
 
     def update_subscriber_theme_keywords(self, subscriber_id: Union[str, int], theme: str, new_keywords: List[str]):
         """
@@ -129,27 +353,10 @@ class SubscriberService:
         self.database_client.update(
             index_name=self.__INDEX_NAME,
             document_id=str(subscriber_id),
-            script_doc={
-                "lang": "painless",
-                "source": """
-                boolean newTheme = true;
-                for(int i=0;i<ctx._source.subscribed_themes.length;i++){
-                    if(ctx._source.subscribed_themes[i].theme == params.theme){
-                        ctx._source.subscribed_themes[i].keywords = params.new_value;
-                        newTheme = false;
-                        break;
-                    }
-                }
-                if(newTheme){
-                    ctx._source.subscribed_themes.add(["theme": params.theme, "keywords": params.new_value, "last_notified_timestamp": null]);
-                }
-                """,
-                "params": {
-                    "theme": theme,
-                    "new_value": new_keywords,
-                },
-            },
+            script_doc=build_theme_keywords_script(theme=theme, new_keywords=new_keywords),
         )
+        subscriber_cache.invalidate(str(subscriber_id))
+        self.__sync_subscriptions(subscriber_id=subscriber_id)
 
     def unsubscribe(self, subscriber_id: Union[str, int]):
         """
@@ -162,16 +369,185 @@ class SubscriberService:
         self.database_client.update(
             index_name=self.__INDEX_NAME,
             document_id=str(subscriber_id),
-            script_doc={
-                "lang": "painless",
-                "source": """for(int i=0;i<ctx._source.subscribed_themes.length;i++){
-                ctx._source.subscribed_themes[i].last_notified_timestamp = null;
-                }""",
-            },
+            script_doc=RESET_THEME_TIMESTAMPS_SCRIPT,
         )
+        set_cached_subscription(subscriber_id=subscriber_id, is_subscribed=False)
+        self.__sync_subscriptions(subscriber_id=subscriber_id)
 
     def subscribe(self, subscriber_id: Union[str, int]):
         """
         subscribes the user to receive notifications
         """
         self.__toggle_subscription(subscriber_id=subscriber_id, is_subscribed=True)
+        set_cached_subscription(subscriber_id=subscriber_id, is_subscribed=True)
+        self.__sync_subscriptions(subscriber_id=subscriber_id)
+
+
+class AsyncSubscriberService:
+    """asyncio counterpart of SubscriberService, used by the api server and the telegram bot"""
+
+    __INDEX_NAME = "subscriber"
+
+    def __init__(self, database_client: Optional[AsyncDatabaseBackend] = None):
+        self.database_client = database_client or get_async_database_client()
+        self.subscription_service = AsyncSubscriptionService(database_client=self.database_client)
+
+    async def __get_subscriber(self, subscriber_id: Union[str, int]) -> Optional[dict]:
+        """
+        retrieves the latest version of a subscriber from the database, and caches it.
+        Returns None without caching it when the read fails, so that an error is not cached as a missing subscriber
+        """
+        try:
+            subscriber = await self.database_client.get(index_name=self.__INDEX_NAME, document_id=str(subscriber_id))
+        except Exception:
+            return None
+
+        subscriber_cache.set(str(subscriber_id), subscriber)
+        return subscriber
+
+    async def get_subscriber(self, subscriber_id: Union[str, int]) -> Optional[dict]:
+        """
+        returns a subscriber by its telegram id, or None if it does not exist.
+        Subscribers are read from the subscriber cache first
+        """
+        subscriber = subscriber_cache.get(str(subscriber_id))
+        if subscriber is not CACHE_MISS:
+            return subscriber
+
+        return await self.__get_subscriber(subscriber_id)
+
+    async def __sync_subscriptions(self, subscriber_id: Union[str, int]):
+        """
+        Updates the ingest-time subscriptions of a subscriber to its current themes and subscription status.
+        Does nothing unless messages are matched with the percolator
+        """
+        if env_match_mode != MATCH_MODE_PERCOLATOR:
+            return
+
+        await self.subscription_service.remove_subscriber(subscriber_id=subscriber_id)
+        subscriber = await self.__get_subscriber(subscriber_id)
+        if subscriber is not None and subscriber["is_subscribed"]:
+            await self.subscription_service.register_subscriber(subscriber)
+
+    async def __toggle_subscription(self, subscriber_id: Union[str, int], is_subscribed: bool):
+        """changes a subscriber is_subscribed flag"""
+        await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=str(subscriber_id),
+            partial_doc={"is_subscribed": is_subscribed},
+        )
+
+    async def check_subscriber_exists(self, id: Union[str, int]):
+        """Checks if a subscriber exist with a id.
+        Returns true if exists, false otherwise"""
+        return await self.get_subscriber(id) is not None
+
+    async def iter_subscribers(
+        self, is_subscribed: Optional[bool] = True, source_fields: Optional[List[str]] = None
+    ) -> AsyncIterator[dict]:
+        """Yields all users filtered by is_subscribed status, without loading them all in memory
+
+        Parameters:
+        is_subscribed - subscription status of the users to retrieve
+
+        source_fields (optional) - fields of the users to retrieve. Defaults to all fields
+        """
+        async for subscriber in self.database_client.read_stream(
+            index_name=self.__INDEX_NAME,
+            query={
+                "term": {"is_subscribed": is_subscribed},
+            },
+            source_fields=source_fields,
+        ):
+            yield subscriber
+
+    async def get_subscribers(self, is_subscribed: Optional[bool] = True):
+        """Returns a list of users filtered by is_subscribed status"""
+        return [subscriber async for subscriber in self.iter_subscribers(is_subscribed=is_subscribed)]
+
+    async def get_subscriber_theme(self, subscriber_id: str, theme: str) -> Optional[SubscribedTheme]:
+        """
+        given a subscriber ID and theme, retrieve the subscribed theme object.
+        If a subscriber has previously set keywords for this theme, the SubscribedTheme object is returned.
+        """
+        return find_subscribed_theme(await self.get_subscriber(subscriber_id), theme)
+
+    async def add_subscriber(self, subscriber: Subscriber) -> str:
+        """adds a subscriber with a telegram id to the database
+
+        Raises:
+        SubscriptionException - if there is a existing subscriber with the subscriber id
+        """
+        subscribed_themes = [subscribed_theme.model_dump() for subscribed_theme in subscriber.subscribed_themes]
+        telegram_id = subscriber.telegram_id
+
+        subscriber_exists = await self.check_subscriber_exists(telegram_id)
+        if subscriber_exists:
+            raise SubscriberExistsException(f"Subscriber with {telegram_id} already exists")
+
+        document = {
+            "is_subscribed": subscriber.is_subscribed,
+            "subscribed_themes": subscribed_themes,
+            "telegram_username": subscriber.telegram_username,
+        }
+        response = await self.database_client.create(
+            index_name=self.__INDEX_NAME, document=document, document_id=telegram_id
+        )
+        if response is not None:
+            subscriber_cache.set(telegram_id, {**document, "id": telegram_id})
+        else:
+            subscriber_cache.invalidate(telegram_id)
+        await self.__sync_subscriptions(subscriber_id=telegram_id)
+
+        return response
+
+    async def update_subscriber_theme_timestamp(self, subscriber_id: Union[str, int], theme: str, iso_timestamp: str):
+        """Updates a subscriber's theme last_notified_timestamp.
+        If the theme does not exist, this operation does nothing
+        """
+        await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=str(subscriber_id),
+            script_doc=build_theme_timestamp_script(theme=theme, iso_timestamp=iso_timestamp),
+        )
+        subscriber_cache.invalidate(str(subscriber_id))
+
+    async def update_subscriber_theme_keywords(
+        self, subscriber_id: Union[str, int], theme: str, new_keywords: List[str]
+    ):
+        """
+        Updates the keywords of a subscriber's theme.
+
+        If the theme doesn't exist, a new theme with the keywords is added to the theme list
+        """
+        await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=str(subscriber_id),
+            script_doc=build_theme_keywords_script(theme=theme, new_keywords=new_keywords),
+        )
+        subscriber_cache.invalidate(str(subscriber_id))
+        await self.__sync_subscriptions(subscriber_id=subscriber_id)
+
+    async def unsubscribe(self, subscriber_id: Union[str, int]):
+        """
+        unsubscribes the user from receiving notifications.
+
+        Sets the last_notified_timestamp of all themes to None.
+        This prevents the subscriber from getting spammed with large volume of messages upon re-subscribing
+        """
+        await self.__toggle_subscription(subscriber_id=subscriber_id, is_subscribed=False)
+        await self.database_client.update(
+            index_name=self.__INDEX_NAME,
+            document_id=str(subscriber_id),
+            script_doc=RESET_THEME_TIMESTAMPS_SCRIPT,
+        )
+        set_cached_subscription(subscriber_id=subscriber_id, is_subscribed=False)
+        await self.__sync_subscriptions(subscriber_id=subscriber_id)
+
+    async def subscribe(self, subscriber_id: Union[str, int]):
+        """
+        subscribes the user to receive notifications
+        """
+        await self.__toggle_subscription(subscriber_id=subscriber_id, is_subscribed=True)
+        set_cached_subscription(subscriber_id=subscriber_id, is_subscribed=True)
+        await self.__sync_subscriptions(subscriber_id=subscriber_id)
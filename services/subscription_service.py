@@ -0,0 +1,168 @@
+import os
+from typing import List, Optional, Union
+
+from database_connector.async_database_client import get_async_database_client
+from database_connector.database_backend import AsyncDatabaseBackend, DatabaseBackend
+from database_connector.database_client import get_database_client
+from database_connector.query_compiler import compile_keywords
+from services.message_service import Message
+from utils.config import load_config
+
+load_config()
+MATCH_MODE_SEARCH = "search"  # notify cycle searches the messages of every subscriber theme
+MATCH_MODE_PERCOLATOR = "percolator"  # messages are matched to subscriber themes once at ingest time
+MATCH_MODE_MEMORY = "memory"  # messages are matched at ingest time by the in-process keyword matcher
+INGEST_MATCH_MODES = (MATCH_MODE_PERCOLATOR, MATCH_MODE_MEMORY)
+env_match_mode = os.getenv("ENV_MATCH_MODE") or MATCH_MODE_SEARCH
+
+
+def build_subscription_document(subscriber_id: Union[str, int], theme: str, keywords: List[str]) -> dict:
+    """builds the percolator document storing the keyword query of a subscriber's theme"""
+    return {
+        "subscriber_id": str(subscriber_id),
+        "theme": theme,
+        "query": {
+            "bool": {
+                "must": [
+                    compile_keywords(keywords),
+                    {"term": {"themes": {"value": theme}}},
+                ]
+            }
+        },
+    }
+
+
+class SubscriptionService:
+    """
+    Manages the percolator index storing the keyword query of every subscribed theme.
+
+    A subscription is a (subscriber, theme) pair. New messages are percolated against the stored queries
+    to find every subscription they match, instead of searching the messages of every subscription
+    """
+
+    __INDEX_NAME = "subscription"
+
+    def __init__(self, database_client: Optional[DatabaseBackend] = None):
+        self.database_client = database_client or get_database_client()
+
+    @staticmethod
+    def get_subscription_id(subscriber_id: Union[str, int], theme: str) -> str:
+        return ("-").join([str(subscriber_id), theme])
+
+    def register_subscriber_theme(self, subscriber_id: Union[str, int], theme: str, keywords: List[str]):
+        """
+        Stores the keyword query of a subscriber's theme, replacing the previous query of the theme.
+
+        A theme without keywords matches nothing, its query is removed instead
+        """
+        subscription_id = self.get_subscription_id(subscriber_id, theme)
+
+        if len(keywords) == 0:
+            self.database_client.delete_by_query(
+                index_name=self.__INDEX_NAME, query={"ids": {"values": [subscription_id]}}
+            )
+            return
+
+        self.database_client.index_document(
+            index_name=self.__INDEX_NAME,
+            document_id=subscription_id,
+            document=build_subscription_document(subscriber_id=subscriber_id, theme=theme, keywords=keywords),
+        )
+
+    def register_subscriber(self, subscriber: dict):
+        """
+        Stores the keyword queries of all themes of a subscriber
+        """
+        for subscribed_theme in subscriber["subscribed_themes"]:
+            self.register_subscriber_theme(
+                subscriber_id=subscriber["id"],
+                theme=subscribed_theme["theme"],
+                keywords=subscribed_theme["keywords"],
+            )
+
+    def remove_subscriber(self, subscriber_id: Union[str, int]):
+        """
+        Removes the keyword queries of all themes of a subscriber.
+        Messages ingested afterwards will not match the subscriber
+        """
+        self.database_client.delete_by_query(
+            index_name=self.__INDEX_NAME, query={"term": {"subscriber_id": str(subscriber_id)}}
+        )
+
+    def sync_subscribers(self, subscribers: List[dict]):
+        """
+        Rebuilds the percolator index from the given subscribers. Only subscribed subscribers are stored
+        """
+        self.database_client.delete_by_query(index_name=self.__INDEX_NAME, query={"match_all": {}})
+        for subscriber in subscribers:
+            if subscriber["is_subscribed"]:
+                self.register_subscriber(subscriber)
+
+    def match_messages(self, messages: List[Message]) -> List[List[str]]:
+        """
+        Percolates a batch of messages against the stored keyword queries
+
+        Returns:
+        for each message, in the same order, the list of subscription ids the message matches
+        """
+        documents = [
+            {
+                "text": message.text,
+                "themes": message.themes,
+                "channel_id": message.channel_id,
+                "timestamp": message.timestamp,
+            }
+            for message in messages
+        ]
+        response = self.database_client.percolate(index_name=self.__INDEX_NAME, documents=documents)
+
+        return [[subscription["id"] for subscription in subscriptions] for subscriptions in response]
+
+
+class AsyncSubscriptionService:
+    """asyncio counterpart of SubscriptionService, for keeping the percolator index in sync"""
+
+    __INDEX_NAME = "subscription"
+
+    def __init__(self, database_client: Optional[AsyncDatabaseBackend] = None):
+        self.database_client = database_client or get_async_database_client()
+
+    async def register_subscriber_theme(self, subscriber_id: Union[str, int], theme: str, keywords: List[str]):
+        """
+        Stores the keyword query of a subscriber's theme, replacing the previous query of the theme.
+
+        A theme without keywords matches nothing, its query is removed instead
+        """
+        subscription_id = SubscriptionService.get_subscription_id(subscriber_id, theme)
+
+        if len(keywords) == 0:
+            await self.database_client.delete_by_query(
+                index_name=self.__INDEX_NAME, query={"ids": {"values": [subscription_id]}}
+            )
+            return
+
+        await self.database_client.index_document(
+            index_name=self.__INDEX_NAME,
+            document_id=subscription_id,
+            document=build_subscription_document(subscriber_id=subscriber_id, theme=theme, keywords=keywords),
+        )
+
+    async def register_subscriber(self, subscriber: dict):
+        """
+        Stores the keyword queries of all themes of a subscriber
+        """
+        for subscribed_theme in subscriber["subscribed_themes"]:
+            await self.register_subscriber_theme(
+                subscriber_id=subscriber["id"],
+                theme=subscribed_theme["theme"],
+                keywords=subscribed_theme["keywords"],
+            )
+
+    async def remove_subscriber(self, subscriber_id: Union[str, int]):
+        """
+        Removes the keyword queries of all themes of a subscriber.
+        Messages ingested afterwards will not match the subscriber
+        """
+        await self.database_client.delete_by_query(
+            index_name=self.__INDEX_NAME, query={"term": {"subscriber_id": str(subscriber_id)}}
+        )
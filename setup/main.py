@@ -3,10 +3,14 @@ import json
 
 sys.path.append("..")
 
-from database_connector.database_client import DatabaseClient
+from database_connector.database_backend import DatabaseBackend
+from database_connector.database_client import get_database_client
+from services.message_service import MessageService
+from services.subscriber_service import SubscriberService
+from services.subscription_service import SubscriptionService
 
 
-def setup_indices(db_client: DatabaseClient):
+def setup_indices(db_client: DatabaseBackend):
     with open("indices.json") as file:
         indices = json.load(file)
         for index in indices:
@@ -16,7 +20,34 @@ def setup_indices(db_client: DatabaseClient):
             print(create_index_response)
 
 
-def setup_channels(db_client: DatabaseClient):
+def setup_mappings(db_client: DatabaseBackend):
+    """adds the fields of the mappings that are missing from indices created by an earlier version"""
+    with open("indices.json") as file:
+        indices = json.load(file)
+        for index in indices:
+            db_client.put_mapping(index_name=index["index_name"], properties=index["mapping"]["mappings"]["properties"])
+
+    # indices created from the index templates, e.g. the monthly message indices
+    with open("index_templates.json") as file:
+        index_templates = json.load(file)
+        for index_template in index_templates:
+            template = index_template["template"]
+            for index_pattern in template["index_patterns"]:
+                db_client.put_mapping(
+                    index_name=index_pattern, properties=template["template"]["mappings"]["properties"]
+                )
+
+
+def setup_index_templates(db_client: DatabaseBackend):
+    with open("index_templates.json") as file:
+        index_templates = json.load(file)
+        for index_template in index_templates:
+            db_client.put_index_template(
+                template_name=index_template["template_name"], template=index_template["template"]
+            )
+
+
+def setup_channels(db_client: DatabaseBackend):
     with open("channels.json") as file:
         channels = json.load(file)
         for channel in channels:
@@ -29,15 +60,38 @@ def setup_channels(db_client: DatabaseClient):
             )
 
 
+def setup_scripts():
+    """stores the scripts used by bulk updates and the search templates in the database"""
+    subscriber_service = SubscriberService()
+    subscriber_service.register_scripts()
+    message_service = MessageService()
+    message_service.register_search_template()
+
+
+def setup_subscriptions():
+    """registers the keywords of existing subscribers in the subscription percolator index"""
+    subscriber_service = SubscriberService()
+    subscription_service = SubscriptionService()
+    subscribers = subscriber_service.get_subscribers(is_subscribed=True)
+    subscription_service.sync_subscribers(subscribers)
+
+
 def main():
     """
     First time setup for new machines
-    1. loads the mapping for the indices
+    1. loads the mapping for the indices, and the index templates of the monthly message indices.
+    New fields of the mappings are added to existing indices
     2. add basic channels
+    3. stores the scripts used by bulk updates
+    4. registers existing subscribers for ingest-time matching
     """
-    db_client = DatabaseClient()
+    db_client = get_database_client()
     setup_indices(db_client)
+    setup_mappings(db_client)
+    setup_index_templates(db_client)
     setup_channels(db_client)
+    setup_scripts()
+    setup_subscriptions()
 
 
 if __name__ == "__main__":
@@ -1,4 +1,3 @@
-import json
 import sys
 
 sys.path.append("..")
@@ -6,7 +5,6 @@ sys.path.append("..")
 import logging
 import os
 
-import dotenv
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove, Update
 from telegram.ext import (
     Application,
@@ -15,14 +13,18 @@ from telegram.ext import (
     ContextTypes,
     ConversationHandler,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 
+from database_connector.async_database_client import close_async_database_client
 from services.logging_service import LoggingService
-from services.subscriber_service import Subscriber, SubscriberService
+from services.metrics_service import bot_updates_total, start_metrics_exporter
+from services.subscriber_service import AsyncSubscriberService, Subscriber, get_subscriber_cache_stats
+from utils.config import load_config
 from utils.string_helper import clean_string, format_bullet_point_newline_separated_string
 
-dotenv.load_dotenv()
+load_config()
 telegram_bot_token = os.getenv("ENV_TG_BOT_TOKEN") or ""
 
 # Enable logging
@@ -32,8 +34,10 @@ logging.getLogger("httpx").setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 logging_service = LoggingService()
+subscriber_service = AsyncSubscriberService()
 
 THEME_STATE, KEYWORDS_STATE = range(2)
+BOT_COMMANDS = ("/start", "/setkeywords", "/cancel", "/subscribe", "/unsubscribe")
 
 # category of themes
 FOOD = "food"
@@ -50,24 +54,23 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     Sends back a list of themes for the subscriber to register.
 
     """
-    subscriber_service = SubscriberService()
-
     user = update.message.from_user
     telegram_username = user["username"]
     telegram_id = str(user["id"])
     user_dict = {"id": telegram_id, "username": telegram_username}
-    logging_service.log_info(message=f"Initiated conversation with the bot: {json.dumps(user_dict)}")
+    logging_service.log_info(message="Initiated conversation with the bot", fields=user_dict)
 
     new_subscriber = Subscriber(telegram_id=telegram_id, telegram_username=telegram_username)
     try:
-        subscriber_already_exists = subscriber_service.check_subscriber_exists(id=telegram_id)
+        subscriber_already_exists = await subscriber_service.check_subscriber_exists(id=telegram_id)
 
         if not subscriber_already_exists:
-            subscriber_service.add_subscriber(new_subscriber)
+            await subscriber_service.add_subscriber(new_subscriber)
     except Exception as error:
         error_dict = {"id": telegram_id, "username": telegram_username, "error": str(error)}
         logging_service.log_error(
-            message=f"Failed to start service: {json.dumps(error_dict)}",
+            message="Failed to start service",
+            fields=error_dict,
             module=MODULE,
         )
         await update.message.reply_text("Sorry, something went wrong, please try again later")
@@ -80,8 +83,6 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Unsubscribes a user from receiving messages"""
-    subscriber_service = SubscriberService()
-
     user = update.message.from_user
     telegram_id = str(user["id"])
     telegram_username = user["username"]
@@ -91,22 +92,24 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     }
 
     try:
-        subscriber_exist = subscriber_service.check_subscriber_exists(id=telegram_id)
+        subscriber_exist = await subscriber_service.check_subscriber_exists(id=telegram_id)
         if not subscriber_exist:
             logging_service.log_info(
-                message=f"Tried to unsubscribed from the bot, but does not exist in the database: {json.dumps(user_dict)}",
+                message="Tried to unsubscribed from the bot, but does not exist in the database",
+                fields=user_dict,
                 module=MODULE,
             )
             await update.message.reply_text("You are not subscribed in the first place.")
             return
 
-        subscriber_service.unsubscribe(subscriber_id=telegram_id)
-        logging_service.log_info(message=f"Unsubscribed from the bot: {json.dumps(user_dict)}", module=MODULE)
+        await subscriber_service.unsubscribe(subscriber_id=telegram_id)
+        logging_service.log_info(message="Unsubscribed from the bot", fields=user_dict, module=MODULE)
         await update.message.reply_text("Yes master. This is the last time you'll hear from me.")
     except Exception as error:
         error_dict = {"username": telegram_username, "id": telegram_id, "error": str(error)}
         logging_service.log_error(
-            message=f"Unsubscribe error: {json.dumps(error_dict)}",
+            message="Unsubscribe error",
+            fields=error_dict,
             module=MODULE,
         )
         await update.message.reply_text(f"Something went wrong, please try again later")
@@ -114,8 +117,6 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Subscribes a new user to the bot to start receiving messages. If a user had previously unsubscribed, it will re-subscribe the user"""
-    subscriber_service = SubscriberService()
-
     user = update.message.from_user
     telegram_username = user["username"]
     telegram_id = str(user["id"])
@@ -124,25 +125,26 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     new_subscriber = Subscriber(telegram_id=telegram_id, telegram_username=telegram_username)
 
     try:
-        subscriber_already_exists = subscriber_service.check_subscriber_exists(id=telegram_id)
+        subscriber_already_exists = await subscriber_service.check_subscriber_exists(id=telegram_id)
 
         # subscriber already exist, re-subscribes the person instead
         if subscriber_already_exists:
-            subscriber_service.subscribe(subscriber_id=telegram_id)
+            await subscriber_service.subscribe(subscriber_id=telegram_id)
             await update.message.reply_text(
                 f"I have re-enabled your subscription! You'll hear from me soon, master {telegram_username}"
             )
             return
 
-        subscriber_service.add_subscriber(subscriber=new_subscriber)
-        logging_service.log_info(message=f"Subscribed to the bot: {json.dumps(user_dict)}", module=MODULE)
+        await subscriber_service.add_subscriber(subscriber=new_subscriber)
+        logging_service.log_info(message="Subscribed to the bot", fields=user_dict, module=MODULE)
         await update.message.reply_text(
             f"Greetings master {telegram_username}. Thank you for subscribing to Sift! Let's set up some subscription themes with /setkeywords command"
         )
     except Exception as error:
         error_dict = {**user_dict, "error": str(error)}
         logging_service.log_error(
-            message=f"Subscribe error: {json.dumps(error_dict)}",
+            message="Subscribe error",
+            fields=error_dict,
             module=MODULE,
         )
         await update.message.reply_text(f"Something went wrong, please try again later")
@@ -164,12 +166,11 @@ async def set_keywords_command(update: Update, context: ContextTypes.DEFAULT_TYP
 
 async def handle_select_theme(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     try:
-        subscriber_service = SubscriberService()
         query = update.callback_query
         theme = str(query.data)
         telegram_user_id = str(query.from_user["id"])
         context.user_data["selected_theme"] = theme
-        subscribed_theme = subscriber_service.get_subscriber_theme(
+        subscribed_theme = await subscriber_service.get_subscriber_theme(
             telegram_user_id, theme
         )  # is None when no keywords are selected for that theme
 
@@ -193,8 +194,6 @@ async def handle_select_theme(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 
 async def handle_update_theme_keywords(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    subscriber_service = SubscriberService()
-
     selected_theme = context.user_data.get("selected_theme", None)
     user = update.message.from_user
     telegram_id = str(user["id"])
@@ -205,7 +204,7 @@ async def handle_update_theme_keywords(update: Update, context: ContextTypes.DEF
         keywords = list(filter(None, keywords.split(",")))  # split into an array, remove empty keywords
         keywords = [keyword.strip() for keyword in keywords]  # remove trailing whitespaces
         keywords = list(filter(None, keywords))  # remove empty strings in list
-        subscriber_service.update_subscriber_theme_keywords(
+        await subscriber_service.update_subscriber_theme_keywords(
             subscriber_id=telegram_id, theme=selected_theme, new_keywords=keywords
         )
         newline_separated_keywords = format_bullet_point_newline_separated_string(keywords)
@@ -221,7 +220,8 @@ async def handle_update_theme_keywords(update: Update, context: ContextTypes.DEF
             "error": str(error),
         }
         logging_service.log_error(
-            message=f"Update theme keywords failed: {json.dumps(error_dict)}",
+            message="Update theme keywords failed",
+            fields=error_dict,
             module=MODULE,
         )
         await update.message.reply_text("Something went wrong, please try again later")
@@ -236,9 +236,28 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     return ConversationHandler.END
 
 
+async def count_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """counts every update by command, before it is handled"""
+    text = update.message.text if update.message is not None and update.message.text is not None else ""
+    if text.startswith("/"):
+        command = text.split()[0].split("@")[0]
+        command = command if command in BOT_COMMANDS else "unknown_command"  # bounds the number of labels
+    else:
+        command = "callback_query" if update.callback_query is not None else "message"
+    bot_updates_total.labels(command=command).inc()
+
+
+async def close_database_clients(application: Application) -> None:
+    logging_service.log_info(message="Subscriber cache stats", fields=get_subscriber_cache_stats(), module=MODULE)
+    await close_async_database_client()
+
+
 def main() -> None:
     """Start the bot."""
-    application = Application.builder().token(telegram_bot_token).build()
+    application = Application.builder().token(telegram_bot_token).post_shutdown(close_database_clients).build()
+
+    # handlers of group -1 run before the handlers of the default group
+    application.add_handler(TypeHandler(Update, count_update), group=-1)
 
     # handle different commands
     application.add_handler(CommandHandler("start", start))
@@ -260,6 +279,8 @@ def main() -> None:
     application.add_handler(CommandHandler("subscribe", subscribe_command))
     application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
 
+    start_metrics_exporter()
+
     # Run the bot until the user presses Ctrl-C
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import Forbidden, NetworkError, RetryAfter
+
+from services.dispatch_service import DispatchService, Notification, TokenBucket
+
+
+class FakeNotificationService:
+    """records the sends, failing the messages with a list of errors to raise first"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}  # message: errors raised by its first attempts
+        self.sends = []  # (chat id, message, monotonic time)
+
+    async def deliver_message(self, message: str, chat_id: str):
+        errors = self.errors.get(message, [])
+        if len(errors) > 0:
+            raise errors.pop(0)
+
+        self.sends.append((chat_id, message, time.monotonic()))
+
+
+def build_notifications(chat_ids, per_chat: int):
+    return [
+        Notification(message=f"{chat_id}-{index}", receiver_chat_id=chat_id, reference=f"{chat_id}-{index}")
+        for chat_id in chat_ids
+        for index in range(per_chat)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(DispatchService, "_DispatchService__BACKOFF_BASE_SECONDS", 0.01)
+
+
+def test_token_bucket_allows_burst_up_to_capacity():
+    async def run():
+        bucket = TokenBucket(rate=1, capacity=3)
+        start_time = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start_time, bucket.get_wait_seconds()
+
+    elapsed_seconds, wait_seconds = asyncio.run(run())
+
+    assert elapsed_seconds < 0.1
+    assert 0.9 < wait_seconds <= 1
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=1)
+        start_time = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start_time
+
+    # the first token is available at once, the next three every 50ms
+    assert asyncio.run(run()) >= 0.14
+
+
+def test_token_bucket_pause_holds_back_tokens():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=5)
+        bucket.pause(0.1)
+        wait_seconds = bucket.get_wait_seconds()
+        start_time = time.monotonic()
+        await bucket.acquire()
+        return wait_seconds, time.monotonic() - start_time
+
+    wait_seconds, elapsed_seconds = asyncio.run(run())
+
+    # tokens refill from the end of the pause
+    assert 0.1 <= wait_seconds <= 0.12
+    assert elapsed_seconds >= 0.1
+
+
+def test_dispatch_interleaves_chats():
+    notification_service = FakeNotificationService()
+    dispatch_service = DispatchService(
+        notification_service=notification_service, workers=2, global_rate=1_000, per_chat_rate=5
+    )
+    # notifications grouped by subscriber, as they are built by the notify cycle
+    notifications = build_notifications(["a", "b"], per_chat=3)
+
+    start_time = time.monotonic()
+    results = asyncio.run(dispatch_service.dispatch(notifications))
+    elapsed_seconds = time.monotonic() - start_time
+
+    assert [result.status for result in results] == ["sent"] * 6
+    assert {chat_id for chat_id, _, _ in notification_service.sends[:2]} == {"a", "b"}
+    # both chats are sent to at the same time, 2 intervals of 200ms instead of 5 if sent one chat after the other
+    assert elapsed_seconds < 0.8
+
+
+def test_dispatch_keeps_chat_order_and_rate():
+    notification_service = FakeNotificationService()
+    dispatch_service = DispatchService(
+        notification_service=notification_service, workers=4, global_rate=1_000, per_chat_rate=20
+    )
+    notifications = build_notifications(["a", "b", "c"], per_chat=4)
+
+    asyncio.run(dispatch_service.dispatch(notifications))
+
+    for chat_id in ["a", "b", "c"]:
+        chat_sends = [
+            (message, sent_at)
+            for sent_chat_id, message, sent_at in notification_service.sends
+            if sent_chat_id == chat_id
+        ]
+        assert [message for message, _ in chat_sends] == [f"{chat_id}-{index}" for index in range(4)]
+        intervals = [later[1] - earlier[1] for earlier, later in zip(chat_sends, chat_sends[1:])]
+        assert min(intervals) >= 0.045
+
+
+def test_dispatch_returns_results_in_order():
+    notification_service = FakeNotificationService(errors={"b-0": [Forbidden("bot was blocked by the user")]})
+    dispatch_service = DispatchService(notification_service=notification_service, workers=2, global_rate=1_000)
+    notifications = build_notifications(["a", "b"], per_chat=1)
+
+    results = asyncio.run(dispatch_service.dispatch(notifications))
+
+    assert [(result.reference, result.status, result.retryable) for result in results] == [
+        ("a-0", "sent", False),
+        ("b-0", "failed", False),
+    ]
+    assert results[1].attempts == 1
+
+
+def test_dispatch_retries_temporary_errors():
+    notification_service = FakeNotificationService(
+        errors={"a-0": [NetworkError("connection reset")], "b-0": [RetryAfter(retry_after=0.05)]}
+    )
+    dispatch_service = DispatchService(notification_service=notification_service, workers=2, global_rate=1_000)
+    notifications = build_notifications(["a", "b"], per_chat=1)
+
+    results = asyncio.run(dispatch_service.dispatch(notifications))
+
+    assert [(result.status, result.attempts) for result in results] == [("sent", 2), ("sent", 2)]
+
+
+def test_dispatch_gives_up_after_max_retries():
+    notification_service = FakeNotificationService(errors={"a-0": [NetworkError("connection reset")] * 5})
+    dispatch_service = DispatchService(
+        notification_service=notification_service, workers=2, global_rate=1_000, per_chat_rate=100, max_retries=2
+    )
+    notifications = build_notifications(["a"], per_chat=2)
+
+    results = asyncio.run(dispatch_service.dispatch(notifications))
+
+    assert (results[0].status, results[0].retryable, results[0].attempts) == ("failed", True, 3)
+    # the next notification of the chat is still sent
+    assert results[1].status == "sent"
+
+
+def test_dispatch_waits_out_rate_limits_beyond_max_retries():
+    notification_service = FakeNotificationService(
+        errors={"a-0": [RetryAfter(retry_after=0.01)] * 3 + [NetworkError("connection reset")]}
+    )
+    dispatch_service = DispatchService(
+        notification_service=notification_service, workers=2, global_rate=1_000, per_chat_rate=100, max_retries=1
+    )
+    notifications = build_notifications(["a"], per_chat=1)
+
+    results = asyncio.run(dispatch_service.dispatch(notifications))
+
+    assert (results[0].status, results[0].attempts, results[0].rate_limited_attempts) == ("sent", 5, 3)
+
+
+def test_dispatch_without_notifications():
+    dispatch_service = DispatchService(notification_service=FakeNotificationService())
+
+    assert asyncio.run(dispatch_service.dispatch([])) == []
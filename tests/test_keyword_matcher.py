@@ -0,0 +1,35 @@
+from utils.keyword_matcher import KeywordMatcher, compile_keyword
+
+
+def test_compile_keyword():
+    assert compile_keyword("Ice Cream") == (frozenset({"ice", "cream"}), None)
+    assert compile_keyword('"Ice Cream"') == (frozenset({"ice", "cream"}), ("ice", "cream"))
+    assert compile_keyword("“1-for-1”") == (frozenset({"1", "for"}), ("1", "for", "1"))
+    # a phrase of a single term matches like the term
+    assert compile_keyword('"cream"') == (frozenset({"cream"}), None)
+
+
+def test_match_terms_in_any_order():
+    matcher = KeywordMatcher()
+    matcher.update_subscription("subscription", theme="food", keywords=["ice cream"])
+
+    assert matcher.match("Cream on ice", themes=["food"]) == ["subscription"]
+    assert matcher.match("Ice only", themes=["food"]) == []
+    assert matcher.match("Cream on ice", themes=["travel"]) == []
+
+
+def test_match_phrase_in_order_and_adjacent():
+    matcher = KeywordMatcher()
+    matcher.sync({"phrase": ("food", ['"ice cream"']), "terms": ("food", ["ice cream"])})
+
+    assert matcher.match("The best ice cream in town", themes=["food"]) == ["phrase", "terms"]
+    assert matcher.match("Cream on ice", themes=["food"]) == ["terms"]
+    assert matcher.match("Ice and cream", themes=["food"]) == ["terms"]
+
+
+def test_match_phrase_with_repeated_terms():
+    matcher = KeywordMatcher()
+    matcher.update_subscription("subscription", theme="deals", keywords=['"1-for-1"'])
+
+    assert matcher.match("Deals: 1 for 2, then 1-for-1 drinks", themes=["deals"]) == ["subscription"]
+    assert matcher.match("1 for 2 for 1", themes=["deals"]) == []
@@ -0,0 +1,44 @@
+from services.subscriber_service import SubscriberService, subscriber_cache
+from utils.lru_cache import CACHE_MISS
+
+
+class FakeDatabaseClient:
+    """returns the stored documents by id, raising the queued errors first"""
+
+    def __init__(self, documents=None, errors=None):
+        self.documents = documents or {}
+        self.errors = errors or []
+        self.get_calls = 0
+
+    def get(self, index_name: str, document_id: str):
+        self.get_calls += 1
+        if len(self.errors) > 0:
+            raise self.errors.pop(0)
+
+        document = self.documents.get(document_id)
+        return None if document is None else {**document, "id": document_id}
+
+
+def test_get_subscriber_caches_missing_subscriber():
+    database_client = FakeDatabaseClient()
+    subscriber_service = SubscriberService(database_client=database_client)
+    subscriber_cache.invalidate("missing")
+
+    assert subscriber_service.get_subscriber("missing") is None
+    assert subscriber_service.get_subscriber("missing") is None
+    assert database_client.get_calls == 1
+
+
+def test_get_subscriber_does_not_cache_errors():
+    database_client = FakeDatabaseClient(
+        documents={"transient": {"is_subscribed": True, "subscribed_themes": []}},
+        errors=[ConnectionError("connection reset")],
+    )
+    subscriber_service = SubscriberService(database_client=database_client)
+    subscriber_cache.invalidate("transient")
+
+    assert subscriber_service.get_subscriber("transient") is None
+    assert subscriber_cache.get("transient") is CACHE_MISS
+    # the next call reads the subscriber again
+    assert subscriber_service.get_subscriber("transient")["is_subscribed"] is True
+    assert database_client.get_calls == 2
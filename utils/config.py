@@ -0,0 +1,14 @@
+from functools import lru_cache
+
+import dotenv
+
+
+@lru_cache(maxsize=None)
+def load_config() -> bool:
+    """
+    loads the variables of the .env file into the environment, once per process.
+    Variables already set in the environment are kept. Modules call this before reading their ENV_ variables
+
+    Returns True if a .env file was found
+    """
+    return dotenv.load_dotenv()
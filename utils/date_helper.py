@@ -1,15 +1,33 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import List
 
 
+def parse_iso_datetime(iso_datetime: str) -> datetime:
+    # datetime.fromisoformat does not accept the "Z" UTC designator before python 3.11
+    if iso_datetime.endswith("Z"):
+        iso_datetime = iso_datetime[:-1]
+        if "+" not in iso_datetime[10:]:
+            iso_datetime = iso_datetime + "+00:00"
+
+    date = datetime.fromisoformat(iso_datetime)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return date
+
+
 def get_latest_iso_datetime(iso_datetime_list: List[str]):
     latest_date = None
     for date_str in iso_datetime_list:
-        date = datetime.fromisoformat(date_str)
+        date = parse_iso_datetime(date_str)
         if latest_date is None or date > latest_date:
             latest_date = date
 
-    return latest_date.isoformat() + "Z" if latest_date else None
+    if latest_date is None:
+        return None
+
+    # normalise to UTC, isoformat of an aware datetime already carries the "+00:00" offset
+    return latest_date.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
 
 
 def get_current_iso_datetime():
@@ -33,3 +51,16 @@ def get_today_iso_date():
     iso_utc_midnight = midnight.isoformat(timespec="seconds") + "Z"
 
     return iso_utc_midnight
+
+
+def add_months(date: datetime, months: int) -> datetime:
+    """returns the date months later, on the first day of the month at 0000hrs"""
+    month_index = date.year * 12 + date.month - 1 + months
+    return date.replace(
+        year=month_index // 12, month=month_index % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def to_iso_datetime(date: datetime) -> str:
+    """formats a datetime in ISO UTC format with millisecond precision, the precision of database dates"""
+    return date.astimezone(timezone.utc).replace(tzinfo=None).isoformat(timespec="milliseconds") + "Z"
@@ -0,0 +1,150 @@
+import hashlib
+import re
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+URL_PATTERN = re.compile(r"https?://\S+|t\.me/\S+")  # matched on lowercased text
+WORD_PATTERN = re.compile(r"\w+")
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 1  # number of consecutive words hashed together, cross-posts often reorder or add short phrases
+MIN_SIMHASH_WORDS = 8  # shorter texts share too many shingles by chance, only exact duplicates are detected
+
+
+def normalize_text(text: Optional[str]) -> List[str]:
+    """
+    Reduces a message to its lowercased words, so that cross-posts differing only in formatting,
+    emojis, punctuation or tracking links normalise to the same words
+    """
+    if not text:
+        return []
+
+    return WORD_PATTERN.findall(URL_PATTERN.sub(" ", text.lower()))
+
+
+def get_content_hash(words: List[str]) -> Optional[str]:
+    """exact fingerprint of the normalised words"""
+    if len(words) == 0:
+        return None
+
+    return hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+
+
+def get_simhash(words: List[str]) -> Optional[int]:
+    """
+    64 bit SimHash of the word shingles. Texts sharing most of their shingles have SimHashes
+    differing in a few bits only
+    """
+    if len(words) < MIN_SIMHASH_WORDS:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for start in range(len(words) - SHINGLE_SIZE + 1):
+        shingle = " ".join(words[start : start + SHINGLE_SIZE])
+        shingle_hash = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if shingle_hash >> bit & 1 else -1
+
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def get_hamming_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+class NearDuplicateIndex:
+    """
+    Finds earlier messages with the same content within a sliding time window.
+
+    Exact duplicates are found by content hash. Near duplicates are found by SimHash: the 64 bits are split into
+    bands, and two SimHashes within max_distance bits of each other are guaranteed to share at least one band
+    when there are more bands than max_distance. Only messages sharing a band are compared.
+
+    A message is only a duplicate of an earlier message having all of its themes, so that cross-posts
+    in channels of other themes still reach the subscribers of those themes
+    """
+
+    def __init__(self, window: timedelta, max_distance: int = 6, bands: int = 8):
+        self.window = window
+        self.max_distance = max_distance
+        self.bands = bands
+        self.__band_bits = SIMHASH_BITS // bands
+        # (timestamp, message id, content hash, simhash) in insertion order, for expiry
+        self.__entries: Deque[Tuple[datetime, str, Optional[str], Optional[int]]] = deque()
+        self.__content_hashes: Dict[str, str] = {}  # content hash -> message id
+        self.__simhashes: Dict[str, int] = {}  # message id -> simhash
+        self.__themes: Dict[str, frozenset] = {}  # message id -> themes
+        self.__band_buckets: Dict[Tuple[int, int], Set[str]] = {}  # (band, band value) -> message ids
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __get_band_keys(self, simhash: int) -> List[Tuple[int, int]]:
+        mask = (1 << self.__band_bits) - 1
+        return [(band, simhash >> (band * self.__band_bits) & mask) for band in range(self.bands)]
+
+    def __expire(self, now: datetime):
+        while len(self.__entries) > 0 and self.__entries[0][0] < now - self.window:
+            _, message_id, content_hash, simhash = self.__entries.popleft()
+            del self.__themes[message_id]
+            if content_hash is not None and self.__content_hashes.get(content_hash) == message_id:
+                del self.__content_hashes[content_hash]
+
+            if simhash is not None:
+                del self.__simhashes[message_id]
+                for band_key in self.__get_band_keys(simhash):
+                    self.__band_buckets[band_key].discard(message_id)
+                    if len(self.__band_buckets[band_key]) == 0:
+                        del self.__band_buckets[band_key]
+
+    def find_duplicate(
+        self, content_hash: Optional[str], simhash: Optional[int], timestamp: datetime, themes: Iterable[str] = ()
+    ) -> Optional[str]:
+        """
+        Returns the id of an earlier message in the window with the same content and all the themes, or None
+        """
+        self.__expire(timestamp)
+        themes = frozenset(themes)
+
+        if content_hash is not None and content_hash in self.__content_hashes:
+            message_id = self.__content_hashes[content_hash]
+            if themes <= self.__themes[message_id]:
+                return message_id
+
+        if simhash is None:
+            return None
+
+        candidates = set()
+        for band_key in self.__get_band_keys(simhash):
+            candidates.update(self.__band_buckets.get(band_key, ()))
+
+        for message_id in sorted(candidates):
+            if (
+                get_hamming_distance(simhash, self.__simhashes[message_id]) <= self.max_distance
+                and themes <= self.__themes[message_id]
+            ):
+                return message_id
+
+        return None
+
+    def add(
+        self,
+        message_id: str,
+        content_hash: Optional[str],
+        simhash: Optional[int],
+        timestamp: datetime,
+        themes: Iterable[str] = (),
+    ):
+        """adds a canonical message to the index. Messages are expected in roughly chronological order"""
+        if message_id in self.__themes:
+            return
+
+        self.__entries.append((timestamp, message_id, content_hash, simhash))
+        self.__themes[message_id] = frozenset(themes)
+        if content_hash is not None and content_hash not in self.__content_hashes:
+            self.__content_hashes[content_hash] = message_id
+
+        if simhash is not None:
+            self.__simhashes[message_id] = simhash
+            for band_key in self.__get_band_keys(simhash):
+                self.__band_buckets.setdefault(band_key, set()).add(message_id)
@@ -0,0 +1,154 @@
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# approximates the "standard" tokenizer: words may be joined by apostrophes or periods, e.g. "don't", "1.50"
+TOKEN_PATTERN = re.compile(r"\w+(?:['’.]\w+)*")
+APOSTROPHES = ("'", "’")
+PHRASE_QUOTES = ('"', "“", "”")
+# terms of a keyword, and their order if the keyword is a phrase
+CompiledKeyword = Tuple[FrozenSet[str], Optional[Tuple[str, ...]]]
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    Splits text into terms the same way as the standard_analyzer of the message index:
+    standard tokenizer, then the apostrophe filter (drops an apostrophe and everything after it), then lowercase
+    """
+    if not text:
+        return []
+
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        for apostrophe in APOSTROPHES:
+            token = token.split(apostrophe, 1)[0]
+        if token:
+            tokens.append(token.lower())
+
+    return tokens
+
+
+def compile_keyword(keyword: str) -> CompiledKeyword:
+    """
+    A keyword matches a message when all of its terms appear in the message, in any order.
+    "ice cream" is equivalent to the query string "(ice AND cream)".
+    A keyword in double quotes matches its terms as a phrase instead, in order and next to each other,
+    the same as the match_phrase query of the search and percolator match modes
+    """
+    keyword = keyword.strip()
+    if len(keyword) > 1 and keyword[0] in PHRASE_QUOTES and keyword[-1] in PHRASE_QUOTES:
+        phrase = tuple(tokenize(keyword[1:-1]))
+        # a phrase of a single term matches like the term
+        return frozenset(phrase), phrase if len(phrase) > 1 else None
+
+    return frozenset(tokenize(keyword)), None
+
+
+def contains_phrase(tokens: List[str], phrase: Tuple[str, ...]) -> bool:
+    """True if the phrase terms appear in the tokens in order and next to each other"""
+    for position, token in enumerate(tokens):
+        if token == phrase[0] and tuple(tokens[position : position + len(phrase)]) == phrase:
+            return True
+
+    return False
+
+
+class KeywordMatcher:
+    """
+    Matches messages against the keywords of many subscriptions in a single pass over the message terms.
+
+    Every keyword is compiled to a group of terms, shared by all subscriptions of the same theme with that keyword
+    and indexed by one anchor term. A message is tokenized once, the anchor terms found in the message select the
+    candidate groups, and a candidate group matches when all of its terms are in the message,
+    and in the order of the phrase for a phrase keyword
+    """
+
+    def __init__(self):
+        # (theme, compiled keyword) -> subscription ids having the keyword
+        self.__groups: Dict[Tuple[str, CompiledKeyword], Set[str]] = {}
+        # anchor term -> (theme, compiled keyword) groups
+        self.__anchors: Dict[str, Set[Tuple[str, CompiledKeyword]]] = {}
+        # subscription id -> (theme, keywords, groups)
+        self.__subscriptions: Dict[str, Tuple[str, Tuple[str, ...], List[Tuple[str, CompiledKeyword]]]] = {}
+
+    def __len__(self):
+        return len(self.__subscriptions)
+
+    def __get_anchor(self, terms: FrozenSet[str]) -> str:
+        return max(sorted(terms), key=len)  # longer terms tend to be rarer, fewer candidates to verify
+
+    def update_subscription(self, subscription_id: str, theme: str, keywords: Iterable[str]):
+        """
+        Sets the keywords of a subscription, replacing its previous keywords.
+        Unchanged subscriptions are not recompiled
+        """
+        keywords = tuple(keywords)
+        existing_subscription = self.__subscriptions.get(subscription_id)
+        if existing_subscription is not None and existing_subscription[:2] == (theme, keywords):
+            return
+
+        self.remove_subscription(subscription_id)
+
+        group_keys = []
+        for compiled_keyword in set(compile_keyword(keyword) for keyword in keywords):
+            terms = compiled_keyword[0]
+            if len(terms) == 0:
+                continue
+
+            group_key = (theme, compiled_keyword)
+            if group_key not in self.__groups:
+                self.__groups[group_key] = set()
+                self.__anchors.setdefault(self.__get_anchor(terms), set()).add(group_key)
+            self.__groups[group_key].add(subscription_id)
+            group_keys.append(group_key)
+
+        self.__subscriptions[subscription_id] = (theme, keywords, group_keys)
+
+    def remove_subscription(self, subscription_id: str):
+        existing_subscription = self.__subscriptions.pop(subscription_id, None)
+        if existing_subscription is None:
+            return
+
+        for group_key in existing_subscription[2]:
+            subscription_ids = self.__groups[group_key]
+            subscription_ids.discard(subscription_id)
+            if len(subscription_ids) > 0:
+                continue
+
+            # no subscription has this keyword anymore
+            del self.__groups[group_key]
+            anchor = self.__get_anchor(group_key[1][0])
+            self.__anchors[anchor].discard(group_key)
+            if len(self.__anchors[anchor]) == 0:
+                del self.__anchors[anchor]
+
+    def sync(self, subscriptions: Dict[str, Tuple[str, List[str]]]):
+        """
+        Incrementally updates the matcher to the given subscriptions, a dict of subscription id -> (theme, keywords).
+        Only added, changed and removed subscriptions are recompiled
+        """
+        for subscription_id in list(self.__subscriptions.keys()):
+            if subscription_id not in subscriptions:
+                self.remove_subscription(subscription_id)
+
+        for subscription_id, (theme, keywords) in subscriptions.items():
+            self.update_subscription(subscription_id=subscription_id, theme=theme, keywords=keywords)
+
+    def match(self, text: Optional[str], themes: Iterable[str]) -> List[str]:
+        """
+        Returns the sorted ids of the subscriptions whose theme is in themes and have a keyword matching the text
+        """
+        tokens = tokenize(text)
+        terms = set(tokens)
+        themes = set(themes)
+        matched_subscriptions = set()
+
+        for term in terms:
+            for group_key in self.__anchors.get(term, ()):
+                theme, (group_terms, phrase) = group_key
+                if theme not in themes or not group_terms <= terms:
+                    continue
+                if phrase is not None and not contains_phrase(tokens, phrase):
+                    continue
+                matched_subscriptions.update(self.__groups[group_key])
+
+        return sorted(matched_subscriptions)
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+CACHE_MISS = object()  # returned by get when the key is not cached, since None may be a cached value
+
+
+class TTLLRUCache:
+    """
+    Size-bounded cache with a time to live. Entries expire ttl_seconds after they are set,
+    and the least recently used entry is evicted when the cache is full
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.__entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expiry time, value)
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key: Hashable) -> Any:
+        """returns the cached value of the key, or CACHE_MISS if it is not cached or expired"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.__entries[key]
+                self.misses += 1
+                return CACHE_MISS
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, key: Hashable) -> Any:
+        """like get, without counting the lookup in the stats or refreshing the recency of the key"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return CACHE_MISS
+
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.__entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups > 0 else 0,
+        }